@@ -57,6 +57,7 @@ from pydantic import BaseModel, Field, condecimal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, func, text
 
+from .cache import TTLCache
 from .database import get_session
 from .config import get_settings
 from .models import (
@@ -67,7 +68,9 @@ from .models import (
     Lottery,
     TonEventLog,
     AdminNFTWhitelist,
+    AdminPerm,
 )
+from .schemas import AdminNFTCreate, AdminNFTResponse
 from .efhc_transactions import (
     BANK_TELEGRAM_ID,             # 362746228 — ID Банка EFHC
     mint_efhc,                    # минт EFHC → Банк
@@ -77,6 +80,8 @@ from .efhc_transactions import (
     credit_bonus_user_from_bank,  # начисление bonus_EFHC (Банк → user)
     debit_bonus_user_to_bank,     # списание bonus_EFHC (user → Банк)
 )
+from .user_routes import invalidate_active_tasks_cache
+from .utils import normalize_ton_address
 
 # -----------------------------------------------------------------------------
 # Инициализация
@@ -84,6 +89,10 @@ from .efhc_transactions import (
 settings = get_settings()
 router = APIRouter()
 
+# Whitelist admin-NFT читается на каждой админской проверке, меняется редко (ручки add/delete ниже
+# сбрасывают кэш; другие воркеры увидят изменения не позже чем через TTL).
+_NFT_WHITELIST_CACHE = TTLCache(maxsize=1, ttl=settings.DIMENSION_CACHE_TTL_SECONDS)
+
 # -----------------------------------------------------------------------------
 # Утилиты округления Decimal
 # -----------------------------------------------------------------------------
@@ -132,32 +141,52 @@ async def _fetch_account_nfts(owner: str) -> List[str]:
             addrs.append(addr)
     return addrs
 
-async def _is_admin_by_nft(db: AsyncSession, owner: Optional[str]) -> bool:
+async def _admin_nft_perms(db: AsyncSession, owner: Optional[str]) -> Optional[AdminPerm]:
     """
     Проверка admin-доступа через NFT whitelist:
-      • Если кошелёк `owner` обладает хотя бы одним NFT из efhc_admin.admin_nft_whitelist — доступ разрешён.
+      • Если кошелёк `owner` обладает хотя бы одним включённым NFT из admin_nft_whitelist — доступ разрешён.
+      • Права — OR масок permissions всех найденных NFT (AdminPerm).
+    Возвращает None, если кошелёк не NFT-админ.
     """
     if not owner:
-        return False
+        return None
 
-    q = await db.execute(select(AdminNFTWhitelist.nft_address))
-    whitelist = {row[0].strip() for row in q.all() if row[0]}
+    whitelist = _NFT_WHITELIST_CACHE.get("all")
+    if whitelist is None:
+        q = await db.execute(
+            select(AdminNFTWhitelist.nft_address, AdminNFTWhitelist.permissions)
+            .where(AdminNFTWhitelist.enabled.isnot(False))
+        )
+        # Ключ — normalize_ton_address: в whitelist адрес вводят в base64 (EQ…/UQ…), TonAPI отдаёт raw «0:hex»
+        whitelist: Dict[str, AdminPerm] = {}
+        for addr, mask in q.all():
+            norm = normalize_ton_address(addr)
+            if norm:
+                whitelist[norm] = whitelist.get(norm, AdminPerm(0)) | AdminPerm(mask or 0)
+        _NFT_WHITELIST_CACHE.set("all", whitelist)
     if not whitelist:
-        return False
+        return None
 
-    user_nfts = {addr.strip() for addr in (await _fetch_account_nfts(owner))}
-    return len(whitelist.intersection(user_nfts)) > 0
+    found = [whitelist[n] for n in map(normalize_ton_address, await _fetch_account_nfts(owner)) if n in whitelist]
+    if not found:
+        return None
+    perms = AdminPerm(0)
+    for p in found:
+        perms |= p
+    return perms
 
 async def require_admin(
     db: AsyncSession,
     x_telegram_id: Optional[str],
     x_wallet_address: Optional[str],
+    perm: Optional[AdminPerm] = None,
 ) -> Dict[str, Any]:
     """
     Проверка прав администратора:
-      • Супер-админ по settings.ADMIN_TELEGRAM_ID.
-      • Банк (ID = 362746228) — тоже админ.
-      • NFT-админ — если в кошельке `X-Wallet-Address` есть NFT из whitelist.
+      • Супер-админ по settings.ADMIN_TELEGRAM_ID — все права.
+      • Банк (ID = 362746228) — тоже админ, все права.
+      • NFT-админ — если в кошельке `X-Wallet-Address` есть NFT из whitelist; права раздела `perm`
+        проверяются по admin_nft_whitelist.permissions (AdminPerm.allows, ALL покрывает всё).
 
     В случае отсутствия прав — HTTP 403.
     """
@@ -168,15 +197,16 @@ async def require_admin(
 
     # Супер-админ по конфигурации
     if settings.ADMIN_TELEGRAM_ID and tg == int(settings.ADMIN_TELEGRAM_ID):
-        return {"is_admin": True, "by": "super"}
+        return {"is_admin": True, "by": "super", "perms": AdminPerm.ALL}
 
     # Банк — также имеет доступ
     if tg == BANK_TELEGRAM_ID:
-        return {"is_admin": True, "by": "bank"}
+        return {"is_admin": True, "by": "bank", "perms": AdminPerm.ALL}
 
-    # NFT-админ
-    if await _is_admin_by_nft(db, x_wallet_address):
-        return {"is_admin": True, "by": "nft"}
+    # NFT-админ: доступ к разделу — только с соответствующим битом
+    perms = await _admin_nft_perms(db, x_wallet_address)
+    if perms is not None and (perm is None or perms.allows(perm)):
+        return {"is_admin": True, "by": "nft", "perms": perms}
 
     raise HTTPException(status_code=403, detail="Недостаточно прав")
 
@@ -193,13 +223,6 @@ class WhoAmIResponse(BaseModel):
     vip_nft_collection: Optional[str] = None
     whitelist_count: int = 0
 
-class WhitelistAddRequest(BaseModel):
-    """
-    Запрос на добавление NFT в whitelist.
-    """
-    nft_address: str = Field(..., description="TON-адрес NFT (полный адрес токена)")
-    comment: Optional[str] = Field(None, description="Комментарий для админ-панели")
-
 class CreditRequest(BaseModel):
     """
     Ручное начисление средств пользователю:
@@ -351,7 +374,7 @@ async def admin_whoami(
 # -----------------------------------------------------------------------------
 # NFT Whitelist — список / добавление / удаление
 # -----------------------------------------------------------------------------
-@router.get("/admin/nft/whitelist")
+@router.get("/admin/nft/whitelist", response_model=List[AdminNFTResponse])
 async def admin_nft_whitelist_list(
     db: AsyncSession = Depends(get_session),
     x_telegram_id: Optional[str] = Header(None, alias="X-Telegram-Id"),
@@ -362,37 +385,36 @@ async def admin_nft_whitelist_list(
       • id — внутренний идентификатор,
       • nft_address — адрес NFT (TON),
       • comment — комментарий,
-      • created_at — дата добавления.
+      • can_* — права NFT-админа (из битовой маски permissions),
+      • enabled, created_at — статус и дата добавления.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.ALL)
     q = await db.execute(select(AdminNFTWhitelist).order_by(AdminNFTWhitelist.id.asc()))
-    return [
-        {
-            "id": r.id,
-            "nft_address": r.nft_address,
-            "comment": r.comment,
-            "created_at": r.created_at.isoformat()
-        }
-        for r in q.scalars().all()
-    ]
+    return [AdminNFTResponse.from_row(r) for r in q.scalars().all()]
 
 @router.post("/admin/nft/whitelist")
 async def admin_nft_whitelist_add(
-    payload: WhitelistAddRequest,
+    payload: AdminNFTCreate,
     db: AsyncSession = Depends(get_session),
     x_telegram_id: Optional[str] = Header(None, alias="X-Telegram-Id"),
     x_wallet_address: Optional[str] = Header(None, alias="X-Wallet-Address"),
 ):
     """
-    Добавляет NFT в whitelist (если ещё нет). Уникальность адреса контролируется на уровне БД.
+    Добавляет NFT в whitelist (если ещё нет) с правами из флагов can_* (→ permissions).
+    Уникальность адреса контролируется на уровне БД.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
-    db.add(AdminNFTWhitelist(nft_address=payload.nft_address.strip(), comment=payload.comment))
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.ALL)
+    db.add(AdminNFTWhitelist(
+        nft_address=payload.nft_address.strip(),
+        comment=payload.comment,
+        permissions=int(payload.perms()),
+    ))
     try:
         await db.commit()
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=400, detail=f"Не удалось добавить: {e}")
+    _NFT_WHITELIST_CACHE.clear()
     return {"ok": True}
 
 @router.delete("/admin/nft/whitelist/{item_id}")
@@ -405,13 +427,14 @@ async def admin_nft_whitelist_delete(
     """
     Удаляет NFT из whitelist по ID.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.ALL)
     q = await db.execute(select(AdminNFTWhitelist).where(AdminNFTWhitelist.id == item_id))
     row = q.scalar_one_or_none()
     if not row:
         raise HTTPException(status_code=404, detail="Элемент не найден")
     await db.delete(row)
     await db.commit()
+    _NFT_WHITELIST_CACHE.clear()
     return {"ok": True}
 
 # -----------------------------------------------------------------------------
@@ -435,7 +458,7 @@ async def admin_users_credit(
 
     Все операции EFHC/bonus_EFHC логируются в efhc_core.efhc_transfers_log.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.USERS)
 
     tg = int(payload.telegram_id)
 
@@ -462,8 +485,7 @@ async def admin_users_credit(
     # kWh — напрямую
     kwh_amt = d3(Decimal(payload.kwh or 0))
     if kwh_amt != 0:
-        q = await db.execute(select(Balance).where(Balance.telegram_id == tg))
-        bal: Optional[Balance] = q.scalar_one_or_none()
+        bal: Optional[Balance] = await db.get(Balance, tg)
         if not bal:
             raise HTTPException(status_code=500, detail="Баланс не найден")
         new_k = d3(Decimal(bal.kwh or 0) + kwh_amt)
@@ -472,8 +494,8 @@ async def admin_users_credit(
     await db.commit()
 
     # Возвращаем актуальные значения
-    q2 = await db.execute(select(Balance).where(Balance.telegram_id == tg))
-    bal2: Optional[Balance] = q2.scalar_one_or_none()
+    # populate_existing: строка менялась UPDATE-ом в обход identity map — перечитываем
+    bal2: Optional[Balance] = await db.get(Balance, tg, populate_existing=True)
     return {
         "ok": True,
         "telegram_id": tg,
@@ -497,7 +519,7 @@ async def admin_users_debit(
 
     Все EFHC/bonus_EFHC списания логируются в efhc_core.efhc_transfers_log.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.USERS)
 
     tg = int(payload.telegram_id)
 
@@ -514,8 +536,7 @@ async def admin_users_debit(
     # kWh — списываем напрямую
     kwh_amt = d3(Decimal(payload.kwh or 0))
     if kwh_amt != 0:
-        q = await db.execute(select(Balance).where(Balance.telegram_id == tg))
-        bal: Optional[Balance] = q.scalar_one_or_none()
+        bal: Optional[Balance] = await db.get(Balance, tg)
         if not bal:
             raise HTTPException(status_code=404, detail="Баланс не найден")
         cur_k = Decimal(bal.kwh or 0)
@@ -526,8 +547,8 @@ async def admin_users_debit(
 
     await db.commit()
 
-    q2 = await db.execute(select(Balance).where(Balance.telegram_id == tg))
-    bal2: Optional[Balance] = q2.scalar_one_or_none()
+    # populate_existing: строка менялась UPDATE-ом в обход identity map — перечитываем
+    bal2: Optional[Balance] = await db.get(Balance, tg, populate_existing=True)
     return {
         "ok": True,
         "telegram_id": tg,
@@ -549,7 +570,7 @@ async def admin_users_vip_set(
     """
     Установка/снятие VIP-флага. Генерация энергии (kWh) учитывает VIP как множитель 1.07.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.USERS)
     tg = int(payload.telegram_id)
 
     q = await db.execute(select(UserVIP).where(UserVIP.telegram_id == tg))
@@ -580,7 +601,7 @@ async def admin_tasks_list(
     """
     Список всех заданий с основными полями.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.TASKS)
     q = await db.execute(select(Task).order_by(Task.id.asc()))
     return [
         {
@@ -604,7 +625,7 @@ async def admin_tasks_create(
     """
     Создаёт новое задание. Награда фиксируется в поле reward_bonus_efhc (bonus_EFHC).
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.TASKS)
     t = Task(
         title=payload.title.strip(),
         url=payload.url,
@@ -614,6 +635,7 @@ async def admin_tasks_create(
     db.add(t)
     await db.commit()
     await db.refresh(t)
+    invalidate_active_tasks_cache()
     return {"ok": True, "id": t.id}
 
 @router.patch("/admin/tasks/{task_id}")
@@ -627,7 +649,7 @@ async def admin_tasks_patch(
     """
     Частичное обновление задания по ID.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.TASKS)
     q = await db.execute(select(Task).where(Task.id == task_id))
     t = q.scalar_one_or_none()
     if not t:
@@ -643,6 +665,7 @@ async def admin_tasks_patch(
         t.active = payload.active
 
     await db.commit()
+    invalidate_active_tasks_cache()
     return {"ok": True}
 
 # -----------------------------------------------------------------------------
@@ -657,7 +680,7 @@ async def admin_lotteries_list(
     """
     Список всех лотерей (с основными полями).
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.LOTTERIES)
     q = await db.execute(select(Lottery).order_by(Lottery.created_at.asc()))
     return [
         {
@@ -683,7 +706,7 @@ async def admin_lottery_create(
     """
     Создаёт новую лотерею (без розыгрыша). Розыгрыш/продажа билетов — в отдельном модуле.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.LOTTERIES)
     q = await db.execute(select(Lottery).where(Lottery.code == payload.code))
     if q.scalar_one_or_none():
         raise HTTPException(status_code=400, detail="Код лотереи уже используется")
@@ -710,7 +733,7 @@ async def admin_lottery_patch(
     """
     Частичное обновление лотереи по коду.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.LOTTERIES)
     q = await db.execute(select(Lottery).where(Lottery.code == code))
     l = q.scalar_one_or_none()
     if not l:
@@ -741,7 +764,7 @@ async def admin_ton_logs(
     """
     Возвращает последние N логов TonAPI-интеграции (efhc_core.ton_events_log).
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.SHOP)
     q = await db.execute(select(TonEventLog).order_by(TonEventLog.processed_at.desc()).limit(limit))
     return [
         {
@@ -775,7 +798,7 @@ async def api_admin_mint(
     Минт EFHC: добавляет EFHC на баланс Банка (telegram_id=362746228).
     Вся операция логируется (efhc_core.mint_burn_log).
     """
-    perm = await require_admin(db, x_telegram_id, x_wallet_address)
+    perm = await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.ALL)
     try:
         amount = d3(Decimal(payload.amount))
         await mint_efhc(db, admin_id=int(x_telegram_id), amount=amount, comment=payload.comment or "")
@@ -803,7 +826,7 @@ async def api_admin_burn(
     Бёрн EFHC: сжигает EFHC с баланса Банка.
     Логируется (efhc_core.mint_burn_log).
     """
-    perm = await require_admin(db, x_telegram_id, x_wallet_address)
+    perm = await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.ALL)
     try:
         amount = d3(Decimal(payload.amount))
         await burn_efhc(db, admin_id=int(x_telegram_id), amount=amount, comment=payload.comment or "")
@@ -829,7 +852,7 @@ async def api_admin_bank_balance(
     """
     Возвращает текущий баланс EFHC Банка (внутренний учётный счёт), ID=362746228.
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.ALL)
     q = await db.execute(
         text(f"SELECT efhc, bonus_efhc FROM {settings.DB_SCHEMA_CORE}.balances WHERE telegram_id = :bank"),
         {"bank": BANK_TELEGRAM_ID},
@@ -857,7 +880,7 @@ async def api_admin_tasks_award(
 
     ВНИМАНИЕ: bonus_EFHC расходуются ТОЛЬКО на панели (shop/panels).
     """
-    await require_admin(db, x_telegram_id, x_wallet_address)
+    await require_admin(db, x_telegram_id, x_wallet_address, AdminPerm.TASKS)
     await ensure_tasks_bonus_table(db)
 
     try:
@@ -874,7 +897,7 @@ async def api_admin_tasks_award(
             {
                 "admin_id": int(x_telegram_id),
                 "user_id": int(payload.user_id),
-                "amt": str(amt),
+                "amt": amt,
                 "reason": payload.reason or "task_bonus",
             },
         )
@@ -0,0 +1,55 @@
+# 📂 backend/app/cache.py — простой in-process TTL-кэш (без внешних зависимостей)
+# -----------------------------------------------------------------------------
+# Назначение:
+#   • Кэширование «медленно меняющихся» значений в памяти процесса/воркера
+#     (актуальные ставки генерации, справочники и т.п.), чтобы не ходить в БД
+#     на каждый вызов.
+#   • Каждый воркер держит свою копию; после записи админом кэш сбрасывается
+#     через clear() в этом процессе, остальные воркеры подхватят новое значение
+#     не позже чем через ttl секунд.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Мини-кэш «ключ → значение» со сроком жизни записей (ttl, секунды) и ограничением размера.
+    При переполнении вытесняется самая старая (раньше всех записанная) запись — O(1):
+    OrderedDict хранит ключи в порядке записи, перезапись переносит ключ в конец.
+    Не потокобезопасен — рассчитан на asyncio.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if key in self._data:
+            self._data.move_to_end(key)
+        elif len(self._data) >= self.maxsize:
+            self._data.popitem(last=False)
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
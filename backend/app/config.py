@@ -63,8 +63,15 @@ class Settings(BaseSettings):
     DB_SCHEMA_TASKS: str = "efhc_tasks"                # Задания (tasks)
 
     # Пулы соединений (SQLAlchemy async engine):
+    #   сумма (pool_size + max_overflow) * воркеры должна оставаться ниже max_connections Postgres;
+    #   на выделенной БД поднимайте через env (ориентир pool_size ≈ ядра_БД * 2 + диски).
     DB_POOL_SIZE: int = 10
     DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30                          # Ожидание свободного соединения из пула, сек
+    DB_POOL_RECYCLE: int = 3600                        # Пересоздавать соединения старше N сек (idle-таймауты PG/прокси)
+    DB_POOL_PRE_PING: bool = True                      # SELECT 1 при выдаче из пула; False — на выделенном PG (хватает DB_POOL_RECYCLE)
+    DB_QUERY_CACHE_SIZE: int = 1200                    # Кэш скомпилированных SQL-выражений (на engine)
+    DB_STATEMENT_CACHE_SIZE: int = 1024                # Prepared statements asyncpg на соединение (0 — выкл., для pgbouncer transaction mode)
 
     # Переменные для интеграции Vercel → Neon (оставлены для совместимости):
     EFHC_DB_NEXT_PUBLIC_STACK_PROJECT_ID: Optional[str] = None
@@ -147,10 +154,15 @@ class Settings(BaseSettings):
     PANEL_PRICE_EFHC: float = 100.0                    # Цена панели (EFHC)
     PANEL_LIFESPAN_DAYS: int = 180                     # Срок службы панели (дни)
     MAX_ACTIVE_PANELS_PER_USER: int = 1000             # Лимит панелей на пользователя
+    PANEL_MAX_COUNT: int = 1000                        # Максимум панелей за одну покупку (user_routes)
 
     DAILY_GEN_BASE_KWH: float = 0.598                  # Базовая суточная генерация
+    PANEL_DAILY_KWH: float = 0.598                     # Генерация 1 панели в сутки (kWh, user_routes)
     VIP_MULTIPLIER: float = 1.07                       # VIP бонус (строго +7%)
     DAILY_GEN_VIP_KWH: float = 0.64                    # Ориентир для фронта (≈ 0.598 * 1.07)
+    VIP_CACHE_TTL_SECONDS: int = 600                   # Кэш флага VIP в памяти воркера (флаг меняется редко)
+    NFT_CHECK_CONCURRENCY: int = 32                    # Параллельных запросов к NFT API при ежедневном обходе VIP
+    DIMENSION_CACHE_TTL_SECONDS: int = 30              # Справочники в памяти воркера: активные задания, whitelist admin-NFT
 
     LEVELS: List[Dict[str, str]] = [                   # Уровни прогресса (для рейтинга/доступов)
         {"idx": "1", "name": "Eco Initiate", "threshold_kwh": "0"},
@@ -181,6 +193,9 @@ class Settings(BaseSettings):
         1000: 100.0,
         10000: 1000.0,
     }
+    REFERRAL_FIRST_PANEL_SWEEP_MINUTES: int = 10       # Период пакетного начисления бонусов за первую панель рефералов
+    LEADERBOARD_REFRESH_MINUTES: int = 5               # Период REFRESH mv_leaderboard_kwh (рейтинг по kwh_total)
+    LEADERBOARD_TOP_LIMIT: int = 100                   # Максимум строк рейтинга в ответе /user/rating (≤ 1000 — размер mv_leaderboard_kwh)
 
     # -----------------------------------------------------------------
     # МАГАЗИН (Shop)
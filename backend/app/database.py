@@ -31,6 +31,7 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy import text
 
 from .config import get_settings
@@ -93,13 +94,33 @@ def get_engine() -> AsyncEngine:
     pool_size, max_overflow = _get_pool_sizes()
 
     # echo=False — чтобы не засорять логами. Для дебага SQL можно поставить True.
-    # pool_pre_ping=True — полезно при долгих простоях соединений.
+    # pool_pre_ping — лишний SELECT 1 на каждый checkout; нужен там, где сервер рвёт простаивающие
+    # соединения раньше pool_recycle (Neon/serverless). На выделенном PG — DB_POOL_PRE_PING=false.
+    # pool_recycle — соединение старше N сек закрывается при возврате (не ловим обрыв от idle-таймаутов);
+    # pool_timeout — сколько ждать свободное соединение, прежде чем поднять TimeoutError.
+    # insertmanyvalues_page_size — пакетные INSERT ... RETURNING (Identity PK) по 1000 строк за раунд-трип.
+    # query_cache_size — LRU скомпилированных выражений; SQL с параметрами (:tg, bindparam) попадает в
+    # один слот кэша, поэтому значения НЕ подставляем в текст запроса (только имена схем из настроек).
+    # poolclass=AsyncAdaptedQueuePool — явно: очередь пула на asyncio, checkout не блокирует event loop
+    # (синхронный QueuePool под asyncpg приводит к зависанию воркеров).
     _engine = create_async_engine(
         db_url,
         echo=False,
-        pool_pre_ping=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_pre_ping=get_settings().DB_POOL_PRE_PING,
         pool_size=pool_size,
         max_overflow=max_overflow,
+        pool_timeout=get_settings().DB_POOL_TIMEOUT,
+        pool_recycle=get_settings().DB_POOL_RECYCLE,
+        insertmanyvalues_page_size=1000,
+        query_cache_size=get_settings().DB_QUERY_CACHE_SIZE,
+        # Серверные prepared statements: повторяющиеся короткие запросы (банк, ставка, вставки в логи)
+        # после подготовки не проходят parse/plan. statement_cache_size — кэш самого asyncpg,
+        # prepared_statement_cache_size — кэш адаптера SQLAlchemy поверх него.
+        connect_args={
+            "statement_cache_size": get_settings().DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": get_settings().DB_STATEMENT_CACHE_SIZE,
+        },
         future=True,
     )
 
@@ -138,6 +159,20 @@ async def session_scope() -> AsyncGenerator[AsyncSession, None]:
         await session.close()
 
 
+def async_session_maker() -> AsyncSession:
+    """
+    Новая сессия для фоновых задач (scheduler.py):
+        async with async_session_maker() as db:
+            ...
+    Коммит/откат — на стороне вызывающего; сессия закрывается при выходе из блока.
+    """
+    if _SessionFactory is None:
+        get_engine()
+
+    assert _SessionFactory is not None, "Session factory not initialized"
+    return _SessionFactory()
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     """
     FastAPI-зависимость для инъекции сессии в эндпоинты/сервисы.
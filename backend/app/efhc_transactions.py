@@ -7,7 +7,7 @@
 2. Пользователи не могут "создавать" или "терять" EFHC вне банка:
    - Начисление EFHC пользователю = списание с банка.
    - Списание EFHC у пользователя = зачисление на банк.
-3. Для бонусных EFHC — отдельное поле balances.bonus.
+3. Для бонусных EFHC — отдельное поле balances.bonus_efhc.
    Эти монеты ограничены и могут тратиться только на панели.
 4. Все операции логируются в efhc_transfers_log:
    (from_id, to_id, amount, reason, created_at).
@@ -15,19 +15,46 @@
 """
 
 from decimal import Decimal, ROUND_DOWN
-from datetime import datetime
+from typing import Optional
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import insert
 
-from app.models import Balances, EFHCTransfersLog
-from app.config import settings
+from app.models import SCHEMA, Balance, INSERT_LOG_STMT
+from app.config import get_settings
+
+settings = get_settings()
 
 # 🔹 ID банка EFHC (счёт администратора)
-BANK_ID = 362746228
+BANK_ID = settings.BANK_TELEGRAM_ID
+BANK_TELEGRAM_ID = BANK_ID
 
 # 🔹 Константа для округления (3 знака после запятой)
 DECIMAL_PLACES = Decimal("0.001")
 
+# 🔹 Условные списания: одна строка balances, UPDATE только при достаточном остатке.
+#    0 строк → средств не хватает (или строки нет). Зачисления — Balance.apply_delta.
+_DEBIT_EFHC_SQL = text(f"""
+    UPDATE {SCHEMA}.balances
+       SET efhc = efhc - :amt, updated_at = now()
+     WHERE telegram_id = :tid AND efhc >= :amt
+    RETURNING efhc
+""")
+
+_DEBIT_BONUS_SQL = text(f"""
+    UPDATE {SCHEMA}.balances
+       SET bonus_efhc = bonus_efhc - :amt, updated_at = now()
+     WHERE telegram_id = :tid AND bonus_efhc >= :amt
+    RETURNING bonus_efhc
+""")
+
+# kWh → EFHC у пользователя одним UPDATE (kwh_total не трогаем)
+_EXCHANGE_KWH_SQL = text(f"""
+    UPDATE {SCHEMA}.balances
+       SET kwh = kwh - :amt, efhc = efhc + :amt, updated_at = now()
+     WHERE telegram_id = :tid AND kwh >= :amt
+    RETURNING efhc, kwh
+""")
+
 
 # ==============================
 # 🔹 Утилиты
@@ -43,9 +70,28 @@ def round_d3(value: Decimal) -> Decimal:
     return value.quantize(DECIMAL_PLACES, rounding=ROUND_DOWN)
 
 
-async def log_transfer(db: AsyncSession, from_id: int, to_id: int, amount: Decimal, reason: str):
+async def _debit(db: AsyncSession, sql, tid: int, amount: Decimal) -> bool:
+    """
+    Условное списание (_DEBIT_EFHC_SQL / _DEBIT_BONUS_SQL / _EXCHANGE_KWH_SQL).
+    Строка блокируется до конца транзакции — параллельные списания не уводят баланс в минус.
+    False — строки нет или средств не хватает.
+    """
+    res = await db.execute(sql, {"tid": tid, "amt": amount})
+    return res.first() is not None
+
+
+async def log_transfer(
+    db: AsyncSession,
+    from_id: int,
+    to_id: int,
+    amount: Decimal,
+    reason: str,
+    idempotency_key: Optional[str] = None,
+) -> Optional[int]:
     """
     Записываем любую транзакцию EFHC в журнал (efhc_transfers_log).
+    Тот же запрос, что и в transactions.log_transfer (INSERT_LOG_STMT): ключ занимается
+    в efhc_transfers_idem, ts проставляет сервер.
 
     Аргументы:
         db      — сессия БД
@@ -53,23 +99,31 @@ async def log_transfer(db: AsyncSession, from_id: int, to_id: int, amount: Decim
         to_id   — получатель (0 = "система")
         amount  — сумма EFHC (округляется до d3)
         reason  — причина (exchange, shop, withdraw, referral, bonus, mint, burn...)
+        idempotency_key — ключ повтора; занят → запись не создаётся, возвращается None
     """
-    stmt = insert(EFHCTransfersLog).values(
-        from_id=from_id,
-        to_id=to_id,
-        amount=round_d3(amount),
-        reason=reason,
-        created_at=datetime.utcnow()
+    res = await db.execute(
+        INSERT_LOG_STMT,
+        {
+            "from_id": from_id,
+            "to_id": to_id,
+            "amount": round_d3(amount),
+            "reason": reason,
+            "idempotency_key": idempotency_key,
+            "order_id": None,
+            "withdraw_id": None,
+            "meta": None,
+        },
     )
-    await db.execute(stmt)
+    log_id = res.scalar_one_or_none()
     await db.commit()
+    return log_id
 
 
 # ==============================
 # 🔹 Основные операции EFHC
 # ==============================
 
-async def credit_user_from_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str):
+async def credit_user_from_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str = "bank_credit"):
     """
     Начисление EFHC пользователю (списывается с банка).
     Используется для:
@@ -79,18 +133,15 @@ async def credit_user_from_bank(db: AsyncSession, user_id: int, amount: Decimal,
     """
     amount = round_d3(amount)
 
-    # Списываем у банка
-    bank = await db.get(Balances, BANK_ID)
-    bank.efhc -= amount
-
-    # Зачисляем пользователю
-    user = await db.get(Balances, user_id)
-    user.efhc += amount
+    # Списываем у банка (условный UPDATE), зачисляем пользователю (upsert-дельта)
+    if not await _debit(db, _DEBIT_EFHC_SQL, BANK_ID, amount):
+        raise ValueError("Недостаточно EFHC на счёте банка")
+    await Balance.apply_delta(db, user_id, d_efhc=amount)
 
     await log_transfer(db, BANK_ID, user_id, amount, reason)
 
 
-async def debit_user_to_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str):
+async def debit_user_to_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str = "bank_debit"):
     """
     Списание EFHC у пользователя (зачисляется на банк).
     Используется для:
@@ -100,13 +151,10 @@ async def debit_user_to_bank(db: AsyncSession, user_id: int, amount: Decimal, re
     """
     amount = round_d3(amount)
 
-    user = await db.get(Balances, user_id)
-    if user.efhc < amount:
+    if not await _debit(db, _DEBIT_EFHC_SQL, user_id, amount):
         raise ValueError("Недостаточно EFHC на счету пользователя")
-    user.efhc -= amount
 
-    bank = await db.get(Balances, BANK_ID)
-    bank.efhc += amount
+    await Balance.apply_delta(db, BANK_ID, d_efhc=amount)
 
     await log_transfer(db, user_id, BANK_ID, amount, reason)
 
@@ -115,7 +163,7 @@ async def debit_user_to_bank(db: AsyncSession, user_id: int, amount: Decimal, re
 # 🔹 Бонусные EFHC
 # ==============================
 
-async def credit_user_bonus_from_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str):
+async def credit_user_bonus_from_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str = "bank_credit"):
     """
     Начисление бонусных EFHC пользователю (из банка).
     Используется для:
@@ -124,16 +172,14 @@ async def credit_user_bonus_from_bank(db: AsyncSession, user_id: int, amount: De
     """
     amount = round_d3(amount)
 
-    bank = await db.get(Balances, BANK_ID)
-    bank.efhc -= amount
-
-    user = await db.get(Balances, user_id)
-    user.bonus += amount
+    if not await _debit(db, _DEBIT_EFHC_SQL, BANK_ID, amount):
+        raise ValueError("Недостаточно EFHC на счёте банка")
+    await Balance.apply_delta(db, user_id, d_bonus=amount)
 
     await log_transfer(db, BANK_ID, user_id, amount, f"{reason}_bonus")
 
 
-async def debit_user_bonus_to_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str):
+async def debit_user_bonus_to_bank(db: AsyncSession, user_id: int, amount: Decimal, reason: str = "bank_debit"):
     """
     Списание бонусных EFHC у пользователя (возврат в банк).
     Используется для:
@@ -141,13 +187,10 @@ async def debit_user_bonus_to_bank(db: AsyncSession, user_id: int, amount: Decim
     """
     amount = round_d3(amount)
 
-    user = await db.get(Balances, user_id)
-    if user.bonus < amount:
+    if not await _debit(db, _DEBIT_BONUS_SQL, user_id, amount):
         raise ValueError("Недостаточно бонусных EFHC")
-    user.bonus -= amount
 
-    bank = await db.get(Balances, BANK_ID)
-    bank.efhc += amount
+    await Balance.apply_delta(db, BANK_ID, d_efhc=amount)
 
     await log_transfer(db, user_id, BANK_ID, amount, f"{reason}_bonus")
 
@@ -160,22 +203,16 @@ async def exchange_kwh_to_efhc(db: AsyncSession, user_id: int, kwh_amount: Decim
     """
     Обмен kWh на EFHC (1:1).
     - kwh_total (общая генерация) НЕ уменьшается → влияет на рейтинг.
-    - kwh_available уменьшается.
+    - kwh (доступные) уменьшается.
     - EFHC начисляются пользователю (списываются с банка).
     """
     kwh_amount = round_d3(kwh_amount)
 
-    user = await db.get(Balances, user_id)
-    if user.kwh_available < kwh_amount:
+    # Проверка kWh и обмен — один условный UPDATE строки пользователя; EFHC списываются у банка
+    if not await _debit(db, _EXCHANGE_KWH_SQL, user_id, kwh_amount):
         raise ValueError("Недостаточно kWh для обмена")
-
-    # Списываем kWh
-    user.kwh_available -= kwh_amount
-
-    # EFHC: списание у банка → начисление пользователю
-    bank = await db.get(Balances, BANK_ID)
-    bank.efhc -= kwh_amount
-    user.efhc += kwh_amount
+    if not await _debit(db, _DEBIT_EFHC_SQL, BANK_ID, kwh_amount):
+        raise ValueError("Недостаточно EFHC на счёте банка")
 
     await log_transfer(db, BANK_ID, user_id, kwh_amount, "exchange_kwh_to_efhc")
 
@@ -194,8 +231,7 @@ async def mint_to_bank(db: AsyncSession, admin_id: int, amount: Decimal, comment
 
     amount = round_d3(amount)
 
-    bank = await db.get(Balances, BANK_ID)
-    bank.efhc += amount
+    await Balance.apply_delta(db, BANK_ID, d_efhc=amount)
 
     await log_transfer(db, 0, BANK_ID, amount, f"mint:{comment}")
 
@@ -210,10 +246,14 @@ async def burn_from_bank(db: AsyncSession, admin_id: int, amount: Decimal, comme
 
     amount = round_d3(amount)
 
-    bank = await db.get(Balances, BANK_ID)
-    if bank.efhc < amount:
+    if not await _debit(db, _DEBIT_EFHC_SQL, BANK_ID, amount):
         raise ValueError("Недостаточно EFHC на счёте банка для сжигания")
 
-    bank.efhc -= amount
-
     await log_transfer(db, BANK_ID, 0, amount, f"burn:{comment}")
+
+
+# Имена, под которыми операции импортируют роуты (admin_routes / shop_routes / withdraw_routes)
+credit_bonus_user_from_bank = credit_user_bonus_from_bank
+debit_bonus_user_to_bank = debit_user_bonus_to_bank
+mint_efhc = mint_to_bank
+burn_efhc = burn_from_bank
@@ -13,6 +13,9 @@
 #   • Генерация kWh — «ленивая»: в balances.last_generated_at запоминаем последний апдейт, при
 #     любом обращении считаем ∆t * (ставка/86400) * активные панели. Начинается сразу после покупки
 #     первой панели (в shop_routes мы ставим last_generated_at=NOW()).
+#     Обращения только на чтение (профиль, витрина) прирост НЕ записывают — показывают расчётное
+#     значение. В БД kWh фиксируются планировщиком одним set-based запросом
+#     (scheduler.run_daily_kwh_accrual), без UPDATE balances на каждый запрос.
 #   • Балансы:
 #       - balances.efhc — текущий EFHC (NUMERIC(30,8)).
 #       - balances.bonus_efhc — бонусные EFHC (NUMERIC(30,8)), тратятся ТОЛЬКО на панели.
@@ -37,8 +40,10 @@
 
 from __future__ import annotations
 
-from datetime import datetime, date
-from typing import Optional
+from datetime import datetime
+from enum import IntFlag
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import List, Optional, Tuple
 
 from sqlalchemy import (
     Column,
@@ -49,13 +54,23 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     ForeignKey,
+    Identity,
+    CheckConstraint,
     UniqueConstraint,
     Index,
     Numeric,
+    SmallInteger,
+    bindparam,
+    func,
+    select,
+    text,
 )
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects.postgresql import CITEXT, ENUM, JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import declarative_base, relationship
 
+from .cache import TTLCache
 from .config import get_settings
 
 # -----------------------------------------------------------------------------
@@ -67,6 +82,63 @@ Base = declarative_base()
 settings = get_settings()
 SCHEMA = getattr(settings, "DB_SCHEMA_CORE", "efhc_core")
 
+# Допустимые статусы заказов/заявок (в БД — нативные ENUM-типы PostgreSQL, 4 байта на значение)
+SHOP_ORDER_STATUSES = ("pending", "paid", "completed", "rejected", "canceled", "failed")
+WITHDRAW_STATUSES = ("pending", "approved", "rejected", "sent", "failed", "canceled")
+MANUAL_NFT_STATUSES = ("open", "processed", "canceled")
+# Малые справочные наборы строк — тоже ENUM
+SHOP_ORDER_TYPES = ("efhc", "vip", "nft")
+PAY_ASSETS = ("TON", "USDT", "EFHC")  # EFHC — позиции магазина с оплатой внутренним балансом
+REFERRAL_BONUS_TYPES = ("first_panel", "threshold")
+
+# Append-only журналы: сессия берёт значения identity-последовательности пачкой (CACHE),
+# а не nextval на каждую строку. Цена — «дыры» в id при переподключениях (для логов не важно).
+IDENTITY_CACHE = 200
+
+
+# -----------------------------------------------------------------------------
+# Фиксированная точка: Decimal ↔ BIGINT (значение × 10^scale)
+# -----------------------------------------------------------------------------
+def to_scaled(d: Decimal, scale: int = 8) -> int:
+    """Decimal → целое число минимальных единиц (×10^scale), банковское округление."""
+    return int((Decimal(d) * (Decimal(10) ** scale)).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def from_scaled(v: int, scale: int = 8) -> Decimal:
+    """Целое число минимальных единиц → Decimal с scale знаками."""
+    return Decimal(int(v)).scaleb(-scale)
+
+
+class ScaledDecimal(TypeDecorator):
+    """
+    Decimal в Python, BIGINT (×10^scale) в БД: 8 байт вместо variable-length NUMERIC,
+    SUM()/сравнения — целочисленная арифметика. Для scale=8 диапазон ±9.2·10^10.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def __init__(self, scale: int = 8):
+        super().__init__()
+        self.scale = scale
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_scaled(value, self.scale)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_scaled(value, self.scale)
+
+
+class CompactJSONB(TypeDecorator):
+    """
+    JSONB, в котором пустой контекст ({} / None) хранится как NULL: строка лога не тащит
+    лишний varlena-заголовок, а CHECK (meta <> '{}') гарантирует это на уровне БД.
+    """
+    impl = JSONB
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return value or None
+
 
 # =============================================================================
 # Пользователи и связанные сущности
@@ -77,24 +149,61 @@ class User(Base):
 
     ВАЖНО: мы используем Telegram ID как первичный ключ (PK). Это упрощает
     обращение во всех ручках (в проекте мы повсюду оперируем telegram_id).
+
+    active_referral_count — денормализованный счётчик активных рефералов (referrals.activated_at IS NOT NULL):
+      • активация (первая панель) — +1 в том же запросе, что ставит activated_at
+        (referral.mark_user_active_and_reward_referrer, ReferralBonusLog.award_first_panel_bonuses);
+      • вставка/удаление/смена inviter_id у уже активных — триггер на referrals (миграции 0017, 0037).
+    Проверка порогов — чтение/RETURNING колонки, а не count(*).
     """
     __tablename__ = "users"
     __table_args__ = (
+        # Кандидаты на пороговые бонусы (минимальный порог — 10 рефералов)
+        Index(
+            "ix_users_active_referral_count",
+            "active_referral_count",
+            postgresql_where=text("active_referral_count >= 10"),
+        ),
         {"schema": SCHEMA},
     )
 
+    # Порядок колонок — по выравниванию: 8-байтовые → 4-байтовые → varlena (без паддинга между ними)
     telegram_id = Column(BigInteger, primary_key=True)  # PK = Telegram ID
-    username = Column(String(64), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    active_referral_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    username = Column(CITEXT, nullable=True)  # регистронезависимое сравнение без LOWER()
     first_name = Column(String(128), nullable=True)
     last_name = Column(String(128), nullable=True)
     language_code = Column(String(10), nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
 
-    balance = relationship("Balance", back_populates="user", uselist=False)
-    panels = relationship("Panel", back_populates="user")
-    vip_status = relationship("VipStatus", back_populates="user", uselist=False)
-    wallets = relationship("TonWallet", back_populates="user")
+    # Неявные ленивые загрузки запрещены (raise_on_sql): связи подгружаются только явно в месте запроса —
+    # joinedload(User.balance) / selectinload(User.panels) и т.п. Случайный N+1 падает сразу, а не тормозит.
+    # Обратные связи (Balance.user, Panel.user, ...) — так же; many-to-one из identity map SQL не требует.
+    # balance: joinedload без innerjoin — у старых пользователей строки balances может не быть
+    # (см. services.core.get_balance).
+    # passive_deletes: дочерние строки удаляет БД (FK ON DELETE CASCADE) — session.delete(user) не грузит
+    # коллекции ради обнуления FK (с raise_on_sql такая загрузка упала бы).
+    balance = relationship("Balance", back_populates="user", uselist=False, lazy="raise_on_sql", passive_deletes=True)
+    panels = relationship("Panel", back_populates="user", lazy="raise_on_sql", passive_deletes=True)
+    vip_status = relationship("VipStatus", back_populates="user", uselist=False, lazy="raise_on_sql", passive_deletes=True)
+    wallets = relationship("TonWallet", back_populates="user", lazy="raise_on_sql", passive_deletes=True)
+
+    @classmethod
+    async def at_referral_thresholds(
+        cls, session: AsyncSession, thresholds: List[int]
+    ) -> List[Tuple[int, int]]:
+        """
+        Пользователи, у которых счётчик рефералов ровно на одном из порогов (10/100/1000/…):
+        [(telegram_id, active_referral_count), ...]. Индекс ix_users_active_referral_count.
+        """
+        if not thresholds:
+            return []
+        res = await session.execute(
+            select(cls.telegram_id, cls.active_referral_count)
+            .where(cls.active_referral_count.in_(thresholds))
+        )
+        return [(int(r[0]), int(r[1])) for r in res.all()]
 
 
 class TonWallet(Base):
@@ -109,14 +218,14 @@ class TonWallet(Base):
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
-    address = Column(Text, nullable=False)
+    address = Column(String(70), nullable=False)  # TON: ≤48 (base64url) / 66 (raw hex)
     current = Column(Boolean, nullable=False, default=True)
     verified = Column(Boolean, nullable=False, default=False)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
-    user = relationship("User", back_populates="wallets")
+    user = relationship("User", back_populates="wallets", lazy="raise_on_sql")
 
 
 class VipStatus(Base):
@@ -137,9 +246,9 @@ class VipStatus(Base):
     has_nft = Column(Boolean, nullable=False, default=False)         # True → VIP-ставка
     source = Column(String(32), nullable=False, default="nft_presence")  # для расширения (например, promo)
     since = Column(DateTime(timezone=True), nullable=True)           # когда впервые стал VIP
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
-    user = relationship("User", back_populates="vip_status")
+    user = relationship("User", back_populates="vip_status", lazy="raise_on_sql")
 
 
 class Balance(Base):
@@ -155,20 +264,80 @@ class Balance(Base):
            уходят на банк (как обычные EFHC).
       • kwh — доступные «игровые» kWh (8 знаков), растут «лениво» (lazy accrual).
       • last_generated_at — момент последней фиксации роста kWh для ленивой генерации.
+
+    Таблица секционирована HASH (telegram_id) на 16 секций (миграция 0027): записи разных
+    пользователей расходятся по разным heap/индексам, autovacuum идёт по секциям параллельно.
     """
     __tablename__ = "balances"
     __table_args__ = (
-        {"schema": SCHEMA},
+        CheckConstraint("efhc >= 0 AND bonus_efhc >= 0 AND kwh >= 0", name="ck_balances_nonneg"),
+        CheckConstraint("kwh_total >= 0", name="ck_balances_kwh_total_nonneg"),
+        # Рейтинг по живым данным (и пересчёт mv_leaderboard_kwh): ORDER BY kwh_total DESC, telegram_id
+        # — прямой проход по индексу; пользователи с нулём (новые) в индекс не попадают.
+        Index(
+            "ix_balances_kwh_total_desc",
+            text("kwh_total DESC"),
+            "telegram_id",
+            postgresql_where=text("kwh_total > 0"),
+        ),
+        {"schema": SCHEMA, "postgresql_partition_by": "HASH (telegram_id)"},
     )
 
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), primary_key=True)
     efhc = Column(Numeric(30, 8), nullable=False, default=0)
     bonus_efhc = Column(Numeric(30, 8), nullable=False, default=0)
     kwh = Column(Numeric(30, 8), nullable=False, default=0)
+    kwh_total = Column(Numeric(30, 8), nullable=False, default=0, server_default=text("0"))  # неубывающий итог (рейтинг)
     last_generated_at = Column(DateTime(timezone=True), nullable=True)
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
-
-    user = relationship("User", back_populates="balance")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    user = relationship("User", back_populates="balance", lazy="raise_on_sql")
+
+    @classmethod
+    async def apply_delta(
+        cls,
+        session: AsyncSession,
+        tid: int,
+        d_efhc: Decimal = Decimal("0"),
+        d_kwh: Decimal = Decimal("0"),
+        d_bonus: Decimal = Decimal("0"),
+    ) -> Tuple[Decimal, Decimal, Decimal]:
+        """
+        Атомарно прибавляет дельты к балансу пользователя одним запросом (upsert):
+          • если строки balances ещё нет — создаёт её со значениями дельт;
+          • иначе — efhc/kwh/bonus_efhc += дельты, updated_at = now().
+        Работает мимо unit-of-work ORM (без flush), параметры биндятся драйвером asyncpg.
+        Возвращает (efhc, kwh, bonus_efhc) после изменения.
+
+        Только для неотрицательных дельт (зачисления): PostgreSQL проверяет ck_balances_nonneg
+        по строке VALUES ещё до разрешения ON CONFLICT, так что отрицательная дельта падает
+        даже при достаточном балансе. Списания — условным UPDATE ... WHERE efhc >= :x RETURNING.
+
+        ВАЖНО: объект Balance, уже загруженный в эту сессию, не обновляется автоматически —
+        используйте возвращённые значения (или session.refresh()).
+        """
+        if d_efhc < 0 or d_kwh < 0 or d_bonus < 0:
+            raise ValueError("apply_delta: отрицательная дельта — используйте условное списание")
+        res = await session.execute(
+            BALANCE_APPLY_DELTA_STMT,
+            {"tid": tid, "e": d_efhc, "k": d_kwh, "b": d_bonus},
+        )
+        efhc, kwh, bonus_efhc = res.one()
+        return efhc, kwh, bonus_efhc
+
+
+# Upsert-дельта баланса, только зачисления (см. Balance.apply_delta; для синхронной Session — transactions._credit_balance).
+# Текст собирается один раз при импорте.
+BALANCE_APPLY_DELTA_STMT = text(f"""
+    INSERT INTO {SCHEMA}.balances AS b (telegram_id, efhc, kwh, bonus_efhc, updated_at)
+    VALUES (:tid, :e, :k, :b, now())
+    ON CONFLICT (telegram_id) DO UPDATE SET
+        efhc = b.efhc + EXCLUDED.efhc,
+        kwh = b.kwh + EXCLUDED.kwh,
+        bonus_efhc = b.bonus_efhc + EXCLUDED.bonus_efhc,
+        updated_at = now()
+    RETURNING efhc, kwh, bonus_efhc
+""")
 
 
 # =============================================================================
@@ -187,19 +356,59 @@ class Panel(Base):
     """
     __tablename__ = "panels"
     __table_args__ = (
-        Index("ix_panels_user_active", "telegram_id", "active"),
+        # Покрывающий (index-only) для выборок по пользователю: active/expires_at в ключе, id в INCLUDE
+        Index(
+            "ix_panels_user_active_exp",
+            "telegram_id", "active", "expires_at",
+            postgresql_include=["id"],
+        ),
+        # Ночное архивирование (Panel.archive_expired): WHERE active AND expires_at <= now()
+        Index("ix_panels_expiry_sweep", "expires_at", postgresql_where=text("active = true")),
+        # Подсчёт активных панелей для лимита 1000: WHERE telegram_id=? AND active AND expires_at > now()
+        Index(
+            "ix_panels_user_active_expires",
+            "telegram_id",
+            text("expires_at DESC"),
+            postgresql_where=text("active = true"),
+        ),
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
     active = Column(Boolean, nullable=False, default=True)
-    activated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    activated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     expires_at = Column(DateTime(timezone=True), nullable=False)  # = activated_at + 180 days (рассчитывается в коде)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
-
-    user = relationship("User", back_populates="panels")
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    user = relationship("User", back_populates="panels", lazy="raise_on_sql")
+
+    @classmethod
+    async def archive_expired(cls, session: AsyncSession) -> Tuple[int, List[int]]:
+        """
+        Переносит все истёкшие панели (active=TRUE, expires_at <= now()) в PanelArchive
+        одним SQL-выражением (DELETE ... RETURNING → INSERT ... SELECT) — без ORM-цикла по строкам.
+        Возвращает (количество заархивированных панелей, telegram_id затронутых владельцев) —
+        чтобы вызывающий мог сбросить производные per-user данные. Коммит — на стороне вызывающего.
+        """
+        row = (await session.execute(_PANEL_ARCHIVE_EXPIRED_SQL)).one()
+        return int(row[0] or 0), list(row[1] or [])
+
+
+# Архивация истёкших панелей (см. Panel.archive_expired).
+_PANEL_ARCHIVE_EXPIRED_SQL = text(f"""
+    WITH expired AS (
+        DELETE FROM {SCHEMA}.panels
+        WHERE active = TRUE AND expires_at <= now()
+        RETURNING telegram_id, activated_at, expires_at
+    ), moved AS (
+        INSERT INTO {SCHEMA}.panel_archive (telegram_id, activated_at, expired_at, archived_at)
+        SELECT telegram_id, activated_at, expires_at, now() FROM expired
+        RETURNING telegram_id
+    )
+    SELECT count(*), array_agg(DISTINCT telegram_id) FROM moved
+""")
 
 
 class PanelArchive(Base):
@@ -213,11 +422,11 @@ class PanelArchive(Base):
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False, cache=IDENTITY_CACHE), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="SET NULL"), nullable=True)
     activated_at = Column(DateTime(timezone=True), nullable=False)
     expired_at = Column(DateTime(timezone=True), nullable=False)
-    archived_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 
 # =============================================================================
@@ -237,24 +446,77 @@ class EFHCTransfersLog(Base):
           - 'airdrop_bonus'         — начисление бонусов (пример)
           - ...
       • idempotency_key — для защиты от двойной записи (опционально).
-      • meta — произвольный JSON (например, order_id, withdraw_id).
+      • order_id / withdraw_id / snapshot_kwh_before / snapshot_kwh_after — типизированные поля
+        для известных форм контекста (раньше лежали в meta; читаются без разбора JSONB и TOAST).
+      • meta — только действительно произвольный JSON.
+
+    Таблица секционирована по RANGE (ts) помесячно (миграция 0025): индексы активного месяца
+    остаются в кэше, старые месяцы отключаются DETACH. PK = (id, ts). Уникальность
+    idempotency_key — через EFHCTransfersIdem (уникальный индекс секционированной таблицы
+    обязан включать ts). Секции вперёд создаёт планировщик (ensure_efhc_log_partitions).
     """
     __tablename__ = "efhc_transfers_log"
     __table_args__ = (
         Index("ix_efhc_log_from_id", "from_id"),
         Index("ix_efhc_log_to_id", "to_id"),
-        UniqueConstraint("idempotency_key", name="uq_efhc_log_idem"),
-        {"schema": SCHEMA},
+        Index("ix_efhc_log_order_id", "order_id", postgresql_where=text("order_id IS NOT NULL")),
+        Index("ix_efhc_log_withdraw_id", "withdraw_id", postgresql_where=text("withdraw_id IS NOT NULL")),
+        # Append-only журнал, ts растёт монотонно → BRIN под диапазонные выборки (история/аналитика)
+        Index("ix_efhc_log_ts_brin", "ts", postgresql_using="brin", postgresql_with={"pages_per_range": 32}),
+        # Поиск по содержимому meta в админ-логах: meta @> '{"context": "panel"}'
+        Index(
+            "ix_efhc_log_meta_gin",
+            "meta",
+            postgresql_using="gin",
+            postgresql_ops={"meta": "jsonb_path_ops"},
+            postgresql_where=text("meta IS NOT NULL"),
+        ),
+        {"schema": SCHEMA, "postgresql_partition_by": "RANGE (ts)"},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False, cache=IDENTITY_CACHE), primary_key=True)
     from_id = Column(BigInteger, nullable=False)
     to_id = Column(BigInteger, nullable=False)
     amount = Column(Numeric(30, 8), nullable=False)
     reason = Column(String(64), nullable=False)
     idempotency_key = Column(String(128), nullable=True)
+    order_id = Column(BigInteger, nullable=True)
+    withdraw_id = Column(BigInteger, nullable=True)
+    snapshot_kwh_before = Column("snapshot_kwh_before_scaled", ScaledDecimal(8), nullable=True)
+    snapshot_kwh_after = Column("snapshot_kwh_after_scaled", ScaledDecimal(8), nullable=True)
     meta = Column(JSONB, nullable=True)
-    ts = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    # clock_timestamp(): время строки, а не начала транзакции → порядок ts совпадает с физическим (BRIN)
+    ts = Column(DateTime(timezone=True), primary_key=True, server_default=func.clock_timestamp())
+
+
+class EFHCTransfersIdem(Base):
+    """
+    Глобальный реестр ключей идемпотентности efhc_transfers_log (несекционированный),
+    по образцу ReferralBonusIdem. Ключ занимается тем же запросом, что пишет строку лога
+    (см. transactions.log_transfer).
+    """
+    __tablename__ = "efhc_transfers_idem"
+    __table_args__ = (
+        {"schema": SCHEMA},
+    )
+
+    idempotency_key = Column(String(128), primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+async def ensure_efhc_log_partitions(session: AsyncSession, months_ahead: int = 2) -> None:
+    """
+    Создаёт помесячные секции efhc_transfers_log на текущий и months_ahead следующих месяцев
+    через SQL-функцию ensure_efhc_transfers_log_partitions (миграции 0025/0043, idempotent);
+    строки месяца, уже попавшие в DEFAULT, переносятся в новую секцию.
+    Коммит — на стороне вызывающего.
+    """
+    await session.execute(_EFHC_LOG_PARTITIONS_SQL, {"ahead": months_ahead})
+
+
+_EFHC_LOG_PARTITIONS_SQL = text(f"""
+    SELECT {SCHEMA}.ensure_efhc_transfers_log_partitions(CAST(:ahead AS integer))
+""")
 
 
 # =============================================================================
@@ -274,28 +536,37 @@ class ShopOrder(Base):
     """
     __tablename__ = "shop_orders"
     __table_args__ = (
-        Index("ix_shop_orders_user", "telegram_id"),
+        # «Мои заказы в статусе X» — один проход по индексу; префикс telegram_id заменяет прежний ix_shop_orders_user
+        Index("ix_shop_orders_user_status", "telegram_id", "status"),
         Index("ix_shop_orders_status", "status"),
-        UniqueConstraint("idempotency_key", name="uq_shop_orders_idem"),
+        Index("uq_shop_orders_idem", "idempotency_key", unique=True, postgresql_where=text("idempotency_key IS NOT NULL")),
+        CheckConstraint(
+            "(efhc_amount IS NULL OR efhc_amount > 0) AND (pay_amount IS NULL OR pay_amount >= 0)",
+            name="ck_shop_orders_amounts",
+        ),
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
-    order_type = Column(String(16), nullable=False)                 # 'efhc', 'vip', 'nft'
+    order_type = Column(ENUM(*SHOP_ORDER_TYPES, name="shop_order_type", schema=SCHEMA), nullable=False)
     efhc_amount = Column(Numeric(30, 8), nullable=True)
-    pay_asset = Column(String(16), nullable=True)                   # 'TON'|'USDT'
+    pay_asset = Column(ENUM(*PAY_ASSETS, name="pay_asset", schema=SCHEMA), nullable=True)
     pay_amount = Column(Numeric(30, 8), nullable=True)
-    ton_address = Column(Text, nullable=True)
-    status = Column(String(16), nullable=False, default="pending")  # см. выше перечисление
+    ton_address = Column(String(70), nullable=True)
+    status = Column(
+        ENUM(*SHOP_ORDER_STATUSES, name="shop_order_status", schema=SCHEMA),
+        nullable=False,
+        default="pending",
+    )  # см. выше перечисление
     idempotency_key = Column(String(128), nullable=True)
     tx_hash = Column(Text, nullable=True)
     admin_id = Column(BigInteger, nullable=True)
     comment = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     paid_at = Column(DateTime(timezone=True), nullable=True)
     completed_at = Column(DateTime(timezone=True), nullable=True)
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 
 class ManualNFTRequest(Base):
@@ -307,16 +578,22 @@ class ManualNFTRequest(Base):
     __tablename__ = "manual_nft_requests"
     __table_args__ = (
         Index("ix_manual_nft_requests_user", "telegram_id"),
+        # Очередь админки: только незакрытые заявки (закрытые — основная масса — в индекс не попадают)
+        Index("ix_manual_nft_requests_open", "created_at", postgresql_where=text("status = 'open'")),
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
-    wallet_address = Column(Text, nullable=True)
+    wallet_address = Column(String(70), nullable=True)
     request_type = Column(String(32), nullable=False, default="vip_nft")
     order_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.shop_orders.id", ondelete="SET NULL"), nullable=True)
-    status = Column(String(16), nullable=False, default="open")  # 'open'|'processed'|'canceled'
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    status = Column(
+        ENUM(*MANUAL_NFT_STATUSES, name="manual_nft_status", schema=SCHEMA),
+        nullable=False,
+        default="open",
+    )
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 
 # =============================================================================
@@ -338,24 +615,31 @@ class WithdrawRequest(Base):
     __table_args__ = (
         Index("ix_withdrawals_user", "telegram_id"),
         Index("ix_withdrawals_status", "status"),
-        UniqueConstraint("idempotency_key", name="uq_withdrawals_idem"),
+        # Очередь на обработку: pending по времени создания (FIFO)
+        Index("ix_withdrawals_pending_created", "created_at", postgresql_where=text("status = 'pending'")),
+        Index("uq_withdrawals_idem", "idempotency_key", unique=True, postgresql_where=text("idempotency_key IS NOT NULL")),
+        CheckConstraint("amount_efhc > 0", name="ck_withdrawals_amount_pos"),
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
-    ton_address = Column(Text, nullable=False)
+    ton_address = Column(String(70), nullable=False)
     amount_efhc = Column(Numeric(30, 8), nullable=False)
     asset = Column(String(16), nullable=False, default="TON")  # 'TON'|'USDT' — способ реальной выплаты
-    status = Column(String(16), nullable=False, default="pending")
+    status = Column(
+        ENUM(*WITHDRAW_STATUSES, name="withdraw_status", schema=SCHEMA),
+        nullable=False,
+        default="pending",
+    )
     idempotency_key = Column(String(128), nullable=True)
     tx_hash = Column(Text, nullable=True)
     admin_id = Column(BigInteger, nullable=True)
     comment = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     approved_at = Column(DateTime(timezone=True), nullable=True)
     sent_at = Column(DateTime(timezone=True), nullable=True)
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 
 # =============================================================================
@@ -373,16 +657,16 @@ class KwhToEfhcExchangeLog(Base):
     __tablename__ = "kwh_to_efhc_exchange_log"
     __table_args__ = (
         Index("ix_exchange_user", "telegram_id"),
-        UniqueConstraint("idempotency_key", name="uq_kwh_to_efhc_idem"),
+        Index("uq_kwh_to_efhc_idem", "idempotency_key", unique=True, postgresql_where=text("idempotency_key IS NOT NULL")),
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False, cache=IDENTITY_CACHE), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
-    amount_kwh = Column(Numeric(30, 8), nullable=False)
-    amount_efhc = Column(Numeric(30, 8), nullable=False)
+    amount_kwh = Column("amount_kwh_scaled", ScaledDecimal(8), nullable=False)
+    amount_efhc = Column("amount_efhc_scaled", ScaledDecimal(8), nullable=False)
     idempotency_key = Column(String(128), nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 
 # =============================================================================
@@ -393,18 +677,72 @@ class Referral(Base):
     Реферальная связь: кто кого пригласил.
       • invitee_id — приглашённый (уникален; один приглашённый не может иметь 2-х инвайтеров).
       • inviter_id — пригласивший.
+      • activated_at — первая покупка панели приглашённым (реферал «активен»); NULL — ещё не активен.
     """
     __tablename__ = "referrals"
     __table_args__ = (
         UniqueConstraint("invitee_id", name="uq_referrals_invitee"),
-        Index("ix_referrals_inviter", "inviter_id"),
+        # Рефералы инвайтера по inviter_id (подсчёт, ON DELETE SET NULL при удалении пользователя) —
+        # index-only scan без обращения к heap
+        Index(
+            "ix_referrals_inviter_cover",
+            "inviter_id",
+            postgresql_include=["invitee_id"],
+            postgresql_where=text("inviter_id IS NOT NULL"),
+        ),
+        # Подсчёт активных рефералов инвайтера (пороговые бонусы) — index-only, без обращения к panels
+        Index(
+            "ix_referrals_inviter_activated",
+            "inviter_id",
+            postgresql_include=["invitee_id"],
+            postgresql_where=text("activated_at IS NOT NULL"),
+        ),
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
     inviter_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="SET NULL"), nullable=True)
     invitee_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    activated_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class LeaderboardKwhMV(Base):
+    """
+    Материализованное представление mv_leaderboard_kwh (только чтение) — рейтинг по kwh_total:
+      • rank — место (1 = лидер; при равенстве kwh_total выше меньший telegram_id);
+      • telegram_id, kwh_total — снимок balances на момент REFRESH.
+    Хранит только первые 1000 мест (миграция 0038) — REFRESH фиксированного размера.
+    Создаётся миграцией 0024 (пересоздаётся в 0027, 0038). Топ-K читается по уникальному индексу (rank) без сортировки
+    всей balances. Обновляется планировщиком (refresh()) раз в LEADERBOARD_REFRESH_MINUTES.
+    """
+    __tablename__ = "mv_leaderboard_kwh"
+    __table_args__ = (
+        {"schema": SCHEMA, "info": {"is_view": True}},
+    )
+
+    rank = Column(BigInteger, primary_key=True)
+    telegram_id = Column(BigInteger, nullable=False)
+    kwh_total = Column(Numeric(30, 8), nullable=False)
+
+    @classmethod
+    async def refresh(cls, session: AsyncSession) -> None:
+        """
+        REFRESH MATERIALIZED VIEW CONCURRENTLY (требует уникального индекса ux_mv_leaderboard_kwh_rank).
+        Коммит — на стороне вызывающего.
+        """
+        await session.execute(_LEADERBOARD_REFRESH_SQL)
+
+    @classmethod
+    async def top(cls, session: AsyncSession, limit: int = 100) -> List["LeaderboardKwhMV"]:
+        """Первые limit мест рейтинга (WHERE rank <= limit — диапазон по индексу)."""
+        res = await session.execute(
+            select(cls).where(cls.rank <= limit).order_by(cls.rank)
+        )
+        return list(res.scalars().all())
+
+
+_LEADERBOARD_REFRESH_SQL = text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {SCHEMA}.mv_leaderboard_kwh")
 
 
 class ReferralBonusLog(Base):
@@ -415,29 +753,202 @@ class ReferralBonusLog(Base):
           - 'threshold'   — бонусы за достижение порогов активных рефералов:
                            10 → 1 EFHC, 100 → 10 EFHC, 1000 → 100 EFHC, 3000 → 300 EFHC, 10000 → 1000 EFHC.
       • count_at_moment — численность активных рефералов на момент выдачи порогового бонуса.
-      • amount_bonus_efhc — NUMERIC(30,8), начисляется в bonus_efhc
-      • idempotency_key — защита от дублей.
+      • amount_bonus_efhc — BIGINT ×10^8 (ScaledDecimal, колонка amount_bonus_efhc_scaled), начисляется в bonus_efhc
+      • idempotency_key — защита от дублей (глобальная уникальность — через ReferralBonusIdem,
+        т.к. уникальный индекс секционированной таблицы обязан включать ключ секционирования).
+
+    Таблица секционирована по RANGE (created_at) помесячно (миграция 0014); секции на
+    следующие месяцы создаёт планировщик (ensure_ref_bonus_partitions). PK = (id, created_at).
     """
     __tablename__ = "referral_bonus_log"
     __table_args__ = (
         Index("ix_ref_bonus_user", "telegram_id"),
-        UniqueConstraint("idempotency_key", name="uq_ref_bonus_idem"),
-        {"schema": SCHEMA},
+        # Точечная проверка «такой ключ уже начислен?» (равенство) — hash-индекс меньше и быстрее btree
+        Index("ix_ref_bonus_idem_hash", "idempotency_key", postgresql_using="hash"),
+        # Аналитика по периодам поверх секций: BRIN по монотонному created_at
+        Index("ix_ref_bonus_created_brin", "created_at", postgresql_using="brin", postgresql_with={"pages_per_range": 32}),
+        CheckConstraint("meta IS NULL OR meta <> '{}'::jsonb", name="ck_ref_bonus_meta_not_empty"),
+        {"schema": SCHEMA, "postgresql_partition_by": "RANGE (created_at)"},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False, cache=IDENTITY_CACHE), primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey(f"{SCHEMA}.users.telegram_id", ondelete="CASCADE"), nullable=False)
-    bonus_type = Column(String(32), nullable=False)  # 'first_panel'|'threshold'
+    bonus_type = Column(ENUM(*REFERRAL_BONUS_TYPES, name="referral_bonus_type", schema=SCHEMA), nullable=False)
     count_at_moment = Column(Integer, nullable=True)
-    amount_bonus_efhc = Column(Numeric(30, 8), nullable=False)
-    meta = Column(JSONB, nullable=True)
+    amount_bonus_efhc = Column("amount_bonus_efhc_scaled", ScaledDecimal(8), nullable=False)
+    meta = Column(CompactJSONB, nullable=True)  # пустой {} → NULL
     idempotency_key = Column(String(128), nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.clock_timestamp())
+
+    @classmethod
+    async def award_first_panel_bonuses(cls, session: AsyncSession, amount: Decimal) -> int:
+        """
+        Начисляет одноразовый бонус 'first_panel' всем инвайтерам, чьи рефералы купили первую
+        панель и ещё не были вознаграждены — одним SQL (CTE), без цикла по пользователям:
+          новые рефералы → ключи 'fp:<invitee_id>' в referral_bonus_idem → строки лога →
+          users.active_referral_count += n → пороговые бонусы за каждый пройденный порог
+          REFERRAL_MILESTONES (old < порог <= new, ключ 'th:<inviter>:<порог>') →
+          balances.bonus_efhc += сумма по инвайтеру.
+        Возвращает число начисленных бонусов 'first_panel'. Коммит — на стороне вызывающего.
+        """
+        res = await session.execute(_REF_FIRST_PANEL_SQL, {
+            "amount_scaled": to_scaled(amount),
+            "ms": _MILESTONE_COUNTS,
+            "ms_scaled": _MILESTONE_SCALED,
+        })
+        return int(res.scalar_one() or 0)
+
+
+class ReferralBonusIdem(Base):
+    """
+    Глобальный реестр ключей идемпотентности реферальных бонусов (несекционированный).
+    Секционированный referral_bonus_log не может держать UNIQUE(idempotency_key) без created_at,
+    поэтому уникальность ключа обеспечивает PK этой таблицы.
+    """
+    __tablename__ = "referral_bonus_idem"
+    __table_args__ = (
+        {"schema": SCHEMA},
+    )
+
+    idempotency_key = Column(String(128), primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# Пороги REFERRAL_MILESTONES параллельными массивами (порог, бонус ×10^8) — собираются один раз.
+_MILESTONE_COUNTS = sorted(settings.REFERRAL_MILESTONES)
+_MILESTONE_SCALED = [to_scaled(Decimal(str(settings.REFERRAL_MILESTONES[m]))) for m in _MILESTONE_COUNTS]
+
+# Пакетное начисление 'first_panel' и пройденных порогов (см. ReferralBonusLog.award_first_panel_bonuses).
+_REF_FIRST_PANEL_SQL = text(f"""
+    WITH new AS (
+        SELECT r.inviter_id, r.invitee_id, 'fp:' || r.invitee_id AS idem
+          FROM {SCHEMA}.referrals r
+         WHERE r.inviter_id IS NOT NULL
+           AND EXISTS (SELECT 1 FROM {SCHEMA}.panels p WHERE p.telegram_id = r.invitee_id)
+           AND NOT EXISTS (
+               SELECT 1 FROM {SCHEMA}.referral_bonus_idem k WHERE k.idempotency_key = 'fp:' || r.invitee_id
+           )
+    ), keys AS (
+        INSERT INTO {SCHEMA}.referral_bonus_idem (idempotency_key)
+        SELECT idem FROM new
+        ON CONFLICT DO NOTHING
+        RETURNING idempotency_key
+    ), ins AS (
+        INSERT INTO {SCHEMA}.referral_bonus_log
+            (telegram_id, bonus_type, amount_bonus_efhc_scaled, idempotency_key, meta)
+        SELECT n.inviter_id, 'first_panel', :amount_scaled, n.idem,
+               jsonb_build_object('invitee_id', n.invitee_id)
+          FROM new n
+          JOIN keys k ON k.idempotency_key = n.idem
+        RETURNING telegram_id, amount_bonus_efhc_scaled
+    ), act AS (
+        UPDATE {SCHEMA}.referrals r
+           SET activated_at = now()
+          FROM new n
+         WHERE r.invitee_id = n.invitee_id AND r.activated_at IS NULL
+        RETURNING r.inviter_id
+    ), cnt AS (
+        UPDATE {SCHEMA}.users u
+           SET active_referral_count = u.active_referral_count + a.n
+          FROM (SELECT inviter_id, count(*)::int AS n FROM act GROUP BY inviter_id) a
+         WHERE u.telegram_id = a.inviter_id
+        RETURNING u.telegram_id, u.active_referral_count - a.n AS old_cnt, u.active_referral_count AS new_cnt
+    ), crossed AS (
+        -- Пачка может перешагнуть порог (9 → 11): платим за каждый порог в (old, new]
+        SELECT c.telegram_id, m.threshold, m.scaled, 'th:' || c.telegram_id || ':' || m.threshold AS idem
+          FROM cnt c
+          JOIN unnest(CAST(:ms AS integer[]), CAST(:ms_scaled AS bigint[])) AS m(threshold, scaled)
+            ON m.threshold BETWEEN c.old_cnt + 1 AND c.new_cnt
+    ), th_keys AS (
+        INSERT INTO {SCHEMA}.referral_bonus_idem (idempotency_key)
+        SELECT idem FROM crossed
+        ON CONFLICT DO NOTHING
+        RETURNING idempotency_key
+    ), th_ins AS (
+        INSERT INTO {SCHEMA}.referral_bonus_log
+            (telegram_id, bonus_type, count_at_moment, amount_bonus_efhc_scaled, idempotency_key, meta)
+        SELECT c.telegram_id, 'threshold', c.threshold, c.scaled, c.idem,
+               jsonb_build_object('threshold', c.threshold)
+          FROM crossed c
+          JOIN th_keys k ON k.idempotency_key = c.idem
+        RETURNING telegram_id, amount_bonus_efhc_scaled
+    ), per_user AS (
+        SELECT telegram_id, sum(amount_bonus_efhc_scaled) AS scaled
+          FROM (SELECT * FROM ins UNION ALL SELECT * FROM th_ins) b
+         GROUP BY telegram_id
+    ), upd AS (
+        INSERT INTO {SCHEMA}.balances AS b (telegram_id, bonus_efhc, updated_at)
+        SELECT telegram_id, scaled::numeric / 100000000, now() FROM per_user
+        ON CONFLICT (telegram_id) DO UPDATE SET
+            bonus_efhc = b.bonus_efhc + EXCLUDED.bonus_efhc,
+            updated_at = now()
+        RETURNING 1
+    )
+    SELECT count(*) FROM ins
+""")
+
+
+async def ensure_ref_bonus_partitions(session: AsyncSession, months_ahead: int = 2) -> None:
+    """
+    Создаёт помесячные секции referral_bonus_log на текущий и months_ahead следующих месяцев
+    через SQL-функцию ensure_referral_bonus_log_partitions (миграции 0014/0042, idempotent);
+    строки месяца, уже попавшие в DEFAULT, переносятся в новую секцию.
+    Коммит — на стороне вызывающего.
+    """
+    await session.execute(_REF_BONUS_PARTITIONS_SQL, {"ahead": months_ahead})
+
+
+_REF_BONUS_PARTITIONS_SQL = text(f"""
+    SELECT {SCHEMA}.ensure_referral_bonus_log_partitions(CAST(:ahead AS integer))
+""")
 
 
 # =============================================================================
-# Админ-конфигурации: банк и ставки генерации
+# Админ-конфигурации: права admin-NFT, банк и ставки генерации
 # =============================================================================
+class AdminPerm(IntFlag):
+    """
+    Права admin-NFT — битовая маска admin_nft_whitelist.permissions (SMALLINT, миграция 0031).
+    Проверка — одно чтение строки whitelist без JOIN: AdminPerm(row.permissions).allows(AdminPerm.SHOP).
+    """
+    SHOP = 1
+    TASKS = 2
+    LOTTERIES = 4
+    USERS = 8
+    WITHDRAWALS = 16
+    PANELS = 32
+    ALL = 64
+
+    def allows(self, perm: "AdminPerm") -> bool:
+        """True, если есть право perm (или ALL)."""
+        return bool(self & (perm | AdminPerm.ALL))
+
+
+class AdminNFTWhitelist(Base):
+    """
+    Whitelist admin-NFT: владелец NFT из списка получает админ-доступ с правами permissions.
+      • nft_address — колонка nft_url (миграция 0001).
+      • permissions — битовая маска AdminPerm (миграция 0031); 0 — доступ без прав на разделы.
+      • enabled = FALSE — NFT временно не даёт доступа (строка остаётся в списке).
+    """
+    __tablename__ = "admin_nft_whitelist"
+    __table_args__ = (
+        {"schema": SCHEMA},
+    )
+
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
+    nft_address = Column("nft_url", String(512), unique=True, nullable=True)
+    comment = Column(Text, nullable=True)
+    enabled = Column(Boolean, nullable=True, server_default=text("TRUE"))
+    permissions = Column(SmallInteger, nullable=False, default=0, server_default=text("0"))
+    created_at = Column(DateTime(timezone=True), nullable=True, server_default=func.now())
+
+    @property
+    def perms(self) -> AdminPerm:
+        """Права строки как AdminPerm."""
+        return AdminPerm(self.permissions or 0)
+
+
 class AdminBankConfig(Base):
     """
     Текущая конфигурация банк-счёта EFHC (админский Telegram ID), на который
@@ -446,15 +957,17 @@ class AdminBankConfig(Base):
 
     • Возможна миграция на новый Telegram ID — для этого меняется поле current_bank_telegram_id.
     • Историю изменений фиксируем в AdminBankHistory.
+    • Строго одна строка: id = 1 (CHECK), без последовательности.
     """
     __tablename__ = "admin_bank_config"
     __table_args__ = (
+        CheckConstraint("id = 1", name="admin_bank_config_singleton"),
         {"schema": SCHEMA},
     )
 
-    id = Column(Integer, primary_key=True, autoincrement=True)  # обычно 1 запись
+    id = Column(Integer, primary_key=True, autoincrement=False, default=1, server_default=text("1"))
     current_bank_telegram_id = Column(BigInteger, nullable=False)
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 
 class AdminBankHistory(Base):
@@ -467,11 +980,11 @@ class AdminBankHistory(Base):
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
     old_bank_telegram_id = Column(BigInteger, nullable=False)
     new_bank_telegram_id = Column(BigInteger, nullable=False)
     changed_by_admin = Column(BigInteger, nullable=True)  # кто изменил (админ)
-    changed_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    changed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 
 class AdminRateChange(Base):
@@ -486,16 +999,84 @@ class AdminRateChange(Base):
     """
     __tablename__ = "admin_rate_change"
     __table_args__ = (
-        Index("ix_rate_effective_from", "effective_from"),
+        # Append-only, монотонно растущий effective_from → BRIN (на порядки меньше btree, дешёвые вставки)
+        Index(
+            "ix_rate_effective_from_brin",
+            "effective_from",
+            postgresql_using="brin",
+            postgresql_with={"pages_per_range": 32},
+        ),
         {"schema": SCHEMA},
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    base_rate_kwh_per_day = Column(Numeric(12, 8), nullable=False)  # 0.59800000 по умолчанию
-    vip_rate_kwh_per_day = Column(Numeric(12, 8), nullable=False)   # 0.64000000 по умолчанию
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
+    base_rate_kwh_per_day = Column("base_rate_scaled", ScaledDecimal(8), nullable=False)  # 0.59800000 по умолчанию
+    vip_rate_kwh_per_day = Column("vip_rate_scaled", ScaledDecimal(8), nullable=False)    # 0.64000000 по умолчанию
     effective_from = Column(DateTime(timezone=True), nullable=False)
     changed_by_admin = Column(BigInteger, nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    @classmethod
+    async def get_active_rates(cls, session: AsyncSession) -> Optional[Tuple[Decimal, Decimal]]:
+        """
+        Актуальные ставки (base, vip) kWh/сутки на 1 панель — последняя запись с effective_from <= NOW().
+        Результат кэшируется в процессе (TTL 60 с, ключ — текущий час UTC), поэтому начисление по
+        всем пользователям делает не более одного запроса в минуту. None — если ставок в БД ещё нет.
+        После записи новой ставки вызывайте AdminRateChange.invalidate_cache().
+        """
+        key = datetime.utcnow().strftime("%Y%m%d%H")
+        cached = _ACTIVE_RATE_CACHE.get(key, _RATE_MISS)
+        if cached is not _RATE_MISS:
+            return cached
+        row = (await session.execute(_ACTIVE_RATE_STMT)).first()
+        rates = (row[0], row[1]) if row else None
+        _ACTIVE_RATE_CACHE.set(key, rates)
+        return rates
+
+    @classmethod
+    def invalidate_cache(cls) -> None:
+        """Сбрасывает кэш актуальных ставок (вызывать после INSERT в admin_rate_change)."""
+        _ACTIVE_RATE_CACHE.clear()
+
+
+# Кэш/запрос актуальной ставки (см. AdminRateChange.get_active_rates).
+_ACTIVE_RATE_CACHE = TTLCache(maxsize=8, ttl=60)
+_RATE_MISS = object()
+_ACTIVE_RATE_STMT = (
+    select(AdminRateChange.base_rate_kwh_per_day, AdminRateChange.vip_rate_kwh_per_day)
+    .where(AdminRateChange.effective_from <= func.now())
+    .order_by(AdminRateChange.effective_from.desc())
+    .limit(1)
+)
+
+
+# =============================================================================
+# Предсобранные выражения (строятся один раз при импорте)
+# =============================================================================
+# Горячие запросы собираем на уровне модуля: объект выражения и его кэш-ключ
+# создаются однократно, SQL компилируется при первом вызове и берётся из
+# compiled cache движка. Параметры — только через bindparam.
+GET_BALANCE_STMT = select(Balance).where(Balance.telegram_id == bindparam("tid"))
+GET_BALANCE_FOR_UPDATE_STMT = GET_BALANCE_STMT.with_for_update()
+
+# Запись в efhc_transfers_log (общая для transactions.py и efhc_transactions.py).
+# Лог секционирован (миграция 0025) → ключ занимаем в efhc_transfers_idem: ключ уже есть →
+# claim пуст → строка лога не вставляется, RETURNING пуст (повтор операции). ts — серверный
+# clock_timestamp(). Без ключа (:idempotency_key = NULL) строка вставляется всегда.
+INSERT_LOG_STMT = text(f"""
+    WITH claim AS (
+        INSERT INTO {SCHEMA}.efhc_transfers_idem (idempotency_key)
+        SELECT CAST(:idempotency_key AS varchar) WHERE CAST(:idempotency_key AS varchar) IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    INSERT INTO {SCHEMA}.efhc_transfers_log
+        (from_id, to_id, amount, reason, idempotency_key, order_id, withdraw_id, meta)
+    SELECT :from_id, :to_id, :amount, :reason, :idempotency_key, :order_id, :withdraw_id,
+           CAST(:meta AS jsonb)
+     WHERE CAST(:idempotency_key AS varchar) IS NULL OR EXISTS (SELECT 1 FROM claim)
+    RETURNING id
+""")
 
 
 # =============================================================================
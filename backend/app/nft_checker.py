@@ -10,13 +10,39 @@
 #
 # ⚠️ Сейчас это заглушка: используем requests к публичному API TON.
 # В будущем можно интегрировать TonCenter, TonAPI, GetGems.
+#
+# Single-flight: одновременные проверки одного кошелька ждут один запрос к API (_INFLIGHT),
+# а не шлют N одинаковых — защита от «табуна» после рестарта/около полуночи.
+#
+# Для ежедневного обхода (scheduler.run_nft_vip_check) — has_efhc_nft / batch_has_efhc_nft:
+# один httpx.AsyncClient с keep-alive на весь обход (TLS-рукопожатие один раз на соединение)
+# и не более NFT_CHECK_CONCURRENCY одновременных запросов (asyncio.Semaphore).
 # -----------------------------------------------------------------------------
 
-import aiohttp
+import asyncio
+import json
+from typing import Dict, Iterable, Optional
+
+import httpx
 from .config import get_settings
+from .utils import normalize_ton_address
 
 settings = get_settings()
 
+_INFLIGHT: Dict[str, "asyncio.Future[Optional[bool]]"] = {}
+# Адрес коллекции как байты: как есть и с экранированным «/» (допустимая форма в JSON)
+_COLLECTION_URL = settings.ADMIN_NFT_COLLECTION_URL or ""
+_COLLECTION_BYTES = (_COLLECTION_URL.encode(), _COLLECTION_URL.replace("/", "\\/").encode()) if _COLLECTION_URL else ()
+
+
+def _new_client() -> httpx.AsyncClient:
+    """HTTP-клиент NFT API: keep-alive пул на NFT_CHECK_CONCURRENCY соединений."""
+    n = settings.NFT_CHECK_CONCURRENCY
+    return httpx.AsyncClient(
+        timeout=15.0,
+        limits=httpx.Limits(max_connections=n, max_keepalive_connections=n),
+    )
+
 
 async def check_user_vip(wallet_ton: str) -> bool:
     """
@@ -27,43 +53,113 @@ async def check_user_vip(wallet_ton: str) -> bool:
 
     Возвращает:
     True — если у пользователя есть хотя бы один NFT из коллекции VIP.
-    False — если нет.
+    False — если нет (или API недоступен).
     """
-
     if not wallet_ton:
         return False
 
+    async with _new_client() as client:
+        result = await _fetch_single_flight(wallet_ton, client)
+    return bool(result)
+
+
+async def has_efhc_nft(address: str, client: Optional[httpx.AsyncClient] = None) -> bool:
+    """
+    Проверка одного адреса для ежедневного обхода. client — общий клиент обхода (иначе временный).
+    """
+    if not address:
+        return False
+    if client is None:
+        async with _new_client() as own:
+            result = await _fetch_single_flight(address, own)
+    else:
+        result = await _fetch_single_flight(address, client)
+    return bool(result)
+
+
+async def batch_has_efhc_nft(addresses: Iterable[str]) -> Dict[str, Optional[bool]]:
+    """
+    Проверка пачки адресов: один клиент на всю пачку, ≤ NFT_CHECK_CONCURRENCY запросов одновременно.
+    Возвращает {адрес: есть ли NFT}; ошибка API по адресу → None («неизвестно» — вызывающий
+    не должен трактовать её как «NFT нет», например снимать VIP).
+    """
+    unique = list(dict.fromkeys(a for a in addresses if a))
+    if not unique:
+        return {}
+    sem = asyncio.Semaphore(settings.NFT_CHECK_CONCURRENCY)
+
+    async with _new_client() as client:
+        async def _check(addr: str) -> Optional[bool]:
+            async with sem:
+                return await _fetch_single_flight(addr, client)
+
+        results = await asyncio.gather(*(_check(a) for a in unique), return_exceptions=True)
+    return {a: (None if isinstance(r, BaseException) else r) for a, r in zip(unique, results)}
+
+
+async def _fetch_single_flight(address: str, client: httpx.AsyncClient) -> Optional[bool]:
+    """
+    Запрос к API с объединением одновременных вызовов по одному кошельку: первый идёт в API,
+    остальные ждут его результат. None — ошибка API.
+    """
+    key = normalize_ton_address(address)
+    pending = _INFLIGHT.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    fut: "asyncio.Future[Optional[bool]]" = asyncio.get_running_loop().create_future()
+    _INFLIGHT[key] = fut
+    try:
+        result = await _fetch_user_vip(address, client)
+        fut.set_result(result)
+    except BaseException:
+        # Отмена/сбой лидера: ожидающие получают None (как ошибку API) и не зависают
+        fut.set_result(None)
+        raise
+    finally:
+        _INFLIGHT.pop(key, None)
+    return result
+
+
+async def _fetch_user_vip(wallet_ton: str, client: httpx.AsyncClient) -> Optional[bool]:
+    """
+    Запрос к NFT API: True/False — ответ API, None — ошибка API/сети.
+    """
     # URL API для проверки NFT (здесь пример для TonAPI)
     # Можно заменить на другой источник.
     api_url = f"{settings.GETGEMS_API_BASE}/v2/accounts/{wallet_ton}/nfts"
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_url) as resp:
-                if resp.status != 200:
-                    print(f"[EFHC][NFT] Ошибка API ({resp.status}) для {wallet_ton}")
-                    return False
-
-                data = await resp.json()
-
-                # -----------------------------------------
-                # Вариант API ответа (пример):
-                # {
-                #   "nft_items": [
-                #       {"collection_address": "...", "address": "...", "name": "VIP Pass"}
-                #   ]
-                # }
-                # -----------------------------------------
-
-                nft_items = data.get("nft_items", [])
-                for nft in nft_items:
-                    collection = nft.get("collection_address", "")
-                    if settings.ADMIN_NFT_COLLECTION_URL in collection:
-                        print(f"[EFHC][NFT] Найден VIP NFT у {wallet_ton}")
-                        return True
+        resp = await client.get(api_url)
+        if resp.status_code != 200:
+            print(f"[EFHC][NFT] Ошибка API ({resp.status_code}) для {wallet_ton}")
+            return None
+
+        # Дешёвый фильтр до разбора JSON (поиск подстроки в байтах, на C): адреса коллекции нет
+        # в теле ни в каком виде — VIP NFT точно нет, ответ не разбираем
+        raw = resp.content
+        if _COLLECTION_BYTES and not any(b in raw for b in _COLLECTION_BYTES):
+            return False
+        data = json.loads(raw)
+
+        # -----------------------------------------
+        # Вариант API ответа (пример):
+        # {
+        #   "nft_items": [
+        #       {"collection_address": "...", "address": "...", "name": "VIP Pass"}
+        #   ]
+        # }
+        # -----------------------------------------
+
+        nft_items = data.get("nft_items", [])
+        for nft in nft_items:
+            collection = nft.get("collection_address", "")
+            if settings.ADMIN_NFT_COLLECTION_URL in collection:
+                print(f"[EFHC][NFT] Найден VIP NFT у {wallet_ton}")
+                return True
 
     except Exception as e:
         print(f"[EFHC][NFT] Ошибка при проверке NFT: {e}")
-        return False
+        return None
 
     return False
@@ -4,74 +4,118 @@
 # - прямой бонус 0.1 EFHC за каждого активного реферала (первую покупку панели),
 # - пороговые бонусы за 10/100/1000/3000/10000 активных.
 # - «Активным» считаем реферала после покупки первой панели.
-# - Бонусы начисляются на main_balance (реальный).
-# - История отражается в таблице transaction_logs.
+# - Бонусы начисляются на balances.bonus_efhc.
+# - История отражается в referral_bonus_log (идемпотентно через referral_bonus_idem).
+#
+# Ключ прямого бонуса 'fp:<invitee_id>' совпадает с пакетным начислением планировщика
+# (ReferralBonusLog.award_first_panel_bonuses) — кто бы ни успел первым, бонус один.
 #
 # ПРИМЕЧАНИЕ: здесь не храним дерево/мульти-уровни — только прямые рефералы.
 
 from __future__ import annotations
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, func
-from decimal import Decimal
-from .models import User, Referral, TransactionLog
+from sqlalchemy import text
+from .models import SCHEMA, to_scaled
 from .config import get_settings
 from .utils import q3, dec
 
 settings = get_settings()
 
-async def mark_user_active_and_reward_referrer(user_id: int, db: AsyncSession) -> None:
+# Прямой бонус — константа процесса: на горячем пути биндится готовый BIGINT ×10^8, без Decimal на вызов
+_DIRECT_BONUS_SCALED = to_scaled(q3(settings.REFERRAL_DIRECT_BONUS_EFHC))
+
+async def mark_user_active_and_reward_referrer(user_id: int, db: AsyncSession) -> Optional[int]:
     """
-    Вызывается в момент первой покупки панели пользователем user_id:
-    1) помечает этого пользователя как активного (active_user = True),
-    2) если у него есть реферер — начисляет 0.1 EFHC рефереру,
-    3) проверяет достижения (10/100/...) активных, добавляет пороговый бонус.
-    Всё в единой транзакции.
+    Вызывается в момент первой покупки панели пользователем user_id
+    (shop_routes.shop_buy_panels — в транзакции покупки, до commit).
+    Один запрос (CTE):
+      1) инвайтер из referrals;
+      2) ключ 'fp:<user_id>' в referral_bonus_idem (повтор → пусто, бонус не задваивается);
+      3) строка 'first_panel' в referral_bonus_log и bonus_efhc += бонус инвайтеру;
+      4) referrals.activated_at = now() (первая активация) и users.active_referral_count += 1
+         у инвайтера — новое значение счётчика через RETURNING (без count(*) по referrals).
+    Пороговый бонус — второй запрос (_THRESHOLD_AWARD_SQL), только если счётчик ровно на пороге (редкий путь).
+    Возвращает telegram_id инвайтера, если бонус начислен, иначе None.
+    Коммит — на стороне вызывающего.
     """
-    async with db.begin():
-        # Найдем реферала в таблице связей
-        res = await db.execute(select(Referral).where(Referral.user_id == user_id))
-        ref = res.scalar_one_or_none()
-        if not ref:
-            # нет реферала — просто активируем пользователя
-            await db.execute(update(User).where(User.id == user_id).values(active_user=True))
-            return
-
-        # Обновим активность пользователя
-        await db.execute(update(User).where(User.id == user_id).values(active_user=True))
-
-        # Начислим базовый бонус рефереру
-        direct_bonus = q3(settings.REFERRAL_DIRECT_BONUS_EFHC)
-        await _credit_main_balance(db, ref.referrer_user_id, direct_bonus, meta={"type": "referral_direct", "ref_user_id": user_id})
+    res = await db.execute(_FIRST_PANEL_AWARD_SQL, {"uid": user_id, "amount_scaled": _DIRECT_BONUS_SCALED})
+    row = res.one_or_none()
+    if row is None:
+        return None
+    inviter_id = int(row[0])
+    active_count = int(row[1]) if row[1] is not None else None
 
-        # Считаем количество активных прямых рефералов у referrer
-        res2 = await db.execute(
-            select(func.count(User.id))
-            .select_from(User)
-            .join(Referral, Referral.user_id == User.id)
-            .where(Referral.referrer_user_id == ref.referrer_user_id)
-            .where(User.active_user == True)
-        )
-        active_count = int(res2.scalar_one() or 0)
+    # Пороговый бонус (ключ 'th:<inviter>:<порог>' — одно начисление на порог): ключ, лог и баланс —
+    # тоже одним запросом
+    bonus = settings.REFERRAL_MILESTONES.get(active_count) if active_count is not None else None
+    if bonus is not None:
+        await db.execute(_THRESHOLD_AWARD_SQL, {
+            "tg": inviter_id,
+            "cnt": active_count,
+            "amount_scaled": to_scaled(q3(dec(bonus))),
+            "idem": f"th:{inviter_id}:{active_count}",
+        })
+    return inviter_id
 
-        # Пороговые бонусы
-        for threshold, bonus in settings.REFERRAL_MILESTONES.items():
-            if active_count == threshold:
-                b = q3(dec(bonus))
-                await _credit_main_balance(db, ref.referrer_user_id, b, meta={"type": "referral_milestone", "threshold": threshold})
 
-async def _credit_main_balance(db: AsyncSession, user_id: int, amount: Decimal, meta: dict | None = None):
-    # Увеличим баланс и добавим запись в лог
-    res_u = await db.execute(select(User).where(User.id == user_id).with_for_update())
-    u = res_u.scalar_one_or_none()
-    if not u:
-        return
-    new_main = q3(dec(u.main_balance) + amount)
-    u.main_balance = new_main
-    db.add(TransactionLog(
-        user_id=user_id,
-        op_type="referral_bonus",
-        amount=amount,
-        source="main",
-        meta=meta or {}
-    ))
+_FIRST_PANEL_AWARD_SQL = text(f"""
+    WITH ref AS (
+        SELECT inviter_id FROM {SCHEMA}.referrals
+         WHERE invitee_id = :uid AND inviter_id IS NOT NULL
+    ), k AS (
+        INSERT INTO {SCHEMA}.referral_bonus_idem (idempotency_key)
+        SELECT 'fp:' || CAST(:uid AS bigint) FROM ref
+        ON CONFLICT DO NOTHING
+        RETURNING idempotency_key
+    ), act AS (
+        UPDATE {SCHEMA}.referrals
+           SET activated_at = now()
+         WHERE invitee_id = :uid AND activated_at IS NULL
+        RETURNING inviter_id
+    ), cnt AS (
+        -- Строка инвайтера блокируется UPDATE — параллельные активации получают последовательные значения
+        UPDATE {SCHEMA}.users u
+           SET active_referral_count = u.active_referral_count + 1
+          FROM act
+         WHERE u.telegram_id = act.inviter_id
+        RETURNING u.active_referral_count
+    ), ins AS (
+        INSERT INTO {SCHEMA}.referral_bonus_log
+            (telegram_id, bonus_type, amount_bonus_efhc_scaled, idempotency_key, meta)
+        SELECT ref.inviter_id, 'first_panel', :amount_scaled, k.idempotency_key,
+               jsonb_build_object('invitee_id', CAST(:uid AS bigint))
+          FROM ref, k
+        RETURNING telegram_id, amount_bonus_efhc_scaled
+    ), bal AS (
+        INSERT INTO {SCHEMA}.balances AS b (telegram_id, bonus_efhc, updated_at)
+        SELECT telegram_id, amount_bonus_efhc_scaled::numeric / 100000000, now() FROM ins
+        ON CONFLICT (telegram_id) DO UPDATE SET
+            bonus_efhc = b.bonus_efhc + EXCLUDED.bonus_efhc,
+            updated_at = now()
+        RETURNING 1
+    )
+    SELECT ins.telegram_id, cnt.active_referral_count
+      FROM ins LEFT JOIN cnt ON TRUE
+""")
 
+_THRESHOLD_AWARD_SQL = text(f"""
+    WITH k AS (
+        INSERT INTO {SCHEMA}.referral_bonus_idem (idempotency_key)
+        VALUES (:idem)
+        ON CONFLICT DO NOTHING
+        RETURNING idempotency_key
+    ), ins AS (
+        INSERT INTO {SCHEMA}.referral_bonus_log
+            (telegram_id, bonus_type, count_at_moment, amount_bonus_efhc_scaled, idempotency_key, meta)
+        SELECT :tg, 'threshold', :cnt, :amount_scaled, k.idempotency_key,
+               jsonb_build_object('threshold', CAST(:cnt AS int))
+          FROM k
+        RETURNING telegram_id, amount_bonus_efhc_scaled
+    )
+    INSERT INTO {SCHEMA}.balances AS b (telegram_id, bonus_efhc, updated_at)
+    SELECT telegram_id, amount_bonus_efhc_scaled::numeric / 100000000, now() FROM ins
+    ON CONFLICT (telegram_id) DO UPDATE SET
+        bonus_efhc = b.bonus_efhc + EXCLUDED.bonus_efhc,
+        updated_at = now()
+""")
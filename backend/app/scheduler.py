@@ -18,8 +18,8 @@
 #         метрика для рейтинга).
 #       - Начисления строго идемпотентны по дню: уникальная запись в журнале efhc_core.kwh_generation_log
 #         (user_id + accrual_date).
-#   • Архивирование панелей: активная панель (active = TRUE) становится неактивной (active = FALSE),
-#     если прошло >= 180 дней с момента activated_at. Поле archived_at проставляется.
+#   • Архивирование панелей: активная панель (active = TRUE) с истёкшим expires_at (= activated_at + 180 дней)
+#     переносится из efhc_core.panels в efhc_core.panel_archive одним SQL-выражением (Panel.archive_expired).
 #
 # Таблицы (DDL обеспечивается функцией ensure_scheduler_tables):
 #
@@ -57,8 +57,11 @@
 #   • В app/main.py на старте вызвать setup_scheduler(app) и scheduler.start().
 #   • Задачи по крону:
 #       - 00:00 — run_nft_vip_check()
+#       - 00:05 — create_ref_bonus_partitions()
 #       - 00:15 — archive_expired_panels()
 #       - 00:30 — run_daily_kwh_accrual()
+#       - каждые REFERRAL_FIRST_PANEL_SWEEP_MINUTES — award_referral_first_panel_bonuses()
+#       - каждые LEADERBOARD_REFRESH_MINUTES — refresh_leaderboard()
 #
 # Важно:
 #   • Все округления до 3 знаков (ROUND_DOWN).
@@ -73,16 +76,22 @@ import asyncio
 import logging
 from datetime import datetime, timedelta, date
 from decimal import Decimal, ROUND_DOWN
-from typing import Optional, Dict, List, Tuple, Set
+from typing import Optional, Dict, List, Set
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy import text, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .config import get_settings
-from .database import async_session_maker  # предполагается, что в database.py экспортируется async_session_maker
-# Если у вас другое имя, скорректируйте импорт. Вариант:
-# from .database import async_session as async_session_maker
+from .models import (
+    AdminRateChange,
+    LeaderboardKwhMV,
+    Panel,
+    ReferralBonusLog,
+    ensure_efhc_log_partitions,
+    ensure_ref_bonus_partitions,
+)
+from .database import async_session_maker  # новая AsyncSession на задачу
 
 # nft_checker должен предоставлять функции проверки наличия EFHC NFT:
 #   - async def has_efhc_nft(address: str) -> bool
@@ -101,7 +110,7 @@ settings = get_settings()
 
 DEC3 = Decimal("0.001")
 
-# Суточная выработка на 1 панель
+# Суточная выработка на 1 панель (по умолчанию; актуальные ставки — AdminRateChange.get_active_rates)
 BASE_KWH_PER_PANEL = Decimal("0.598")  # обычный пользователь
 VIP_KWH_PER_PANEL = Decimal("0.640")   # VIP пользователь (≈ +7%)
 
@@ -150,6 +159,12 @@ CREATE TABLE IF NOT EXISTS {settings.DB_SCHEMA_CORE}.kwh_generation_log (
 );
 """
 
+# Журнал только дописывается по дням → BRIN по accrual_date для выборок за период
+DDL_KWH_GENERATION_LOG_BRIN = f"""
+CREATE INDEX IF NOT EXISTS ix_kwh_gen_log_date_brin
+    ON {settings.DB_SCHEMA_CORE}.kwh_generation_log USING brin (accrual_date) WITH (pages_per_range = 32);
+"""
+
 async def ensure_scheduler_tables(db: AsyncSession) -> None:
     """
     Создаёт вспомогательные таблицы user_wallets, user_vip_status и kwh_generation_log.
@@ -158,6 +173,7 @@ async def ensure_scheduler_tables(db: AsyncSession) -> None:
     await db.execute(text(DDL_USER_WALLETS))
     await db.execute(text(DDL_USER_VIP_STATUS))
     await db.execute(text(DDL_KWH_GENERATION_LOG))
+    await db.execute(text(DDL_KWH_GENERATION_LOG_BRIN))
     await db.commit()
 
 # -----------------------------------------------------------------------------
@@ -194,27 +210,26 @@ async def fetch_current_vip_set(db: AsyncSession) -> Set[int]:
     rows = q.fetchall()
     return {int(r[0]) for r in rows}
 
-async def upsert_vip_status(db: AsyncSession, user_id: int, is_vip: bool) -> None:
+async def apply_vip_statuses(db: AsyncSession, vip_ids: List[int], revoked_ids: List[int]) -> None:
     """
-    Вставляет/обновляет VIP-статус пользователя:
-      • Если is_vip=True — upsert (вставка/обновление last_checked).
-      • Если is_vip=False — удаление записи из user_vip_status.
+    Пакетная запись результатов проверки NFT (два запроса на пачку вместо одного на пользователя):
+      • vip_ids — upsert в user_vip_status (since — первая вставка, last_checked = NOW());
+      • revoked_ids — удаление записей (VIP снят).
     """
-    if is_vip:
+    if vip_ids:
         await db.execute(
             text(f"""
                 INSERT INTO {settings.DB_SCHEMA_CORE}.user_vip_status (telegram_id, since, last_checked, has_nft)
-                VALUES (:tg, NOW(), NOW(), TRUE)
+                SELECT tg, NOW(), NOW(), TRUE FROM unnest(CAST(:ids AS bigint[])) AS tg
                 ON CONFLICT (telegram_id)
                 DO UPDATE SET last_checked=NOW(), has_nft=TRUE
             """),
-            {"tg": user_id}
+            {"ids": vip_ids}
         )
-    else:
-        # Снимаем VIP: удаляем запись
+    if revoked_ids:
         await db.execute(
-            text(f"DELETE FROM {settings.DB_SCHEMA_CORE}.user_vip_status WHERE telegram_id=:tg"),
-            {"tg": user_id}
+            text(f"DELETE FROM {settings.DB_SCHEMA_CORE}.user_vip_status WHERE telegram_id = ANY(CAST(:ids AS bigint[]))"),
+            {"ids": revoked_ids}
         )
 
 async def check_wallet_has_nft(addresses: List[str]) -> bool:
@@ -248,6 +263,23 @@ async def check_wallet_has_nft(addresses: List[str]) -> bool:
         log.warning("nft_checker module is missing; assuming VIP=FALSE for all users")
     return False
 
+async def check_wallets_batch(addresses: List[str]) -> Dict[str, Optional[bool]]:
+    """
+    Проверка пачки адресов: batch_has_efhc_nft (общий клиент + семафор), иначе — по одному.
+    Возвращает {адрес: есть ли EFHC NFT}; None — ошибка API (статус по адресу неизвестен).
+    """
+    if not addresses:
+        return {}
+    if nft_checker and hasattr(nft_checker, "batch_has_efhc_nft"):
+        try:
+            return await nft_checker.batch_has_efhc_nft(addresses)
+        except Exception as e:
+            log.warning("batch_has_efhc_nft failed, fallback to single checks: %s", e)
+    result: Dict[str, Optional[bool]] = {}
+    for addr in dict.fromkeys(addresses):
+        result[addr] = await check_wallet_has_nft([addr])
+    return result
+
 async def run_nft_vip_check() -> None:
     """
     Главная задача проверки NFT → VIP-статусов.
@@ -258,7 +290,9 @@ async def run_nft_vip_check() -> None:
            - Если найден NFT (is_vip=True):
                  вставляем/обновляем запись в user_vip_status (since — первая вставка)
            - Иначе: удаляем запись из user_vip_status (если была).
+           - Ошибка API по адресу пользователя: статус не трогаем.
       4) last_checked обновляем по мере апдейта.
+    Проверки — одним параллельным обходом всех адресов, запись — двумя запросами (apply_vip_statuses).
     """
     log.info("[Scheduler] NFT/VIP check started")
     async with async_session_maker() as db:
@@ -267,128 +301,79 @@ async def run_nft_vip_check() -> None:
         wallets_map = await fetch_all_wallets(db)
         current_vip = await fetch_current_vip_set(db)
 
-        cnt_true = 0
-        cnt_false = 0
-        processed = 0
-
-        # Обрабатываем пользователей пакетами для снижения нагрузки (если батч в nft_checker отсутствует)
-        user_ids = list(wallets_map.keys())
-        # Можно группировать по N пользователей за итерацию
-        BATCH_SIZE = 200
-
-        for i in range(0, len(user_ids), BATCH_SIZE):
-            batch_ids = user_ids[i:i + BATCH_SIZE]
-            # Проверяем каждого
-            for uid in batch_ids:
-                addresses = wallets_map.get(uid, [])
-                is_vip = await check_wallet_has_nft(addresses)
-                if is_vip:
-                    await upsert_vip_status(db, uid, True)
-                    cnt_true += 1
-                else:
-                    # Если ранее был VIP — убираем
-                    if uid in current_vip:
-                        await upsert_vip_status(db, uid, False)
-                    cnt_false += 1
-                processed += 1
-
-            # Коммит пакетно
-            await db.commit()
-
-        log.info("[Scheduler] NFT/VIP check done: processed=%d, vip=%d, non_vip=%d", processed, cnt_true, cnt_false)
+        # Все адреса — одним параллельным обходом (общий HTTP-клиент, ≤ NFT_CHECK_CONCURRENCY запросов
+        # одновременно, без ожидания самой медленной проверки каждой пачки)
+        has_nft = await check_wallets_batch([a for addrs in wallets_map.values() for a in addrs])
+
+        vip_ids: List[int] = []
+        revoked_ids: List[int] = []
+        unknown = 0
+        for uid, addrs in wallets_map.items():
+            results = [has_nft.get(a) for a in addrs if a]
+            if any(r is True for r in results):
+                vip_ids.append(uid)
+            elif any(r is None for r in results):
+                # Ошибка API хотя бы по одному адресу — статус не меняем (не снимаем VIP из-за сбоя)
+                unknown += 1
+            elif uid in current_vip:
+                # Ранее был VIP — убираем
+                revoked_ids.append(uid)
+        processed = len(wallets_map)
+        cnt_true = len(vip_ids)
+        cnt_false = processed - cnt_true - unknown
+
+        # Запись — двумя запросами на весь обход (массивы id биндятся одним параметром)
+        await apply_vip_statuses(db, vip_ids, revoked_ids)
+        await db.commit()
+
+        log.info("[Scheduler] NFT/VIP check done: processed=%d, vip=%d, non_vip=%d, unknown=%d",
+                 processed, cnt_true, cnt_false, unknown)
 
 # -----------------------------------------------------------------------------
 # Ежедневная генерация kWh по активным панелям (00:30)
 # -----------------------------------------------------------------------------
-async def fetch_active_panels_count_per_user(db: AsyncSession) -> Dict[int, int]:
-    """
-    Возвращает количество активных панелей по пользователям:
-      { telegram_id: active_count }
-    """
-    q = await db.execute(
-        text(f"""
-            SELECT telegram_id, COUNT(*) AS cnt
-            FROM {settings.DB_SCHEMA_CORE}.panels
-            WHERE active = TRUE
-            GROUP BY telegram_id
-        """)
-    )
-    rows = q.fetchall()
-    return {int(tg): int(cnt) for tg, cnt in rows}
-
-async def fetch_vip_set(db: AsyncSession) -> Set[int]:
-    """
-    Возвращает множество telegram_id с действующим VIP (user_vip_status).
-    """
-    q = await db.execute(text(f"SELECT telegram_id FROM {settings.DB_SCHEMA_CORE}.user_vip_status"))
-    rows = q.fetchall()
-    return {int(r[0]) for r in rows}
-
-async def log_kwh_generation(db: AsyncSession, user_id: int, accrual_date: date,
-                             panels_count: int, is_vip: bool, amount_kwh: Decimal) -> bool:
-    """
-    Пишет запись в журнал efhc_core.kwh_generation_log с уникальным ключом (telegram_id, accrual_date).
-    Возвращает True, если запись добавлена (начисление нужно выполнить), False — если запись уже была (идемпотентность).
-    """
-    try:
-        await db.execute(
-            text(f"""
-                INSERT INTO {settings.DB_SCHEMA_CORE}.kwh_generation_log
-                    (telegram_id, accrual_date, panels_count, is_vip, amount_kwh, created_at)
-                VALUES (:tg, :ad, :pc, :vip, :amt, NOW())
-                ON CONFLICT (telegram_id, accrual_date) DO NOTHING
-            """),
-            {"tg": user_id, "ad": accrual_date, "pc": panels_count, "vip": is_vip, "amt": str(d3(amount_kwh))}
-        )
-        # Проверяем, добавилось ли:
-        q = await db.execute(
-            text(f"""
-                SELECT 1 FROM {settings.DB_SCHEMA_CORE}.kwh_generation_log
-                WHERE telegram_id=:tg AND accrual_date=:ad
-            """),
-            {"tg": user_id, "ad": accrual_date}
-        )
-        row = q.first()
-        return bool(row)
-    except Exception as e:
-        log.error("log_kwh_generation error for user=%s date=%s: %s", user_id, accrual_date, e)
-        raise
-
-async def add_kwh_to_balance(db: AsyncSession, user_id: int, amount_kwh: Decimal) -> None:
-    """
-    Начисляет kWh в balances:
-      • kwh       += amount_kwh
-      • kwh_total += amount_kwh (неубывающий рейтинг-показатель)
-    Создаёт запись баланса при необходимости.
-    """
-    await db.execute(
-        text(f"""
-            INSERT INTO {settings.DB_SCHEMA_CORE}.balances (telegram_id, efhc, bonus, kwh, kwh_total)
-            VALUES (:tg, '0', '0', '0', '0')
-            ON CONFLICT (telegram_id) DO NOTHING
-        """),
-        {"tg": user_id}
-    )
-    # Обновляем поля (как NUMERIC в БД, но храним в TEXT в ORM — здесь raw SQL)
-    await db.execute(
-        text(f"""
-            UPDATE {settings.DB_SCHEMA_CORE}.balances
-            SET
-                kwh = (COALESCE(kwh,'0')::numeric + :amt)::text,
-                kwh_total = (COALESCE(kwh_total,'0')::numeric + :amt)::text
-            WHERE telegram_id = :tg
-        """),
-        {"tg": user_id, "amt": str(d3(amount_kwh))}
-    )
+# Весь день одним запросом: активные панели GROUP BY пользователь → ставка (VIP — по user_vip_status) →
+# лог kwh_generation_log (ON CONFLICT — идемпотентность по дню) → balances только для реально вставленных.
+# Суммы — trunc(панели × ставка, 3): округление вниз до 0.001, как прежде в Python.
+SQL_KWH_ACCRUAL_DAY = f"""
+WITH per_user AS (
+    SELECT p.telegram_id,
+           count(*)::int AS panels_count,
+           (v.telegram_id IS NOT NULL) AS is_vip
+      FROM {settings.DB_SCHEMA_CORE}.panels p
+      LEFT JOIN {settings.DB_SCHEMA_CORE}.user_vip_status v ON v.telegram_id = p.telegram_id
+     WHERE p.active = TRUE
+     GROUP BY p.telegram_id, v.telegram_id
+), ins AS (
+    INSERT INTO {settings.DB_SCHEMA_CORE}.kwh_generation_log
+        (telegram_id, accrual_date, panels_count, is_vip, amount_kwh, created_at)
+    SELECT telegram_id, :ad, panels_count, is_vip,
+           trunc(panels_count * CASE WHEN is_vip THEN CAST(:vip_rate AS numeric) ELSE CAST(:base_rate AS numeric) END, 3),
+           NOW()
+      FROM per_user
+    ON CONFLICT (telegram_id, accrual_date) DO NOTHING
+    RETURNING telegram_id, amount_kwh
+), bal AS (
+    INSERT INTO {settings.DB_SCHEMA_CORE}.balances AS b (telegram_id, kwh, kwh_total)
+    SELECT telegram_id, amount_kwh, amount_kwh FROM ins
+    ON CONFLICT (telegram_id) DO UPDATE SET
+        kwh = b.kwh + EXCLUDED.kwh,
+        kwh_total = b.kwh_total + EXCLUDED.kwh_total,
+        updated_at = NOW()
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM per_user), count(*), COALESCE(sum(amount_kwh), 0) FROM ins
+"""
 
 async def run_daily_kwh_accrual(target_date: Optional[date] = None) -> None:
     """
-    Ежедневная генерация kWh в 00:30:
-      1) Находит всех пользователей с активными панелями.
-      2) Для каждого определяет, является ли VIP (по user_vip_status).
-      3) Считает amount_kwh = panels_count * (0.598 или 0.640) и округляет вниз до 0.001.
-      4) Идём по пользователям: если запись в kwh_generation_log на target_date отсутствует — добавляем,
-         и после этого обновляем balances.kwh и balances.kwh_total.
+    Ежедневная генерация kWh в 00:30 — один set-based запрос (SQL_KWH_ACCRUAL_DAY), без выгрузки
+    пользователей в Python:
+      1) активные панели по пользователям (GROUP BY) и VIP-признак (LEFT JOIN user_vip_status);
+      2) amount_kwh = panels_count * (0.598 или 0.640), округление вниз до 0.001;
+      3) запись в kwh_generation_log на target_date, если её ещё нет, и только для новых записей —
+         balances.kwh и balances.kwh_total += amount_kwh.
+    Повторный запуск за тот же день ничего не начисляет (ON CONFLICT по (telegram_id, accrual_date)).
     Параметр target_date оставлен для возможности ручного запуска за конкретный день (для админа).
     По умолчанию начисляем за вчерашний день (если хотим в 00:30 начислять за прошедшие сутки),
     либо за текущий день — зависит от вашей политики. Ниже — начисляем за текущую календарную дату.
@@ -401,89 +386,101 @@ async def run_daily_kwh_accrual(target_date: Optional[date] = None) -> None:
     async with async_session_maker() as db:
         await ensure_scheduler_tables(db)
 
-        # 1) Кол-во активных панелей по пользователям
-        panels_map = await fetch_active_panels_count_per_user(db)
-        if not panels_map:
-            log.info("[Scheduler] No active panels found, nothing to accrue.")
-            return
+        # Ставки определяем один раз на весь прогон (кэшируются в AdminRateChange)
+        rates = await AdminRateChange.get_active_rates(db)
+        base_rate, vip_rate = rates if rates else (BASE_KWH_PER_PANEL, VIP_KWH_PER_PANEL)
 
-        # 2) Сет VIP-пользователей
-        vip_set = await fetch_vip_set(db)
-
-        processed = 0
-        added   = 0
-        total_amount = Decimal("0.000")
-
-        # Обрабатываем в батчах на случай больших объёмов
-        user_ids = list(panels_map.keys())
-        BATCH_SIZE = 500
-
-        for i in range(0, len(user_ids), BATCH_SIZE):
-            batch_ids = user_ids[i:i + BATCH_SIZE]
-            for uid in batch_ids:
-                cnt = panels_map.get(uid, 0)
-                if cnt <= 0:
-                    continue
-                is_vip = uid in vip_set
-                per_panel = VIP_KWH_PER_PANEL if is_vip else BASE_KWH_PER_PANEL
-                amount = d3(per_panel * Decimal(cnt))
-
-                # 3) Идемпотентная запись в лог
-                try:
-                    inserted = await log_kwh_generation(
-                        db=db,
-                        user_id=uid,
-                        accrual_date=accrual_date,
-                        panels_count=cnt,
-                        is_vip=is_vip,
-                        amount_kwh=amount,
-                    )
-                    if inserted:
-                        # 4) Начисляем в баланс
-                        await add_kwh_to_balance(db, uid, amount)
-                        added += 1
-                        total_amount += amount
-                except Exception as e:
-                    await db.rollback()
-                    log.error("Accrual failed for user=%s: %s", uid, e)
-                    continue
-
-                processed += 1
-
-            # Коммитим батч
+        try:
+            q = await db.execute(
+                text(SQL_KWH_ACCRUAL_DAY),
+                {"ad": accrual_date, "base_rate": base_rate, "vip_rate": vip_rate},
+            )
+            processed, added, total_kwh = q.one()
             await db.commit()
+        except Exception as e:
+            await db.rollback()
+            log.error("Daily kWh accrual failed for date=%s: %s", accrual_date, e)
+            return
 
         log.info("[Scheduler] Daily kWh accrual done: users_processed=%d, new_accruals=%d, total_kwh=%s",
-                 processed, added, str(d3(total_amount)))
+                 int(processed or 0), int(added or 0), str(d3(Decimal(total_kwh or 0))))
 
 # -----------------------------------------------------------------------------
 # Архивирование панелей по сроку (00:15)
 # -----------------------------------------------------------------------------
 async def archive_expired_panels() -> None:
     """
-    Переводит активные панели (active=TRUE) в архив, если прошло >= 180 дней с момента activated_at.
-    Устанавливает active=FALSE, archived_at=NOW().
+    Переносит активные панели с истёкшим сроком (expires_at <= NOW()) в panel_archive.
+    Вся работа — один SQL-запрос (CTE DELETE ... RETURNING → INSERT), см. Panel.archive_expired.
     """
     log.info("[Scheduler] Archive expired panels started")
     async with async_session_maker() as db:
-        # Обновляем все панели одним запросом
         try:
-            await db.execute(
-                text(f"""
-                    UPDATE {settings.DB_SCHEMA_CORE}.panels
-                    SET active = FALSE,
-                        archived_at = NOW()
-                    WHERE active = TRUE
-                      AND activated_at < (NOW() - INTERVAL '{PANEL_LIFETIME_DAYS} days')
-                      AND (archived_at IS NULL)
-                """)
-            )
+            archived, owners = await Panel.archive_expired(db)
             await db.commit()
         except Exception as e:
             await db.rollback()
             log.error("Archive panels failed: %s", e)
             return
-    log.info("[Scheduler] Archive expired panels done")
+    log.info("[Scheduler] Archive expired panels done: archived=%d, users=%d", archived, len(owners))
+
+# -----------------------------------------------------------------------------
+# Бонусы за первую панель рефералов (каждые REFERRAL_FIRST_PANEL_SWEEP_MINUTES)
+# -----------------------------------------------------------------------------
+async def award_referral_first_panel_bonuses() -> None:
+    """
+    Начисляет бонусы 'first_panel' за рефералов, купивших первую панель (один SQL на всех).
+    """
+    async with async_session_maker() as db:
+        try:
+            awarded = await ReferralBonusLog.award_first_panel_bonuses(
+                db, Decimal(str(settings.REFERRAL_DIRECT_BONUS_EFHC))
+            )
+            await db.commit()
+            if awarded:
+                log.info("[Scheduler] First-panel referral bonuses awarded: %d", awarded)
+        except Exception as e:
+            await db.rollback()
+            log.error("First-panel referral bonuses failed: %s", e)
+
+# -----------------------------------------------------------------------------
+# Рейтинг по kwh_total (каждые LEADERBOARD_REFRESH_MINUTES)
+# -----------------------------------------------------------------------------
+async def refresh_leaderboard() -> None:
+    """
+    Пересчитывает mv_leaderboard_kwh: раздел «Рейтинг» читает топ-K по индексу (rank),
+    а не сортирует balances по kwh_total на каждый запрос.
+    """
+    async with async_session_maker() as db:
+        try:
+            await LeaderboardKwhMV.refresh(db)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            log.error("Refresh leaderboard failed: %s", e)
+
+# -----------------------------------------------------------------------------
+# Секции referral_bonus_log / efhc_transfers_log на следующие месяцы (00:05)
+# -----------------------------------------------------------------------------
+async def create_ref_bonus_partitions() -> None:
+    """
+    Заранее создаёт помесячные секции referral_bonus_log и efhc_transfers_log
+    (текущий + 2 следующих месяца). Идемпотентно — ежедневный запуск ничего не делает,
+    если секции уже есть.
+    """
+    async with async_session_maker() as db:
+        try:
+            await ensure_ref_bonus_partitions(db, months_ahead=2)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            log.error("Create referral_bonus_log partitions failed: %s", e)
+        try:
+            await ensure_efhc_log_partitions(db, months_ahead=2)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            log.error("Create efhc_transfers_log partitions failed: %s", e)
 
 # -----------------------------------------------------------------------------
 # Регистрация задач планировщика APScheduler
@@ -492,17 +489,36 @@ def setup_scheduler() -> AsyncIOScheduler:
     """
     Создаёт и настраивает AsyncIOScheduler с крон-задачами:
       • 00:00 — NFT/VIP check
+      • 00:05 — Partitions for referral_bonus_log / efhc_transfers_log
       • 00:15 — Archive expired panels
       • 00:30 — Daily kWh accrual
+      • каждые N минут — бонусы за первую панель рефералов
+      • каждые N минут — REFRESH mv_leaderboard_kwh
     Возвращает готовый scheduler (но НЕ запускает его).
     """
     scheduler = AsyncIOScheduler(timezone="UTC")  # при необходимости используйте свою TZ
     # NFT-проверка в 00:00
     scheduler.add_job(run_nft_vip_check, "cron", hour=0, minute=0, id="vip_nft_check")
+    # Секции referral_bonus_log в 00:05
+    scheduler.add_job(create_ref_bonus_partitions, "cron", hour=0, minute=5, id="ref_bonus_partitions")
     # Архивирование панелей в 00:15
     scheduler.add_job(archive_expired_panels, "cron", hour=0, minute=15, id="archive_panels")
     # Начисление kWh в 00:30
     scheduler.add_job(run_daily_kwh_accrual, "cron", hour=0, minute=30, id="kwh_accrual")
+    # Бонусы за первую панель рефералов
+    scheduler.add_job(
+        award_referral_first_panel_bonuses,
+        "interval",
+        minutes=settings.REFERRAL_FIRST_PANEL_SWEEP_MINUTES,
+        id="referral_first_panel_bonuses",
+    )
+    # Рейтинг по kwh_total (materialized view)
+    scheduler.add_job(
+        refresh_leaderboard,
+        "interval",
+        minutes=settings.LEADERBOARD_REFRESH_MINUTES,
+        id="leaderboard_refresh",
+    )
     return scheduler
 
 # -----------------------------------------------------------------------------
@@ -11,6 +11,8 @@ from typing import Optional, List
 from decimal import Decimal
 from datetime import datetime
 
+from .models import AdminPerm
+
 
 # ======================
 # ⚖️ Балансы
@@ -307,13 +309,37 @@ class AdminVipConfirmIn(BaseModel):
     tx: Optional[str] = None
 
 
+# Флаги API ↔ биты admin_nft_whitelist.permissions (AdminPerm)
+ADMIN_NFT_PERM_FLAGS = (
+    ("can_shop", AdminPerm.SHOP),
+    ("can_tasks", AdminPerm.TASKS),
+    ("can_lotteries", AdminPerm.LOTTERIES),
+    ("can_users", AdminPerm.USERS),
+    ("can_withdrawals", AdminPerm.WITHDRAWALS),
+    ("can_panels", AdminPerm.PANELS),
+    ("can_all", AdminPerm.ALL),
+)
+
+
 class AdminNFTBase(BaseModel):
     nft_address: str
-    can_tasks: bool = False
+    comment: Optional[str] = None
     can_shop: bool = False
-    can_lottery: bool = False
+    can_tasks: bool = False
+    can_lotteries: bool = False
+    can_users: bool = False
+    can_withdrawals: bool = False
+    can_panels: bool = False
     can_all: bool = False
 
+    def perms(self) -> AdminPerm:
+        """Флаги can_* → битовая маска для admin_nft_whitelist.permissions."""
+        mask = AdminPerm(0)
+        for name, bit in ADMIN_NFT_PERM_FLAGS:
+            if getattr(self, name):
+                mask |= bit
+        return mask
+
 
 class AdminNFTCreate(AdminNFTBase):
     pass
@@ -321,6 +347,18 @@ class AdminNFTCreate(AdminNFTBase):
 
 class AdminNFTResponse(AdminNFTBase):
     id: int
-
-    class Config:
-        orm_mode = True
+    enabled: bool = True
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_row(cls, row) -> "AdminNFTResponse":
+        """Строка AdminNFTWhitelist → ответ API (permissions разворачиваются в can_*)."""
+        perms = row.perms
+        return cls(
+            id=row.id,
+            nft_address=row.nft_address,
+            comment=row.comment,
+            enabled=row.enabled is not False,
+            created_at=row.created_at,
+            **{name: bool(perms & bit) for name, bit in ADMIN_NFT_PERM_FLAGS},
+        )
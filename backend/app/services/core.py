@@ -25,8 +25,9 @@ from datetime import datetime, timedelta, date
 from decimal import Decimal, ROUND_DOWN
 from typing import Optional, List, Dict, Tuple
 
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func, and_, insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
 from ..config import get_settings
 from ..models import (
@@ -49,6 +50,10 @@ settings = get_settings()
 PANEL_PRICE = Decimal(f"{settings.PANEL_PRICE_EFHC:.3f}")          # 100.000 EFHC
 EFHC_Q = Decimal("0." + "0"*(settings.EFHC_DECIMALS-1) + "1")      # шаг округления EFHC (напр. 0.001)
 KWH_Q  = Decimal("0." + "0"*(settings.KWH_DECIMALS-1) + "1")       # шаг округления kWh  (напр. 0.001)
+# Настройки не меняются в рантайме → Decimal-константы строим один раз, а не на каждый вызов
+DAILY_RATE_BASE = Decimal(str(settings.DAILY_GEN_BASE_KWH))          # 0.598 kWh/сутки на панель
+DAILY_RATE_VIP  = DAILY_RATE_BASE * Decimal(str(settings.VIP_MULTIPLIER))  # ×1.07 для VIP
+EXCHANGE_MIN    = Decimal(str(settings.EXCHANGE_MIN_KWH))            # минимум обмена kWh → EFHC
 
 
 # =============================================================================
@@ -81,9 +86,8 @@ async def get_or_create_user(db: AsyncSession, telegram_id: int, username: Optio
 
     Возвращает объект User.
     """
-    # Пытаемся найти пользователя по telegram_id
-    res = await db.execute(select(User).where(User.telegram_id == telegram_id))
-    user = res.scalar_one_or_none()
+    # Пытаемся найти пользователя по telegram_id (PK → identity map; баланс и VIP — тем же запросом)
+    user = await db.get(User, telegram_id, options=[joinedload(User.balance), joinedload(User.vip_status)])
 
     if user is None:
         # Создаём User и связанный Balance
@@ -111,8 +115,7 @@ async def get_balance(db: AsyncSession, telegram_id: int) -> Dict[str, str]:
         "kwh":   "5.000"
       }
     """
-    res = await db.execute(select(Balance).where(Balance.telegram_id == telegram_id))
-    bal = res.scalar_one_or_none()
+    bal = await db.get(Balance, telegram_id)
     if bal is None:
         # На всякий случай инициализация (если баланс не был создан ранее)
         bal = Balance(telegram_id=telegram_id)
@@ -166,8 +169,7 @@ async def purchase_panel(db: AsyncSession, telegram_id: int) -> Dict[str, str]:
       }
     """
     # Получим баланс
-    res = await db.execute(select(Balance).where(Balance.telegram_id == telegram_id))
-    bal = res.scalar_one_or_none()
+    bal = await db.get(Balance, telegram_id)
     if bal is None:
         raise RuntimeError("Баланс не найден. Повторите /start.")
 
@@ -246,12 +248,11 @@ async def exchange_kwh_to_efhc(db: AsyncSession, telegram_id: int, amount_kwh: D
 
     if amt <= Decimal("0"):
         raise RuntimeError("Сумма обмена должна быть > 0.")
-    if amt < Decimal(str(settings.EXCHANGE_MIN_KWH)):
-        raise RuntimeError(f"Минимум для обмена — {fmt_k(Decimal(str(settings.EXCHANGE_MIN_KWH)))} kWh.")
+    if amt < EXCHANGE_MIN:
+        raise RuntimeError(f"Минимум для обмена — {fmt_k(EXCHANGE_MIN)} kWh.")
 
     # Баланс
-    res = await db.execute(select(Balance).where(Balance.telegram_id == telegram_id))
-    bal = res.scalar_one_or_none()
+    bal = await db.get(Balance, telegram_id)
     if bal is None:
         raise RuntimeError("Баланс не найден.")
 
@@ -316,16 +317,23 @@ async def list_lotteries(db: AsyncSession) -> List[Dict]:
     res = await db.execute(select(LotteryRound).where(LotteryRound.finished.is_(False)).order_by(LotteryRound.id.asc()))
     rounds = res.scalars().all()
 
+    # Проданные билеты — одним GROUP BY по всем розыгрышам (а не COUNT на каждый)
+    sold_map: Dict[int, int] = {}
+    if rounds:
+        res_count = await db.execute(
+            select(LotteryTicket.lottery_id, func.count(LotteryTicket.id))
+            .where(LotteryTicket.lottery_id.in_([r.id for r in rounds]))
+            .group_by(LotteryTicket.lottery_id)
+        )
+        sold_map = {lid: int(cnt or 0) for lid, cnt in res_count.all()}
+
     items: List[Dict] = []
     for r in rounds:
-        # Посчитаем число проданных билетов
-        res_count = await db.execute(select(func.count(LotteryTicket.id)).where(LotteryTicket.lottery_id == r.id))
-        sold = int(res_count.scalar_one() or 0)
         items.append({
             "id": r.id,
             "title": r.title,
             "target": r.target_participants,
-            "tickets_sold": sold,
+            "tickets_sold": sold_map.get(r.id, 0),
             "prize_type": r.prize_type,
         })
     return items
@@ -353,8 +361,7 @@ async def buy_lottery_tickets(db: AsyncSession, telegram_id: int, lottery_id: in
         raise RuntimeError("Розыгрыш не найден или уже завершён.")
 
     # Баланс
-    resb = await db.execute(select(Balance).where(Balance.telegram_id == telegram_id))
-    bal = resb.scalar_one_or_none()
+    bal = await db.get(Balance, telegram_id)
     if bal is None:
         raise RuntimeError("Баланс не найден.")
 
@@ -367,8 +374,12 @@ async def buy_lottery_tickets(db: AsyncSession, telegram_id: int, lottery_id: in
 
     # Списание и создание билетов
     bal.efhc = (efhc_avail - total_price).quantize(EFHC_Q, rounding=ROUND_DOWN)
-    for _ in range(count):
-        db.add(LotteryTicket(lottery_id=lottery_id, telegram_id=telegram_id, purchased_at=datetime.utcnow()))
+    # Билеты — одним INSERT (ORM bulk insert, insertmanyvalues) вместо count отдельных строк в flush
+    now = datetime.utcnow()
+    await db.execute(
+        insert(LotteryTicket),
+        [{"lottery_id": lottery_id, "telegram_id": telegram_id, "purchased_at": now} for _ in range(count)],
+    )
 
     await db.flush()
 
@@ -478,8 +489,7 @@ async def complete_task(db: AsyncSession, telegram_id: int, task_id: int) -> Dic
     prog = res2.scalar_one_or_none()
 
     # Баланс
-    resb = await db.execute(select(Balance).where(Balance.telegram_id == telegram_id))
-    bal = resb.scalar_one_or_none()
+    bal = await db.get(Balance, telegram_id)
     if bal is None:
         raise RuntimeError("Баланс не найден.")
 
@@ -643,15 +653,13 @@ async def accrue_daily_for_user(db: AsyncSession, telegram_id: int, run_date: da
 
     # Проверяем VIP
     vip = await has_vip(db, telegram_id)
-    multiplier = Decimal(str(settings.VIP_MULTIPLIER)) if vip else Decimal("1.0")
 
-    # Расчёт начисления
-    base = Decimal(str(settings.DAILY_GEN_BASE_KWH))          # 0.598
-    generated = (base * Decimal(panels_count) * multiplier).quantize(KWH_Q, rounding=ROUND_DOWN)
+    # Расчёт начисления (ставка с учётом VIP — заранее посчитанная константа)
+    rate = DAILY_RATE_VIP if vip else DAILY_RATE_BASE
+    generated = (rate * panels_count).quantize(KWH_Q, rounding=ROUND_DOWN)
 
     # Записываем в баланс
-    resb = await db.execute(select(Balance).where(Balance.telegram_id == telegram_id))
-    bal = resb.scalar_one_or_none()
+    bal = await db.get(Balance, telegram_id)
     if bal is None:
         # На всякий случай создадим
         bal = Balance(telegram_id=telegram_id, kwh=Decimal("0.000"))
@@ -63,6 +63,7 @@
 #   • config.get_settings — конфигурация (schema, admin ID и др.).
 #   • models.User, Balance — ORM-модели.
 #   • efhc_transactions: BANK_TELEGRAM_ID, credit_user_from_bank, debit_user_to_bank.
+#   • referral.mark_user_active_and_reward_referrer — бонус инвайтеру при первой панели.
 #
 # Интеграция и UI:
 #   • Frontend (React+Tailwind) отправляет заказы (Shop).
@@ -83,17 +84,18 @@ from typing import Optional, List, Dict, Any
 
 from fastapi import APIRouter, Depends, Header, HTTPException, Query, Path
 from pydantic import BaseModel, Field, condecimal
-from sqlalchemy import text, select
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .database import get_session
 from .config import get_settings
-from .models import User, Balance
+from .models import User, Balance, GET_BALANCE_FOR_UPDATE_STMT
 from .efhc_transactions import (
     BANK_TELEGRAM_ID,
     credit_user_from_bank,   # банк -> user EFHC
     debit_user_to_bank,      # user -> банк EFHC
 )
+from .referral import mark_user_active_and_reward_referrer
 
 # -----------------------------------------------------------------------------
 # Инициализация и логгер
@@ -302,8 +304,7 @@ async def _ensure_user_balance(db: AsyncSession, user_id: int) -> Balance:
     """), {"tg": user_id})
     await db.commit()
 
-    q = await db.execute(select(Balance).where(Balance.telegram_id == user_id))
-    bal: Optional[Balance] = q.scalar_one_or_none()
+    bal: Optional[Balance] = await db.get(Balance, user_id, populate_existing=True)
     if not bal:
         raise HTTPException(status_code=500, detail="Не удалось получить баланс пользователя")
     return bal
@@ -313,10 +314,7 @@ async def _lock_user_row(db: AsyncSession, user_id: int) -> None:
     Мягкая блокировка (сериализация) операций по одному пользователю.
     Берём его строку баланса на UPDATE — чтобы параллельные покупки панелей не "обгоняли" друг друга.
     """
-    await db.execute(
-        text(f"SELECT 1 FROM {settings.DB_SCHEMA_CORE}.balances WHERE telegram_id = :tg FOR UPDATE"),
-        {"tg": user_id}
-    )
+    await db.execute(GET_BALANCE_FOR_UPDATE_STMT, {"tid": user_id})
 
 async def _count_active_panels_user(db: AsyncSession, user_id: int) -> int:
     """
@@ -345,7 +343,7 @@ async def _insert_bonus_transfer_log(db: AsyncSession, from_id: int, to_id: int,
             {
                 "from_id": int(from_id),
                 "to_id": int(to_id),
-                "amount": str(d3(Decimal(amount))),
+                "amount": d3(Decimal(amount)),
                 "reason": reason,
             }
         )
@@ -461,7 +459,7 @@ async def create_order_vip(
         {
             "tg": user_id,
             "asset": pay_asset,
-            "pamt": str(d3(Decimal(payload.pay_amount))),
+            "pamt": d3(Decimal(payload.pay_amount)),
             "addr": (payload.ton_address or ""),
             "ikey": payload.idempotency_key,
         }
@@ -517,7 +515,7 @@ async def create_order_nft(
         {
             "tg": user_id,
             "asset": pay_asset,
-            "pamt": str(d3(Decimal(payload.pay_amount))),
+            "pamt": d3(Decimal(payload.pay_amount)),
             "addr": (payload.ton_address or ""),
             "ikey": payload.idempotency_key,
         }
@@ -969,7 +967,7 @@ async def shop_buy_panels(
                     SET bonus = (COALESCE(bonus,'0')::numeric - :amt)::text
                     WHERE telegram_id = :tg
                 """),
-                {"amt": str(d3(pay_bonus)), "tg": user_id}
+                {"amt": d3(pay_bonus), "tg": user_id}
             )
             # гарантируем запись Банка в balances
             await db.execute(
@@ -987,7 +985,7 @@ async def shop_buy_panels(
                     SET bonus = (COALESCE(bonus,'0')::numeric + :amt)::text
                     WHERE telegram_id = :bank
                 """),
-                {"amt": str(d3(pay_bonus)), "bank": BANK_TELEGRAM_ID}
+                {"amt": d3(pay_bonus), "bank": BANK_TELEGRAM_ID}
             )
             # логирование бонусного расхода
             await _insert_bonus_transfer_log(db, from_id=user_id, to_id=BANK_TELEGRAM_ID, amount=pay_bonus, reason="shop_panel_bonus")
@@ -1002,6 +1000,11 @@ async def shop_buy_panels(
                 {"tg": user_id}
             )
 
+        # 4) Первая панель: активация реферала и бонус инвайтеру — в той же транзакции.
+        #    Ключ 'fp:<user_id>' общий с пакетным начислением планировщика — бонус один.
+        if active_for_user == 0:
+            await mark_user_active_and_reward_referrer(user_id, db)
+
         await db.commit()
 
     except HTTPException:
@@ -1011,8 +1014,8 @@ async def shop_buy_panels(
         raise HTTPException(status_code=400, detail=f"Покупка панелей не удалась: {e}")
 
     # Текущие остатки после покупки
-    q2 = await db.execute(select(Balance).where(Balance.telegram_id == user_id))
-    nb: Optional[Balance] = q2.scalar_one_or_none()
+    # populate_existing: баланс менялся raw SQL — перечитываем поверх identity map
+    nb: Optional[Balance] = await db.get(Balance, user_id, populate_existing=True)
     return {
         "ok": True,
         "panels_bought": qty,
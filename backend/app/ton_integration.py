@@ -57,7 +57,10 @@ import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, select
 
+from .cache import TTLCache
 from .config import get_settings
+from .models import Balance
+from .utils import normalize_ton_address
 
 settings = get_settings()
 
@@ -261,16 +264,9 @@ async def _ensure_user_exists(db: AsyncSession, telegram_id: int) -> None:
 
 
 async def credit_efhc(db: AsyncSession, telegram_id: int, amount_efhc: Decimal) -> None:
-    """Начислить внутренние EFHC пользователю."""
+    """Начислить внутренние EFHC пользователю (upsert-дельта баланса — Balance.apply_delta)."""
     await _ensure_user_exists(db, telegram_id)
-    await db.execute(
-        text("""
-            UPDATE efhc_core.balances
-               SET efhc = COALESCE(efhc, 0) + :amt
-             WHERE telegram_id = :tg
-        """),
-        {"amt": str(_d3(amount_efhc)), "tg": telegram_id},
-    )
+    await Balance.apply_delta(db, telegram_id, d_efhc=_d3(amount_efhc))
     await db.commit()
 
 
@@ -286,6 +282,27 @@ async def set_user_vip(db: AsyncSession, telegram_id: int) -> None:
         {"tg": telegram_id},
     )
     await db.commit()
+    _VIP_CACHE.pop(telegram_id)
+
+
+# Флаг VIP читается почти на каждый запрос WebApp, а меняется редко (проверка NFT / оплата VIP):
+# держим его в памяти воркера. Свой воркер сбрасывает запись в set_user_vip(), остальные
+# подхватят изменение не позже чем через VIP_CACHE_TTL_SECONDS.
+_VIP_CACHE = TTLCache(maxsize=50_000, ttl=settings.VIP_CACHE_TTL_SECONDS)
+
+
+async def is_user_vip(db: AsyncSession, telegram_id: int) -> bool:
+    """Есть ли у пользователя внутренний VIP-флаг (efhc_core.user_vip), с кэшем в памяти."""
+    cached = _VIP_CACHE.get(telegram_id)
+    if cached is not None:
+        return cached
+    q = await db.execute(
+        text("SELECT 1 FROM efhc_core.user_vip WHERE telegram_id = :tg"),
+        {"tg": telegram_id},
+    )
+    vip = q.scalar() is not None
+    _VIP_CACHE.set(telegram_id, vip)
+    return vip
 
 
 # ------------------------------------------------------------
@@ -450,7 +467,7 @@ async def _log_event(
             "eid": event_id,
             "atype": action_type,
             "asset": asset,
-            "amt": str(amount),
+            "amt": amount,
             "dec": decimals,
             "from_addr": from_addr,
             "to_addr": to_addr,
@@ -489,6 +506,8 @@ async def process_incoming_payments(db: AsyncSession, limit: int = 50) -> int:
     if not wallet:
         print("[TON][WARN] TON_WALLET_ADDRESS не задан — обработка TON платежей отключена.")
         return 0
+    # TonAPI отдаёт адреса в raw-форме, в настройках обычно user-friendly → сравниваем канонические
+    wallet_norm = normalize_ton_address(wallet)
 
     try:
         data = await fetch_address_events(address=wallet, limit=limit)
@@ -521,7 +540,7 @@ async def process_incoming_payments(db: AsyncSession, limit: int = 50) -> int:
                 if atype == "TonTransfer" and action.get("TonTransfer"):
                     obj = action["TonTransfer"]
                     to_addr = (obj.get("recipient", {}) or {}).get("address") or ""
-                    if (to_addr or "").lower() != wallet.lower():
+                    if normalize_ton_address(to_addr) != wallet_norm:
                         continue
                     amount_nano = int(obj.get("amount", 0))
                     amount_ton = _decode_ton_amount(amount_nano)
@@ -604,7 +623,7 @@ async def process_incoming_payments(db: AsyncSession, limit: int = 50) -> int:
                     obj = action["JettonTransfer"]
                     jetton_addr = ((obj.get("jetton", {}) or {}).get("address") or "").strip()
                     to_addr = (obj.get("recipient", {}) or {}).get("address") or ""
-                    if (to_addr or "").lower() != wallet.lower():
+                    if normalize_ton_address(to_addr) != wallet_norm:
                         continue
 
                     raw_amount = obj.get("amount") or "0"
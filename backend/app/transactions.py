@@ -21,14 +21,14 @@
 
 from __future__ import annotations
 
-from datetime import datetime
+import json
 from decimal import Decimal, ROUND_DOWN
 from typing import Optional
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select, update
+from sqlalchemy import text, update
 
-from .models import Balance, EFHCTransfersLog, AdminBankConfig
+from .models import SCHEMA, Balance, AdminBankConfig, BALANCE_APPLY_DELTA_STMT, INSERT_LOG_STMT
 
 # -----------------------------------------------------------------------------
 # Вспомогательные константы
@@ -53,7 +53,7 @@ def get_current_bank_id(db: Session) -> int:
     """
     Возвращает актуальный Telegram ID банка (админ-счёт EFHC).
     """
-    cfg = db.execute(select(AdminBankConfig).order_by(AdminBankConfig.updated_at.desc())).scalar_one_or_none()
+    cfg = db.get(AdminBankConfig, 1)  # единственная строка (CHECK id = 1)
     if not cfg:
         raise RuntimeError("Admin bank config not initialized")
     return cfg.current_bank_telegram_id
@@ -67,21 +67,95 @@ def log_transfer(
     reason: str,
     idempotency_key: Optional[str] = None,
     meta: Optional[dict] = None,
-) -> EFHCTransfersLog:
+    order_id: Optional[int] = None,
+    withdraw_id: Optional[int] = None,
+) -> Optional[int]:
     """
-    Создаёт запись в логе EFHCTransfersLog.
+    Создаёт запись в логе EFHCTransfersLog одним запросом (занять ключ ON CONFLICT DO NOTHING → INSERT).
+    order_id / withdraw_id пишутся в типизированные колонки, meta — только для прочего контекста.
+
+    Возвращает id записи или None, если запись с таким idempotency_key уже есть (повтор операции):
+    проверка дубля и вставка — один запрос, без SELECT и без гонки между ними.
+    Списания вызывают его после условного UPDATE баланса (_debit_then_log) — при нехватке средств
+    ни строки лога, ни занятого ключа не остаётся.
     """
-    entry = EFHCTransfersLog(
-        from_id=from_id,
-        to_id=to_id,
-        amount=quantize_amount(amount),
-        reason=reason,
-        idempotency_key=idempotency_key,
-        meta=meta,
-        ts=datetime.utcnow(),
+    return db.execute(
+        INSERT_LOG_STMT,
+        {
+            "from_id": from_id,
+            "to_id": to_id,
+            "amount": quantize_amount(amount),
+            "reason": reason,
+            "idempotency_key": idempotency_key,
+            "order_id": order_id,
+            "withdraw_id": withdraw_id,
+            "meta": json.dumps(meta) if meta else None,
+        },
+    ).scalar_one_or_none()
+
+
+def _debit_balance(db: Session, user_id: int, amount: Decimal, use_bonus: bool) -> bool:
+    """
+    Условное списание одним UPDATE: efhc (или bonus_efhc) -= amount, только если хватает средств.
+    Строка блокируется до конца транзакции — параллельные списания не уводят баланс в минус.
+    False — строки нет или средств не хватает.
+    """
+    col = Balance.bonus_efhc if use_bonus else Balance.efhc
+    res = db.execute(
+        update(Balance)
+        .where(Balance.telegram_id == user_id, col >= amount)
+        .values({col: col - amount})
+        .returning(Balance.telegram_id)
+    )
+    return res.first() is not None
+
+
+def _credit_balance(db: Session, user_id: int, amount: Decimal) -> None:
+    """
+    Зачисление efhc += amount одним upsert-запросом — тот же SQL, что и Balance.apply_delta
+    (здесь синхронная Session). Строка не читается в ORM: параллельные зачисления не теряются,
+    отсутствующая строка balances создаётся.
+    """
+    db.execute(
+        BALANCE_APPLY_DELTA_STMT,
+        {"tid": user_id, "e": amount, "k": Decimal("0"), "b": Decimal("0")},
     )
-    db.add(entry)
-    return entry
+
+
+def _debit_then_log(
+    db: Session,
+    user_id: int,
+    amount: Decimal,
+    use_bonus: bool,
+    insufficient_msg: str,
+    **log_kwargs,
+) -> bool:
+    """
+    Списание user → получатель в одной точке сохранения (SAVEPOINT):
+      1) условный UPDATE баланса (_debit_balance);
+      2) лог + занятие idempotency_key (log_transfer).
+    • Нехватка средств → откат точки сохранения и ValueError(insufficient_msg); лог и ключ не пишутся.
+      Если ключ уже занят прошлым успешным списанием — это повтор, не ошибка (False).
+    • Ключ занят (повтор) → откат списания, False.
+    Возвращает True, если списание проведено.
+    """
+    savepoint = db.begin_nested()
+    if not _debit_balance(db, user_id, amount, use_bonus):
+        savepoint.rollback()
+        key = log_kwargs.get("idempotency_key")
+        if key is not None and db.execute(_IDEM_CLAIMED_SQL, {"key": key}).first() is not None:
+            return False  # повтор после успешного списания — баланс уже уменьшен
+        raise ValueError(insufficient_msg)
+    if log_transfer(db, from_id=user_id, amount=amount, **log_kwargs) is None:
+        savepoint.rollback()
+        return False  # повтор по idempotency_key — списание уже было
+    savepoint.commit()
+    return True
+
+
+_IDEM_CLAIMED_SQL = text(f"""
+    SELECT 1 FROM {SCHEMA}.efhc_transfers_idem WHERE idempotency_key = :key
+""")
 
 
 # -----------------------------------------------------------------------------
@@ -103,22 +177,13 @@ def debit_user_to_bank(
     amount = quantize_amount(amount)
     bank_id = get_current_bank_id(db)
 
-    balance = db.get(Balance, user_id)
-    if not balance:
-        raise ValueError(f"User {user_id} has no balance")
-
-    if use_bonus:
-        if balance.bonus_efhc < amount:
-            raise ValueError("Insufficient bonus EFHC")
-        balance.bonus_efhc -= amount
-    else:
-        if balance.efhc < amount:
-            raise ValueError("Insufficient EFHC")
-        balance.efhc -= amount
-
     # Банк не хранит свой баланс здесь, т.к. банк = просто админ-идентификатор в логах.
     # Для консистентности: можем завести баланс банка как Balance(bank_id), если нужно.
-    log_transfer(db, from_id=user_id, to_id=bank_id, amount=amount, reason=reason, idempotency_key=idempotency_key)
+    _debit_then_log(
+        db, user_id, amount, use_bonus,
+        "Insufficient bonus EFHC" if use_bonus else "Insufficient EFHC",
+        to_id=bank_id, reason=reason, idempotency_key=idempotency_key,
+    )
 
 
 def credit_user_from_bank(
@@ -135,13 +200,11 @@ def credit_user_from_bank(
     amount = quantize_amount(amount)
     bank_id = get_current_bank_id(db)
 
-    balance = db.get(Balance, user_id)
-    if not balance:
-        raise ValueError(f"User {user_id} has no balance")
-
-    balance.efhc += amount
+    if log_transfer(db, from_id=bank_id, to_id=user_id, amount=amount, reason=reason,
+                    idempotency_key=idempotency_key) is None:
+        return  # повтор по idempotency_key
 
-    log_transfer(db, from_id=bank_id, to_id=user_id, amount=amount, reason=reason, idempotency_key=idempotency_key)
+    _credit_balance(db, user_id, amount)
 
 
 def transfer_between_users(
@@ -157,18 +220,11 @@ def transfer_between_users(
     """
     amount = quantize_amount(amount)
 
-    from_balance = db.get(Balance, from_user)
-    to_balance = db.get(Balance, to_user)
-    if not from_balance or not to_balance:
-        raise ValueError("Balances not found")
-
-    if from_balance.efhc < amount:
-        raise ValueError("Insufficient funds")
-
-    from_balance.efhc -= amount
-    to_balance.efhc += amount
+    if not _debit_then_log(db, from_user, amount, False, "Insufficient funds",
+                           to_id=to_user, reason=reason, idempotency_key=idempotency_key):
+        return  # повтор по idempotency_key
 
-    log_transfer(db, from_id=from_user, to_id=to_user, amount=amount, reason=reason, idempotency_key=idempotency_key)
+    _credit_balance(db, to_user, amount)
 
 
 # -----------------------------------------------------------------------------
@@ -230,25 +286,17 @@ def lock_withdrawal(
     При создании заявки на вывод EFHC:
     • EFHC списываются user → Банк (блокируются).
     • reason = 'withdraw_lock'
-    • meta = {"withdraw_id": withdraw_id}
+    • withdraw_id — в типизированную колонку лога
     """
     amount = quantize_amount(amount)
     bank_id = get_current_bank_id(db)
 
-    balance = db.get(Balance, user_id)
-    if not balance or balance.efhc < amount:
-        raise ValueError("Insufficient EFHC")
-
-    balance.efhc -= amount
-
-    log_transfer(
-        db,
-        from_id=user_id,
+    _debit_then_log(
+        db, user_id, amount, False, "Insufficient EFHC",
         to_id=bank_id,
-        amount=amount,
         reason="withdraw_lock",
         idempotency_key=idempotency_key,
-        meta={"withdraw_id": withdraw_id},
+        withdraw_id=withdraw_id,
     )
 
 
@@ -262,26 +310,23 @@ def refund_withdrawal(
     """
     Возврат EFHC пользователю при отклонении/отмене заявки.
     • reason = 'withdraw_refund'
-    • meta = {"withdraw_id": withdraw_id}
+    • withdraw_id — в типизированную колонку лога
     """
     amount = quantize_amount(amount)
     bank_id = get_current_bank_id(db)
 
-    balance = db.get(Balance, user_id)
-    if not balance:
-        raise ValueError(f"User {user_id} has no balance")
-
-    balance.efhc += amount
-
-    log_transfer(
+    if log_transfer(
         db,
         from_id=bank_id,
         to_id=user_id,
         amount=amount,
         reason="withdraw_refund",
         idempotency_key=idempotency_key,
-        meta={"withdraw_id": withdraw_id},
-    )
+        withdraw_id=withdraw_id,
+    ) is None:
+        return  # повтор по idempotency_key
+
+    _credit_balance(db, user_id, amount)
 
 
 # -----------------------------------------------------------------------------
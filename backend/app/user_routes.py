@@ -35,7 +35,7 @@
 #       - /user/tasks/complete — отметить выполнение и начислить bonus EFHC (reward_bonus_efhc).
 #   • Лотереи:
 #       - /user/lotteries — список активных.
-#       - /user/lottery/buy — покупка билета (можно использовать EFHC с баланса).
+#       - /user/lottery/buy — покупка билетов, до LOTTERY_MAX_TICKETS_PER_USER на пользователя в лотерее (можно использовать EFHC с баланса).
 #       - Закрытие и выбор победителя делает scheduler.draw_lotteries().
 #
 # Связь с другими файлами:
@@ -80,8 +80,11 @@ from pydantic import BaseModel, Field
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .cache import TTLCache
 from .config import get_settings
 from .database import get_session
+from .ton_integration import is_user_vip
+from .utils import can_buy_more_tickets
 
 # -----------------------------------------------------------------------------
 # Настройки и константы
@@ -94,6 +97,15 @@ SCHEMA_LOTTERY = settings.DB_SCHEMA_LOTTERY or "efhc_lottery"
 SCHEMA_REFERRAL = settings.DB_SCHEMA_REFERRAL or "efhc_referrals"
 SCHEMA_ADMIN = settings.DB_SCHEMA_ADMIN or "efhc_admin"
 
+# Список активных заданий одинаков для всех пользователей и меняется только из админки:
+# держим в памяти воркера (TTL), админские ручки сбрасывают через invalidate_active_tasks_cache().
+_ACTIVE_TASKS_CACHE = TTLCache(maxsize=1, ttl=settings.DIMENSION_CACHE_TTL_SECONDS)
+
+
+def invalidate_active_tasks_cache() -> None:
+    """Сбросить кэш списка активных заданий (после создания/изменения задания)."""
+    _ACTIVE_TASKS_CACHE.clear()
+
 # Единый тип панелей:
 PANEL_PRICE_EFHC = Decimal(str(settings.PANEL_PRICE_EFHC or "100"))       # цена за 1 панель в EFHC
 PANEL_DAILY_KWH = Decimal(str(settings.PANEL_DAILY_KWH or "0.598"))       # генерация kWh/сутки на 1 панель (для scheduler)
@@ -401,7 +413,7 @@ async def _update_balance(db: AsyncSession, telegram_id: int, efhc_delta: Decima
                    kwh = COALESCE(kwh, 0) + :d_k
              WHERE telegram_id = :tg
         """),
-        {"tg": telegram_id, "d_e": str(d3(efhc_delta)), "d_b": str(d3(bonus_delta)), "d_k": str(d3(kwh_delta))},
+        {"tg": telegram_id, "d_e": d3(efhc_delta), "d_b": d3(bonus_delta), "d_k": d3(kwh_delta)},
     )
 
 async def _get_panels_count(db: AsyncSession, telegram_id: int) -> int:
@@ -468,6 +480,9 @@ class ReferralsResponse(BaseModel):
     total_referrals: int
     total_panels_by_refs: int
 
+class RatingResponse(BaseModel):
+    items: List[Dict[str, Any]]
+
 class TasksResponse(BaseModel):
     items: List[Dict[str, Any]]
 
@@ -483,6 +498,7 @@ class LotteriesResponse(BaseModel):
 
 class LotteryBuyRequest(BaseModel):
     code: str
+    count: int = Field(1, ge=1, le=settings.LOTTERY_MAX_TICKETS_PER_USER, description="сколько билетов за раз")
     pay_with: str = Field("EFHC", description="чем платим: в текущей версии EFHC")
 
 class LotteryBuyResponse(BaseModel):
@@ -558,12 +574,8 @@ async def user_register(
     bal = await _get_balance(db, telegram_id)
     panels = await _get_panels_count(db, telegram_id)
 
-    # VIP флаг
-    q_v = await db.execute(
-        text(f"SELECT 1 FROM {SCHEMA_CORE}.user_vip WHERE telegram_id = :tg"),
-        {"tg": telegram_id},
-    )
-    vip = q_v.scalar() is not None
+    # VIP флаг (кэш в памяти воркера, см. ton_integration.is_user_vip)
+    vip = await is_user_vip(db, telegram_id)
 
     await db.commit()
     return {
@@ -599,11 +611,7 @@ async def user_balance(
     bal = await _get_balance(db, telegram_id)
     panels = await _get_panels_count(db, telegram_id)
 
-    q_v = await db.execute(
-        text(f"SELECT 1 FROM {SCHEMA_CORE}.user_vip WHERE telegram_id = :tg"),
-        {"tg": telegram_id},
-    )
-    vip = q_v.scalar() is not None
+    vip = await is_user_vip(db, telegram_id)
 
     await db.commit()
     return BalanceResponse(
@@ -643,30 +651,38 @@ async def user_exchange(
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be > 0")
 
-    # Получим текущие значения
-    q = await db.execute(
-        text(f"SELECT efhc, kwh FROM {SCHEMA_CORE}.balances WHERE telegram_id = :tg"),
-        {"tg": telegram_id},
-    )
-    row = q.fetchone()
-    efhc_cur = Decimal(row[0] or 0) if row else Decimal("0.000")
-    kwh_cur = Decimal(row[1] or 0) if row else Decimal("0.000")
-
+    # Одним условным UPDATE ... RETURNING: проверка остатка, списание/зачисление и новый баланс.
+    # Без предварительного SELECT — арифметика на стороне БД, блокировка строки держится один запрос.
     if payload.direction == "efhc_to_kwh":
-        # Проверка: хватает ли EFHC
-        if efhc_cur < amount:
-            raise HTTPException(status_code=400, detail="Insufficient EFHC balance")
         # 1 EFHC -> 1 kWh
-        await _update_balance(db, telegram_id, efhc_delta=-amount, kwh_delta=amount)
+        sql, detail = _EXCHANGE_EFHC_TO_KWH_SQL, "Insufficient EFHC balance"
     else:
         # kwh_to_efhc
-        if kwh_cur < amount:
-            raise HTTPException(status_code=400, detail="Insufficient kWh balance")
-        await _update_balance(db, telegram_id, efhc_delta=amount, kwh_delta=-amount)
+        sql, detail = _EXCHANGE_KWH_TO_EFHC_SQL, "Insufficient kWh balance"
+    row = (await db.execute(sql, {"tg": telegram_id, "amt": amount})).fetchone()
+    if row is None:
+        raise HTTPException(status_code=400, detail=detail)
 
-    bal = await _get_balance(db, telegram_id)
     await db.commit()
-    return ExchangeResponse(ok=True, efhc=bal["efhc"], kwh=bal["kwh"], bonus=bal["bonus"])
+    efhc, bonus, kwh = (Decimal(row[0] or 0), Decimal(row[1] or 0), Decimal(row[2] or 0))
+    return ExchangeResponse(ok=True, efhc=f"{d3(efhc):.3f}", kwh=f"{d3(kwh):.3f}", bonus=f"{d3(bonus):.3f}")
+
+
+_EXCHANGE_EFHC_TO_KWH_SQL = text(f"""
+    UPDATE {SCHEMA_CORE}.balances
+       SET efhc = efhc - :amt,
+           kwh = COALESCE(kwh, 0) + :amt
+     WHERE telegram_id = :tg AND efhc >= :amt
+    RETURNING efhc, bonus, kwh
+""")
+
+_EXCHANGE_KWH_TO_EFHC_SQL = text(f"""
+    UPDATE {SCHEMA_CORE}.balances
+       SET kwh = kwh - :amt,
+           efhc = COALESCE(efhc, 0) + :amt
+     WHERE telegram_id = :tg AND kwh >= :amt
+    RETURNING efhc, bonus, kwh
+""")
 
 # -----------------------------------------------------------------------------
 # Эндпоинт: /user/panels — список/количество панелей
@@ -827,6 +843,37 @@ async def user_referrals(
     await db.commit()
     return ReferralsResponse(code=code, total_referrals=total_refs, total_panels_by_refs=total_panels_by_refs)
 
+# -----------------------------------------------------------------------------
+# Эндпоинт: /user/rating — рейтинг по kwh_total (из mv_leaderboard_kwh)
+# -----------------------------------------------------------------------------
+@router.get("/user/rating", response_model=RatingResponse)
+async def user_rating(
+    limit: int = 100,
+    db: AsyncSession = Depends(get_session),
+    x_tg_init_data: Optional[str] = Header(None, convert_underscores=False, alias="X-Telegram-Init-Data")
+):
+    """
+    Топ пользователей по суммарной генерации kWh. Данные — снимок mv_leaderboard_kwh
+    (обновляется планировщиком раз в LEADERBOARD_REFRESH_MINUTES), чтение по индексу rank.
+    """
+    await _verify_webapp_request(x_tg_init_data, settings_token=settings.TELEGRAM_BOT_TOKEN)
+    limit = max(1, min(limit, settings.LEADERBOARD_TOP_LIMIT))
+
+    q = await db.execute(
+        text(f"""
+            SELECT rank, telegram_id, kwh_total
+              FROM {SCHEMA_CORE}.mv_leaderboard_kwh
+             WHERE rank <= :lim
+             ORDER BY rank
+        """),
+        {"lim": limit},
+    )
+    items = [
+        {"rank": int(r[0]), "telegram_id": int(r[1]), "kwh_total": f"{Decimal(r[2]):.3f}"}
+        for r in q.fetchall()
+    ]
+    return RatingResponse(items=items)
+
 # -----------------------------------------------------------------------------
 # Эндпоинт: /user/tasks — список активных задач
 # -----------------------------------------------------------------------------
@@ -846,22 +893,25 @@ async def user_tasks_list(
     await ensure_user_routes_tables(db)
     await _ensure_user_exists(db, telegram_id, username)
 
-    q = await db.execute(
-        text(f"""
-            SELECT id, title, url, reward_bonus_efhc
-              FROM {SCHEMA_TASKS}.tasks
-             WHERE active = TRUE
-             ORDER BY id ASC
-        """)
-    )
-    items = []
-    for r in q.all() or []:
-        items.append({
-            "id": int(r[0]),
-            "title": r[1],
-            "url": r[2],
-            "reward_bonus_efhc": f"{d3(Decimal(r[3] or 0)):.3f}"
-        })
+    items = _ACTIVE_TASKS_CACHE.get("active")
+    if items is None:
+        q = await db.execute(
+            text(f"""
+                SELECT id, title, url, reward_bonus_efhc
+                  FROM {SCHEMA_TASKS}.tasks
+                 WHERE active = TRUE
+                 ORDER BY id ASC
+            """)
+        )
+        items = []
+        for r in q.all() or []:
+            items.append({
+                "id": int(r[0]),
+                "title": r[1],
+                "url": r[2],
+                "reward_bonus_efhc": f"{d3(Decimal(r[3] or 0)):.3f}"
+            })
+        _ACTIVE_TASKS_CACHE.set("active", items)
     await db.commit()
     return TasksResponse(items=items)
 
@@ -885,45 +935,44 @@ async def user_task_complete(
     await ensure_user_routes_tables(db)
     await _ensure_user_exists(db, telegram_id, username)
 
-    # Найдём награду
-    q = await db.execute(
-        text(f"SELECT reward_bonus_efhc FROM {SCHEMA_TASKS}.tasks WHERE id = :tid AND active = TRUE"),
-        {"tid": payload.task_id},
-    )
-    row = q.fetchone()
-    if not row:
+    # Один запрос: награда задания → фиксация выполнения (повтор отсекает uq_user_tasks_user_task —
+    # migrations/0029, ON CONFLICT без предварительного SELECT) → начисление bonus только если строка
+    # реально вставлена.
+    # Награда округляется вниз до 0.001 (trunc), как d3().
+    q = await db.execute(_TASK_COMPLETE_SQL, {"tg": telegram_id, "tid": payload.task_id})
+    reward_raw, completed = q.one()
+    if reward_raw is None:
         raise HTTPException(status_code=404, detail="Task not found or not active")
 
-    reward = d3(Decimal(row[0] or 0))
+    reward = d3(Decimal(reward_raw))
     if reward <= 0:
         raise HTTPException(status_code=400, detail="Task reward is zero")
-
-    # Запретить повторное выполнение — проверим наличие записи
-    q2 = await db.execute(
-        text(f"""
-            SELECT 1 FROM {SCHEMA_TASKS}.user_tasks
-             WHERE telegram_id = :tg AND task_id = :tid
-        """),
-        {"tg": telegram_id, "tid": payload.task_id},
-    )
-    if q2.scalar():
+    if not completed:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Task already completed")
 
-    # Начисляем bonus EFHC
-    await _update_balance(db, telegram_id, bonus_delta=reward)
-
-    # Фиксируем выполнение
-    await db.execute(
-        text(f"""
-            INSERT INTO {SCHEMA_TASKS}.user_tasks (telegram_id, task_id)
-            VALUES (:tg, :tid)
-        """),
-        {"tg": telegram_id, "tid": payload.task_id},
-    )
-
     await db.commit()
     return TaskCompleteResponse(ok=True, reward_bonus_efhc=f"{reward:.3f}")
 
+_TASK_COMPLETE_SQL = text(f"""
+    WITH t AS (
+        SELECT id, trunc(COALESCE(reward_bonus_efhc, 0), 3) AS reward
+          FROM {SCHEMA_TASKS}.tasks
+         WHERE id = :tid AND active = TRUE
+    ), ins AS (
+        INSERT INTO {SCHEMA_TASKS}.user_tasks (telegram_id, task_id)
+        SELECT :tg, id FROM t WHERE reward > 0
+        ON CONFLICT (telegram_id, task_id) DO NOTHING
+        RETURNING task_id
+    ), bal AS (
+        UPDATE {SCHEMA_CORE}.balances
+           SET bonus = COALESCE(bonus, 0) + (SELECT reward FROM t)
+         WHERE telegram_id = :tg AND EXISTS (SELECT 1 FROM ins)
+        RETURNING 1
+    )
+    SELECT (SELECT reward FROM t), EXISTS (SELECT 1 FROM ins)
+""")
+
 # -----------------------------------------------------------------------------
 # Эндпоинт: /user/lotteries — активные лотереи
 # -----------------------------------------------------------------------------
@@ -973,7 +1022,8 @@ async def user_lottery_buy(
     x_tg_init_data: Optional[str] = Header(None, convert_underscores=False, alias="X-Telegram-Init-Data")
 ):
     """
-    Покупка 1 билета лотереи code.
+    Покупка count билетов лотереи code (1..LOTTERY_MAX_TICKETS_PER_USER) — фиксированное число
+    запросов независимо от count: место, списание, билеты одним INSERT ... generate_series.
     В текущей версии оплата EFHC; можно расширить на bonus EFHC при желании.
     ВАЖНО: цену билета лучше хранить в lotteries (отдельное поле), но сейчас используем 1 EFHC для примера.
     **Уточните цену билета лотереи.** Здесь поставим 1 EFHC как дефолт.
@@ -987,62 +1037,84 @@ async def user_lottery_buy(
     await ensure_user_routes_tables(db)
     await _ensure_user_exists(db, telegram_id, username)
 
-    # Проверим, что лотерея активна
+    # Занимаем места в лотерее условным UPDATE: активна и вмещает count билетов
+    # (tickets_sold + count <= target_participants, 0 — без лимита). Заполненность — сравнение колонок строки, без подсчёта lottery_tickets.
     q = await db.execute(
         text(f"""
-            SELECT active, tickets_sold, target_participants
-              FROM {SCHEMA_LOTTERY}.lotteries
+            UPDATE {SCHEMA_LOTTERY}.lotteries
+               SET tickets_sold = tickets_sold + :n
              WHERE code = :code
+               AND active
+               AND (target_participants <= 0 OR tickets_sold + :n <= target_participants)
+            RETURNING tickets_sold
         """),
-        {"code": payload.code}
+        {"code": payload.code, "n": payload.count},
     )
-    row = q.fetchone()
-    if not row:
-        raise HTTPException(status_code=404, detail="Lottery not found")
-    active, tickets_sold, target_participants = bool(row[0]), int(row[1] or 0), int(row[2] or 0)
-    if not active:
-        raise HTTPException(status_code=400, detail="Lottery is not active")
-
-    # Проверим баланс EFHC
+    ts = q.scalar()
+    if ts is None:
+        # Редкий путь: уточняем причину отказа
+        q = await db.execute(
+            text(f"SELECT active FROM {SCHEMA_LOTTERY}.lotteries WHERE code = :code"),
+            {"code": payload.code},
+        )
+        row = q.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Lottery not found")
+        if not bool(row[0]):
+            raise HTTPException(status_code=400, detail="Lottery is not active")
+        raise HTTPException(status_code=400, detail="Lottery is full")
+    ts = int(ts)
+
+    # Списываем EFHC условным UPDATE (без предварительного SELECT) — только если хватает средств
+    # и билетов пользователя в этой лотерее с новыми не больше LOTTERY_MAX_TICKETS_PER_USER.
+    # Строка лотереи уже заблокирована UPDATE выше: параллельные покупки той же лотереи ждут
+    # commit, и этот (следующий) запрос видит их билеты — лимит не обходится повторными покупками.
+    # Отказ — исключение, транзакция откатывается вместе с занятым местом.
+    # Отрицательный остаток дополнительно отсекает CHECK ck_balances_nonneg.
     q2 = await db.execute(
-        text(f"SELECT efhc FROM {SCHEMA_CORE}.balances WHERE telegram_id = :tg"),
-        {"tg": telegram_id},
+        _LOTTERY_DEBIT_SQL,
+        {
+            "tg": telegram_id,
+            "code": payload.code,
+            "n": payload.count,
+            "max": settings.LOTTERY_MAX_TICKETS_PER_USER,
+            "price": TICKET_PRICE_EFHC * payload.count,
+        },
     )
-    row2 = q2.fetchone()
-    efhc_cur = Decimal(row2[0] or 0) if row2 else Decimal("0.000")
-    if efhc_cur < TICKET_PRICE_EFHC:
+    mine, efhc_after = q2.one()
+    if not can_buy_more_tickets(int(mine), payload.count):
+        raise HTTPException(status_code=400, detail="Ticket limit per user reached")
+    if efhc_after is None:
         raise HTTPException(status_code=400, detail="Insufficient EFHC")
 
-    # Списываем EFHC и создаём билет
-    await _update_balance(db, telegram_id, efhc_delta=-TICKET_PRICE_EFHC)
+    # Создаём билеты — один INSERT на все count строк
     await db.execute(
         text(f"""
             INSERT INTO {SCHEMA_LOTTERY}.lottery_tickets (lottery_code, telegram_id)
-            VALUES (:code, :tg)
+            SELECT :code, :tg FROM generate_series(1, :n)
         """),
-        {"code": payload.code, "tg": telegram_id},
-    )
-    # Обновляем счётчик tickets_sold
-    await db.execute(
-        text(f"""
-            UPDATE {SCHEMA_LOTTERY}.lotteries
-               SET tickets_sold = tickets_sold + 1
-             WHERE code = :code
-        """),
-        {"code": payload.code},
+        {"code": payload.code, "tg": telegram_id, "n": payload.count},
     )
 
-    # Возвращаем текущее число билетов
-    q3 = await db.execute(
-        text(f"SELECT tickets_sold FROM {SCHEMA_LOTTERY}.lotteries WHERE code = :code"),
-        {"code": payload.code},
-    )
-    ts = int(q3.scalar() or 0)
-
     bal = await _get_balance(db, telegram_id)
     await db.commit()
     return LotteryBuyResponse(ok=True, tickets_sold=ts, efhc=bal["efhc"])
 
+_LOTTERY_DEBIT_SQL = text(f"""
+    WITH mine AS (
+        SELECT count(*) AS n
+          FROM {SCHEMA_LOTTERY}.lottery_tickets
+         WHERE lottery_code = :code AND telegram_id = :tg
+    ), upd AS (
+        UPDATE {SCHEMA_CORE}.balances
+           SET efhc = efhc - :price
+         WHERE telegram_id = :tg AND efhc >= :price
+           AND (SELECT n FROM mine) + :n <= :max
+        RETURNING efhc
+    )
+    SELECT (SELECT n FROM mine), (SELECT efhc FROM upd)
+""")
+
 # -----------------------------------------------------------------------------
 # Эндпоинт: /user/withdraw — заявка на вывод EFHC (через TON/Jetton)
 # -----------------------------------------------------------------------------
@@ -1104,7 +1176,7 @@ async def user_withdraw(
             VALUES (:tg, :amt, :dst, :memo)
             RETURNING id
         """),
-        {"tg": telegram_id, "amt": str(amount), "dst": payload.to_wallet, "memo": payload.memo or None},
+        {"tg": telegram_id, "amt": amount, "dst": payload.to_wallet, "memo": payload.memo or None},
     )
     req_id = int(res.fetchone()[0])
 
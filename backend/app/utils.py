@@ -5,6 +5,7 @@
 # - split_spend (списание бонусных/основных EFHC),
 # - округление до 3х знаков (q3),
 # - генерация ID (UUID),
+# - нормализация TON-адресов (normalize_ton_address),
 # - валидация сумм, проверка лимитов,
 # - простая локализация (8 языков) для статичных фрагментов (бот и WebApp),
 # - хелперы для прогресса уровня, расчёта генерации, проверки лимитов лотереи.
@@ -12,6 +13,9 @@
 from __future__ import annotations
 from decimal import Decimal, ROUND_HALF_UP, getcontext
 from typing import Dict, Any, Optional, Tuple, List
+import base64
+import binascii
+import re
 import uuid
 from .config import get_settings
 
@@ -48,6 +52,37 @@ def gen_uuid() -> str:
     """Генерация человекочитаемого UUID (для внутренних меток)."""
     return str(uuid.uuid4())
 
+# =========================
+# 👛 TON-адреса
+# =========================
+# workchain raw-адреса: только ASCII-цифры со знаком ("--1" и "²" — не workchain)
+_WORKCHAIN_RE = re.compile(r"-?[0-9]+")
+
+def normalize_ton_address(address: Optional[str]) -> Optional[str]:
+    """
+    Каноническая форма TON-адреса для поиска/сравнения: raw «workchain:hex» в нижнем регистре.
+      • user-friendly (48 символов base64/base64url, bounceable или нет) → декодируется в raw;
+      • raw («0:ABCD…») → приводится к нижнему регистру;
+      • нераспознанная строка → strip().lower() (сравнение хотя бы без учёта регистра).
+    Для любой строки не бросает исключений: одна битая строка whitelist не ломает сверку остальных.
+    """
+    if not address:
+        return None
+    s = address.strip()
+    if ":" in s:
+        wc, _, h = s.partition(":")
+        return f"{int(wc)}:{h.lower()}" if _WORKCHAIN_RE.fullmatch(wc) else s.lower()
+    if len(s) == 48:
+        try:
+            raw = base64.urlsafe_b64decode(s.replace("+", "-").replace("/", "_"))
+        except (ValueError, binascii.Error):
+            return s.lower()
+        if len(raw) == 36:
+            # flags(1) | workchain(1, signed) | account_id(32) | crc16(2)
+            wc = raw[1] - 256 if raw[1] > 127 else raw[1]
+            return f"{wc}:{raw[2:34].hex()}"
+    return s.lower()
+
 # =========================
 # 📈 Прогресс уровня
 # =========================
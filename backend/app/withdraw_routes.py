@@ -61,7 +61,7 @@ import re
 import httpx
 from fastapi import APIRouter, Depends, Header, HTTPException, Query, Path
 from pydantic import BaseModel, Field, condecimal
-from sqlalchemy import text, select, update
+from sqlalchemy import text, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .database import get_session
@@ -334,8 +334,7 @@ async def create_withdraw(
             }
 
     # Проверим баланс EFHC пользователя (именно EFHC, не бонус!)
-    q2 = await db.execute(select(Balance).where(Balance.telegram_id == user_id))
-    bal: Optional[Balance] = q2.scalar_one_or_none()
+    bal: Optional[Balance] = await db.get(Balance, user_id)
     if not bal:
         raise HTTPException(status_code=400, detail="Баланс не найден")
 
@@ -365,7 +364,7 @@ async def create_withdraw(
             {
                 "tg": user_id,
                 "addr": payload.ton_address.strip(),
-                "amt": str(amount),
+                "amt": amount,
                 "ikey": payload.idempotency_key,
             },
         )
@@ -0,0 +1,107 @@
+# 📂 backend/tests/conftest.py — общие фикстуры тестов
+# -----------------------------------------------------------------------------
+# • count_queries — счётчик SQL движка внутри блока (проверка N+1 и числа запросов на путь).
+# • orm_engine / orm_session — SQLite в памяти со схемой efhc_core (ATTACH) и таблицами
+#   users/balances/panels: достаточно для проверки стратегий загрузки связей ORM без PostgreSQL.
+# • pg_run — сценарий на реальном PostgreSQL (TEST_DATABASE_URL) внутри внешней транзакции,
+#   которая откатывается после теста; без TEST_DATABASE_URL такие тесты пропускаются.
+
+import asyncio
+import os
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, List
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import CITEXT
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, StaticPool
+
+from app.models import SCHEMA, Balance, Panel, User
+
+
+@compiles(CITEXT, "sqlite")
+def _citext_sqlite(type_, compiler, **kw):
+    return "TEXT"
+
+
+@pytest.fixture
+def count_queries():
+    """
+    Фабрика контекст-менеджера: собирает SQL, выполненные движком внутри блока.
+        with count_queries(engine) as stmts:
+            ...
+        assert len(stmts) == 1
+    Принимает Engine или AsyncEngine.
+    """
+    @contextmanager
+    def _count(engine) -> Iterator[List[str]]:
+        sync_engine = getattr(engine, "sync_engine", engine)
+        statements: List[str] = []
+
+        def _on_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(sync_engine, "before_cursor_execute", _on_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(sync_engine, "before_cursor_execute", _on_execute)
+
+    return _count
+
+
+@pytest.fixture
+def orm_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _attach_schema(dbapi_conn, _record):
+        dbapi_conn.execute(f"ATTACH DATABASE ':memory:' AS {SCHEMA}")
+
+    User.metadata.create_all(engine, tables=[User.__table__, Balance.__table__, Panel.__table__])
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def orm_session(orm_engine):
+    with Session(orm_engine) as session:
+        yield session
+
+
+@pytest.fixture
+def pg_run():
+    """
+    Запуск async-сценария на PostgreSQL из TEST_DATABASE_URL (postgresql+asyncpg://...):
+        result = pg_run(lambda db: some_service(db, ...))
+    Сессия привязана к внешней транзакции соединения (join_transaction_mode="create_savepoint"):
+    commit() внутри кода фиксирует только SAVEPOINT, а всё созданное тестом (включая DDL)
+    откатывается в конце — база остаётся чистой.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL не задан — тест требует PostgreSQL")
+
+    def _run(scenario: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        async def _main() -> Any:
+            engine = create_async_engine(url, poolclass=NullPool)
+            try:
+                async with engine.connect() as conn:
+                    outer = await conn.begin()
+                    session = AsyncSession(
+                        bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False
+                    )
+                    try:
+                        return await scenario(session)
+                    finally:
+                        await session.close()
+                        await outer.rollback()
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(_main())
+
+    return _run
@@ -0,0 +1,26 @@
+# 📂 backend/tests/test_cache.py — in-process TTL-кэш (cache.py)
+# -----------------------------------------------------------------------------
+# • при переполнении вытесняется раньше всех записанная запись; перезапись ключа делает его «свежим»;
+# • просроченная запись не отдаётся.
+
+from unittest import mock
+
+from app import cache
+from app.cache import TTLCache
+
+
+def test_evicts_oldest_written_entry():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.set("a", 10)  # перезапись — «a» теперь новее «b»
+    c.set("c", 3)
+    assert (c.get("a"), c.get("b"), c.get("c")) == (10, None, 3)
+
+
+def test_expired_entry_is_a_miss():
+    c = TTLCache(maxsize=2, ttl=5)
+    with mock.patch.object(cache.time, "monotonic", return_value=100.0):
+        c.set("a", 1)
+    with mock.patch.object(cache.time, "monotonic", return_value=106.0):
+        assert c.get("a", "miss") == "miss"
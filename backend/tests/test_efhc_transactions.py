@@ -0,0 +1,87 @@
+# 📂 backend/tests/test_efhc_transactions.py — операции с банком EFHC на PostgreSQL (efhc_transactions.py)
+# -----------------------------------------------------------------------------
+# • credit_user_from_bank — банк списывается условным UPDATE, пользователь получает upsert-дельту;
+#   под ck_balances_nonneg (миграция 0002) ни один запрос не несёт отрицательную строку.
+# • exchange_kwh_to_efhc — kWh → EFHC у пользователя одним условным UPDATE, kwh_total не меняется;
+#   нехватка kWh — ValueError, балансы не тронуты.
+# Нужен TEST_DATABASE_URL (см. conftest.pg_run). Таблицы — минимальные копии нужных колонок.
+
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from app import efhc_transactions
+from app.models import SCHEMA
+
+BANK = efhc_transactions.BANK_ID
+USER = 1001
+
+DDL = (
+    f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}",
+    f"""CREATE TABLE {SCHEMA}.balances (
+        telegram_id BIGINT PRIMARY KEY,
+        efhc NUMERIC(30, 8) NOT NULL DEFAULT 0,
+        bonus_efhc NUMERIC(30, 8) NOT NULL DEFAULT 0,
+        kwh NUMERIC(30, 8) NOT NULL DEFAULT 0,
+        kwh_total NUMERIC(30, 8) NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ,
+        CONSTRAINT ck_balances_nonneg CHECK (efhc >= 0 AND bonus_efhc >= 0 AND kwh >= 0)
+    )""",
+    f"CREATE TABLE {SCHEMA}.efhc_transfers_idem (idempotency_key VARCHAR(128) PRIMARY KEY)",
+    f"""CREATE TABLE {SCHEMA}.efhc_transfers_log (
+        id BIGSERIAL PRIMARY KEY, from_id BIGINT, to_id BIGINT, amount NUMERIC(30, 8), reason TEXT,
+        idempotency_key VARCHAR(128), order_id BIGINT, withdraw_id BIGINT, meta JSONB,
+        ts TIMESTAMPTZ NOT NULL DEFAULT now()
+    )""",
+)
+
+
+async def _setup(db, user_kwh: str = "0") -> None:
+    for ddl in DDL:
+        await db.execute(text(ddl))
+    await db.execute(
+        text(f"INSERT INTO {SCHEMA}.balances (telegram_id, efhc) VALUES (:bank, 100)"), {"bank": BANK}
+    )
+    if user_kwh != "0":
+        await db.execute(
+            text(f"INSERT INTO {SCHEMA}.balances (telegram_id, kwh, kwh_total) VALUES (:tg, :k, :k)"),
+            {"tg": USER, "k": Decimal(user_kwh)},
+        )
+    await db.commit()
+
+
+async def _state(db):
+    rows = await db.execute(text(f"SELECT telegram_id, efhc, kwh, kwh_total FROM {SCHEMA}.balances ORDER BY 1"))
+    logged = (await db.execute(text(f"SELECT count(*) FROM {SCHEMA}.efhc_transfers_log"))).scalar_one()
+    return {int(r[0]): (Decimal(r[1]), Decimal(r[2]), Decimal(r[3])) for r in rows}, logged
+
+
+def test_credit_user_from_bank_moves_efhc_under_check(pg_run):
+    async def scenario(db):
+        await _setup(db)
+        await efhc_transactions.credit_user_from_bank(db, USER, Decimal("2.5"))
+        return await _state(db)
+
+    balances, logged = pg_run(scenario)
+    assert balances[BANK][0] == Decimal("97.5")
+    assert balances[USER][0] == Decimal("2.5")  # строки не было — создана upsert-дельтой
+    assert logged == 1
+
+
+def test_exchange_kwh_to_efhc_and_insufficient_kwh(pg_run):
+    async def scenario(db):
+        await _setup(db, user_kwh="3")
+        await efhc_transactions.exchange_kwh_to_efhc(db, USER, Decimal("2"))
+        exchanged = await _state(db)
+        with pytest.raises(ValueError):
+            await efhc_transactions.exchange_kwh_to_efhc(db, USER, Decimal("1.5"))
+        await db.rollback()
+        return exchanged, await _state(db)
+
+    exchanged, refused = pg_run(scenario)
+    balances, logged = exchanged
+    assert balances[USER] == (Decimal("2"), Decimal("1"), Decimal("3"))  # kwh_total не уменьшается
+    assert balances[BANK][0] == Decimal("98")
+    assert logged == 1
+    assert refused == exchanged
@@ -0,0 +1,61 @@
+# 📂 backend/tests/test_models_loading.py — загрузка связей User без N+1
+# -----------------------------------------------------------------------------
+# Связи User объявлены lazy="raise_on_sql": обход списка без явной загрузки падает, а joinedload /
+# selectinload дают фиксированное число запросов независимо от числа пользователей.
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import Balance, Panel, User
+
+
+def _seed(session, users: int, panels_per_user: int = 2) -> None:
+    expires = datetime.now(timezone.utc) + timedelta(days=180)
+    panel_id = 0
+    for tg in range(1, users + 1):
+        session.add(User(telegram_id=tg))
+        session.add(Balance(telegram_id=tg, efhc=Decimal("1"), bonus_efhc=Decimal("0"), kwh=Decimal("0")))
+        for _ in range(panels_per_user):
+            panel_id += 1  # BIGINT PK в SQLite не автоинкрементный
+            session.add(Panel(id=panel_id, telegram_id=tg, expires_at=expires))
+    session.commit()
+    session.expunge_all()
+
+
+@pytest.mark.parametrize("users", [1, 25])
+def test_joinedload_balance_is_one_query(orm_engine, orm_session, count_queries, users):
+    _seed(orm_session, users)
+
+    with count_queries(orm_engine) as stmts:
+        rows = orm_session.execute(select(User).options(joinedload(User.balance))).scalars().all()
+        total = sum(u.balance.efhc for u in rows)
+
+    assert total == users
+    assert len(stmts) == 1
+
+
+@pytest.mark.parametrize("users", [1, 25])
+def test_selectinload_panels_is_two_queries(orm_engine, orm_session, count_queries, users):
+    _seed(orm_session, users, panels_per_user=3)
+
+    with count_queries(orm_engine) as stmts:
+        rows = orm_session.execute(select(User).options(selectinload(User.panels))).scalars().all()
+        total = sum(len(u.panels) for u in rows)
+
+    assert total == users * 3
+    assert len(stmts) == 2
+
+
+def test_lazy_relationship_access_raises(orm_engine, orm_session, count_queries):
+    _seed(orm_session, 3)
+
+    rows = orm_session.execute(select(User)).scalars().all()
+    with count_queries(orm_engine) as stmts:
+        with pytest.raises(InvalidRequestError):
+            rows[0].panels
+    assert stmts == []
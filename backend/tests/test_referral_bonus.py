@@ -0,0 +1,76 @@
+# 📂 backend/tests/test_referral_bonus.py — пакетное начисление реферальных бонусов на PostgreSQL
+# -----------------------------------------------------------------------------
+# • ReferralBonusLog.award_first_panel_bonuses — 'first_panel' за каждого нового активного реферала
+#   и пороговый бонус за каждый порог REFERRAL_MILESTONES, пройденный пачкой (9 → 11 платит порог 10);
+#   повторный запуск ничего не начисляет.
+# Нужен TEST_DATABASE_URL (см. conftest.pg_run). Таблицы — минимальные копии нужных колонок.
+
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app.models import SCHEMA, ReferralBonusLog
+
+DDL = (
+    f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}",
+    f"CREATE TABLE {SCHEMA}.users (telegram_id BIGINT PRIMARY KEY, active_referral_count INT NOT NULL DEFAULT 0)",
+    f"CREATE TABLE {SCHEMA}.panels (id BIGSERIAL PRIMARY KEY, telegram_id BIGINT NOT NULL)",
+    f"""CREATE TABLE {SCHEMA}.referrals (
+        inviter_id BIGINT, invitee_id BIGINT PRIMARY KEY, activated_at TIMESTAMPTZ
+    )""",
+    f"CREATE TABLE {SCHEMA}.referral_bonus_idem (idempotency_key VARCHAR(128) PRIMARY KEY)",
+    f"""CREATE TABLE {SCHEMA}.referral_bonus_log (
+        id BIGSERIAL PRIMARY KEY, telegram_id BIGINT NOT NULL, bonus_type TEXT NOT NULL,
+        count_at_moment INT, amount_bonus_efhc_scaled BIGINT NOT NULL,
+        idempotency_key VARCHAR(128), meta JSONB
+    )""",
+    f"""CREATE TABLE {SCHEMA}.balances (
+        telegram_id BIGINT PRIMARY KEY, bonus_efhc NUMERIC(30, 8) NOT NULL DEFAULT 0, updated_at TIMESTAMPTZ
+    )""",
+)
+
+
+async def _setup(db) -> None:
+    for ddl in DDL:
+        await db.execute(text(ddl))
+    # 1 — уже 9 активных, два новых реферала с панелями; 2 — первый активный реферал
+    await db.execute(text(f"""
+        INSERT INTO {SCHEMA}.users (telegram_id, active_referral_count)
+        VALUES (1, 9), (2, 0), (11, 0), (12, 0), (21, 0)
+    """))
+    await db.execute(text(f"""
+        INSERT INTO {SCHEMA}.referrals (inviter_id, invitee_id) VALUES (1, 11), (1, 12), (2, 21)
+    """))
+    await db.execute(text(f"INSERT INTO {SCHEMA}.panels (telegram_id) VALUES (11), (12), (21)"))
+    await db.commit()
+
+
+async def _state(db):
+    bonus = await db.execute(text(f"SELECT telegram_id, bonus_efhc FROM {SCHEMA}.balances ORDER BY 1"))
+    counts = await db.execute(text(f"SELECT telegram_id, active_referral_count FROM {SCHEMA}.users WHERE telegram_id < 10 ORDER BY 1"))
+    thresholds = await db.execute(text(f"""
+        SELECT telegram_id, count_at_moment, idempotency_key FROM {SCHEMA}.referral_bonus_log
+         WHERE bonus_type = 'threshold'
+    """))
+    return (
+        {int(r[0]): Decimal(r[1]) for r in bonus},
+        {int(r[0]): int(r[1]) for r in counts},
+        [tuple(r) for r in thresholds],
+    )
+
+
+def test_batch_crossing_a_milestone_pays_it_once(pg_run):
+    async def scenario(db):
+        await _setup(db)
+        first = await ReferralBonusLog.award_first_panel_bonuses(db, Decimal("0.1"))
+        state = await _state(db)
+        again = await ReferralBonusLog.award_first_panel_bonuses(db, Decimal("0.1"))
+        return first, again, state, await _state(db)
+
+    first, again, state, state_again = pg_run(scenario)
+    bonus, counts, thresholds = state
+    assert (first, again) == (3, 0)
+    assert counts == {1: 11, 2: 1}
+    assert thresholds == [(1, 10, "th:1:10")]
+    assert bonus == {1: Decimal("1.2"), 2: Decimal("0.1")}  # 2 × 0.1 + порог 10 → 1 EFHC
+    assert state_again == state
@@ -0,0 +1,113 @@
+# 📂 backend/tests/test_scheduler.py — фоновые задачи планировщика (scheduler.py)
+# -----------------------------------------------------------------------------
+# • run_daily_kwh_accrual — один set-based запрос на PostgreSQL: kwh/kwh_total начислены
+#   по числу активных панелей и VIP-ставке; повторный запуск за тот же день ничего не добавляет.
+# • run_nft_vip_check — VIP выдаётся при NFT хотя бы на одном адресе, снимается, когда NFT нет ни на одном;
+#   ошибка NFT API по адресу пользователя (None/исключение) статус не меняет.
+# Нужен TEST_DATABASE_URL (см. conftest.pg_run); async_session_maker подменён сессией теста,
+# внешний NFT API — nft_checker._fetch_user_vip.
+
+from contextlib import asynccontextmanager
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from sqlalchemy import text
+
+from app import nft_checker, scheduler
+from app.models import AdminRateChange
+
+CORE = scheduler.settings.DB_SCHEMA_CORE
+DAY = date(2026, 1, 15)
+
+
+def _use_session(db):
+    @asynccontextmanager
+    async def _maker():
+        yield db
+
+    return mock.patch.object(scheduler, "async_session_maker", _maker)
+
+
+async def _setup_accrual(db) -> None:
+    await db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {CORE}"))
+    await db.execute(text(f"""
+        CREATE TABLE {CORE}.panels (
+            id BIGSERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            active BOOLEAN NOT NULL DEFAULT TRUE
+        )
+    """))
+    await db.execute(text(f"""
+        CREATE TABLE {CORE}.balances (
+            telegram_id BIGINT PRIMARY KEY,
+            kwh NUMERIC(30, 8) NOT NULL DEFAULT 0,
+            kwh_total NUMERIC(30, 8) NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ
+        )
+    """))
+    await scheduler.ensure_scheduler_tables(db)
+    # 1 — три активные панели и одна архивная, 2 — VIP с одной панелью, 3 — без панелей
+    await db.execute(text(f"""
+        INSERT INTO {CORE}.panels (telegram_id, active)
+        VALUES (1, TRUE), (1, TRUE), (1, TRUE), (1, FALSE), (2, TRUE)
+    """))
+    await db.execute(text(f"INSERT INTO {CORE}.balances (telegram_id, kwh, kwh_total) VALUES (1, 1, 5), (3, 2, 2)"))
+    await db.execute(text(f"INSERT INTO {CORE}.user_vip_status (telegram_id, since) VALUES (2, now())"))
+    await db.commit()
+
+
+async def _kwh(db):
+    rows = await db.execute(text(f"SELECT telegram_id, kwh, kwh_total FROM {CORE}.balances ORDER BY telegram_id"))
+    return {int(r[0]): (Decimal(r[1]), Decimal(r[2])) for r in rows}
+
+
+def test_daily_accrual_credits_once_per_day(pg_run):
+    async def scenario(db):
+        await _setup_accrual(db)
+        with _use_session(db), \
+             mock.patch.object(AdminRateChange, "get_active_rates", mock.AsyncMock(return_value=None)):
+            await scheduler.run_daily_kwh_accrual(DAY)
+            first = await _kwh(db)
+            await scheduler.run_daily_kwh_accrual(DAY)
+            second = await _kwh(db)
+        logged = (await db.execute(
+            text(f"SELECT count(*) FROM {CORE}.kwh_generation_log WHERE accrual_date = :d"), {"d": DAY}
+        )).scalar_one()
+        return first, second, logged
+
+    first, second, logged = pg_run(scenario)
+    assert first == {
+        1: (Decimal("2.794"), Decimal("6.794")),  # 1 + 3 × 0.598
+        2: (Decimal("0.640"), Decimal("0.640")),  # новая строка баланса, VIP-ставка
+        3: (Decimal("2"), Decimal("2")),           # без активных панелей — не начисляется
+    }
+    assert second == first
+    assert logged == 2
+
+
+def test_vip_check_grants_revokes_and_keeps_status_on_api_errors(pg_run):
+    api = {"EQa": None, "EQb": True, "EQc": False, "EQd": None, "EQe": RuntimeError("timeout"), "EQf": False}
+
+    async def fetch(address, client):
+        answer = api[address]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    async def scenario(db):
+        await db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {CORE}"))
+        await scheduler.ensure_scheduler_tables(db)
+        await db.execute(text(f"""
+            INSERT INTO {CORE}.user_wallets (telegram_id, ton_address)
+            VALUES (1, 'EQa'), (1, 'EQb'), (2, 'EQc'), (3, 'EQd'), (4, 'EQe'), (5, 'EQf')
+        """))
+        await db.execute(text(f"INSERT INTO {CORE}.user_vip_status (telegram_id, since) VALUES (2, now()), (3, now()), (4, now())"))
+        await db.commit()
+        with _use_session(db), mock.patch.object(nft_checker, "_fetch_user_vip", fetch):
+            await scheduler.run_nft_vip_check()
+        rows = await db.execute(text(f"SELECT telegram_id FROM {CORE}.user_vip_status ORDER BY telegram_id"))
+        return [int(r[0]) for r in rows]
+
+    # 1 — NFT на втором адресе; 2 — NFT нет, VIP снят; 3, 4 — ошибка API, VIP сохранён; 5 — не VIP
+    assert pg_run(scenario) == [1, 3, 4]
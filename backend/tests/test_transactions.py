@@ -0,0 +1,126 @@
+# 📂 backend/tests/test_transactions.py — идемпотентные списания EFHC (transactions.py)
+# -----------------------------------------------------------------------------
+# Порядок в _debit_then_log: условный UPDATE баланса → лог/ключ, всё в SAVEPOINT.
+#   • нехватка средств — ни лога, ни занятого ключа;
+#   • повтор по ключу — списание откатывается, ошибки нет.
+# Зачисление — upsert-дельтой (_credit_balance) только после записи лога; повтор ничего не зачисляет.
+# БД не нужна: Session и SQL-шаги подменяются, проверяется только порядок и откаты.
+
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+from app import transactions
+
+
+@pytest.fixture
+def db():
+    session = mock.MagicMock()
+    session.execute.return_value.first.return_value = None  # ключ в efhc_transfers_idem не занят
+    return session
+
+
+@pytest.fixture(autouse=True)
+def bank():
+    with mock.patch.object(transactions, "get_current_bank_id", return_value=362746228):
+        yield
+
+
+def test_insufficient_funds_leaves_no_log_and_no_key(db):
+    with mock.patch.object(transactions, "_debit_balance", return_value=False), \
+         mock.patch.object(transactions, "log_transfer") as log_transfer:
+        with pytest.raises(ValueError, match="Insufficient EFHC"):
+            transactions.debit_user_to_bank(db, 1, Decimal("5"), "shop_panel_efhc", idempotency_key="k1")
+
+    log_transfer.assert_not_called()
+    db.begin_nested.return_value.rollback.assert_called_once()
+    db.begin_nested.return_value.commit.assert_not_called()
+
+
+def test_insufficient_bonus_message(db):
+    with mock.patch.object(transactions, "_debit_balance", return_value=False), \
+         mock.patch.object(transactions, "log_transfer") as log_transfer:
+        with pytest.raises(ValueError, match="Insufficient bonus EFHC"):
+            transactions.spend_bonus_for_panels(db, 1, Decimal("5"))
+
+    log_transfer.assert_not_called()
+
+
+def test_duplicate_key_rolls_back_debit(db):
+    with mock.patch.object(transactions, "_debit_balance", return_value=True) as debit, \
+         mock.patch.object(transactions, "log_transfer", return_value=None):
+        transactions.debit_user_to_bank(db, 1, Decimal("5"), "shop_panel_efhc", idempotency_key="k1")
+
+    debit.assert_called_once_with(db, 1, Decimal("5.00000000"), False)
+    db.begin_nested.return_value.rollback.assert_called_once()
+    db.begin_nested.return_value.commit.assert_not_called()
+
+
+def test_retry_after_completed_debit_is_not_an_error(db):
+    # Первое списание прошло и опустошило баланс; повтор с тем же ключом — тихий no-op
+    db.execute.return_value.first.return_value = (1,)
+    with mock.patch.object(transactions, "_debit_balance", return_value=False), \
+         mock.patch.object(transactions, "log_transfer") as log_transfer:
+        transactions.lock_withdrawal(db, 1, Decimal("5"), withdraw_id=7, idempotency_key="w7")
+
+    log_transfer.assert_not_called()
+
+
+def test_debit_then_log_commits_savepoint(db):
+    with mock.patch.object(transactions, "_debit_balance", return_value=True), \
+         mock.patch.object(transactions, "log_transfer", return_value=42) as log_transfer:
+        transactions.lock_withdrawal(db, 1, Decimal("5"), withdraw_id=7, idempotency_key="w7")
+
+    log_transfer.assert_called_once_with(
+        db, from_id=1, amount=Decimal("5.00000000"), to_id=362746228,
+        reason="withdraw_lock", idempotency_key="w7", withdraw_id=7,
+    )
+    db.begin_nested.return_value.commit.assert_called_once()
+    db.begin_nested.return_value.rollback.assert_not_called()
+
+
+def test_transfer_duplicate_does_not_credit_receiver(db):
+    with mock.patch.object(transactions, "_debit_balance", return_value=True), \
+         mock.patch.object(transactions, "log_transfer", return_value=None), \
+         mock.patch.object(transactions, "_credit_balance") as credit:
+        transactions.transfer_between_users(db, 1, 2, Decimal("5"), "gift", idempotency_key="t1")
+
+    credit.assert_not_called()
+
+
+def test_transfer_credits_receiver(db):
+    with mock.patch.object(transactions, "_debit_balance", return_value=True), \
+         mock.patch.object(transactions, "log_transfer", return_value=9), \
+         mock.patch.object(transactions, "_credit_balance") as credit:
+        transactions.transfer_between_users(db, 1, 2, Decimal("5"), "gift", idempotency_key="t1")
+
+    credit.assert_called_once_with(db, 2, Decimal("5.00000000"))
+
+
+def test_refund_duplicate_does_not_credit(db):
+    with mock.patch.object(transactions, "log_transfer", return_value=None), \
+         mock.patch.object(transactions, "_credit_balance") as credit:
+        transactions.refund_withdrawal(db, 1, Decimal("5"), withdraw_id=7, idempotency_key="r7")
+
+    credit.assert_not_called()
+
+
+def test_credit_balance_is_upsert_delta(db):
+    transactions._credit_balance(db, 2, Decimal("5"))
+
+    stmt, params = db.execute.call_args[0]
+    assert "ON CONFLICT (telegram_id) DO UPDATE" in str(stmt)
+    assert params == {"tid": 2, "e": Decimal("5"), "k": Decimal("0"), "b": Decimal("0")}
+
+
+def test_debit_balance_is_conditional_update(db):
+    from sqlalchemy.dialects import postgresql
+
+    db.execute.return_value.first.return_value = (1,)
+    assert transactions._debit_balance(db, 1, Decimal("5"), use_bonus=True) is True
+
+    sql = str(db.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+    assert "UPDATE efhc_core.balances SET bonus_efhc=(efhc_core.balances.bonus_efhc -" in sql
+    assert "efhc_core.balances.bonus_efhc >=" in sql
+    assert "RETURNING" in sql
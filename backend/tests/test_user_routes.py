@@ -0,0 +1,179 @@
+# 📂 backend/tests/test_user_routes.py — покупки пользователя на реальном PostgreSQL (user_routes.py)
+# -----------------------------------------------------------------------------
+# • /user/lottery/buy — место занимается условным UPDATE по lotteries.tickets_sold:
+#   заполненная лотерея отказывает, билетов и списаний нет.
+# • count билетов за раз: места, списание и билеты — по count; при нехватке EFHC откатывается всё.
+# • LOTTERY_MAX_TICKETS_PER_USER — на пользователя в лотерее: уже купленные + новые, повторной покупкой не обойти.
+# • /user/exchange — один условный UPDATE: балансы после обмена; перерасход отклоняется без изменений.
+# Нужен TEST_DATABASE_URL (см. conftest.pg_run). DDL из user_routes.CREATE_*_TABLES_SQL многооператорный,
+# а asyncpg через text() выполняет только prepared statement с одной командой — поэтому таблицы
+# создаются простым протоколом драйвера внутри откатываемой транзакции, ensure_user_routes_tables подменён.
+
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app import user_routes
+from app.user_routes import ExchangeRequest, LotteryBuyRequest, SCHEMA_CORE, SCHEMA_LOTTERY
+
+TG = 1001
+
+
+@pytest.fixture(autouse=True)
+def webapp_user():
+    auth = {"telegram_id": TG, "username": "tester", "raw_user": {}}
+    with mock.patch.object(user_routes, "_verify_webapp_request", mock.AsyncMock(return_value=auth)), \
+         mock.patch.object(user_routes, "ensure_user_routes_tables", mock.AsyncMock()):
+        yield
+
+
+async def _setup(db, efhc: str = "0", kwh: str = "0") -> None:
+    raw = (await (await db.connection()).get_raw_connection()).driver_connection
+    await raw.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_CORE}")
+    for ddl in (
+        user_routes.CREATE_CORE_TABLES_SQL,
+        user_routes.CREATE_TASKS_TABLES_SQL,
+        user_routes.CREATE_LOTTERY_TABLES_SQL,
+        user_routes.CREATE_REFERRAL_TABLES_SQL,
+    ):
+        await raw.execute(ddl)
+    await user_routes._ensure_user_exists(db, TG, "tester")
+    await db.execute(
+        text(f"UPDATE {SCHEMA_CORE}.balances SET efhc = :efhc, kwh = :kwh WHERE telegram_id = :tg"),
+        {"efhc": Decimal(efhc), "kwh": Decimal(kwh), "tg": TG},
+    )
+    await db.commit()
+
+
+async def _add_lottery(db, code: str, target: int, sold: int = 0) -> None:
+    await db.execute(
+        text(f"""
+            INSERT INTO {SCHEMA_LOTTERY}.lotteries (code, title, prize_type, target_participants, tickets_sold)
+            VALUES (:code, :code, 'PANEL', :target, :sold)
+        """),
+        {"code": code, "target": target, "sold": sold},
+    )
+    await db.commit()
+
+
+async def _state(db, code: str):
+    efhc = (await db.execute(
+        text(f"SELECT efhc FROM {SCHEMA_CORE}.balances WHERE telegram_id = :tg"), {"tg": TG}
+    )).scalar_one()
+    sold = (await db.execute(
+        text(f"SELECT tickets_sold FROM {SCHEMA_LOTTERY}.lotteries WHERE code = :c"), {"c": code}
+    )).scalar_one()
+    tickets = (await db.execute(
+        text(f"SELECT count(*) FROM {SCHEMA_LOTTERY}.lottery_tickets WHERE lottery_code = :c"), {"c": code}
+    )).scalar_one()
+    return Decimal(efhc), sold, tickets
+
+
+def test_lottery_buy_takes_a_seat_and_debits(pg_run):
+    async def scenario(db):
+        await _setup(db, efhc="5")
+        await _add_lottery(db, "L1", target=2)
+        resp = await user_routes.user_lottery_buy(LotteryBuyRequest(code="L1"), db=db)
+        return resp, await _state(db, "L1")
+
+    resp, (efhc, sold, tickets) = pg_run(scenario)
+    assert resp.tickets_sold == 1
+    assert (efhc, sold, tickets) == (Decimal("4.000"), 1, 1)
+
+
+def test_lottery_buy_full_is_refused_without_side_effects(pg_run):
+    async def scenario(db):
+        await _setup(db, efhc="5")
+        await _add_lottery(db, "L1", target=1, sold=1)
+        with pytest.raises(HTTPException) as e:
+            await user_routes.user_lottery_buy(LotteryBuyRequest(code="L1"), db=db)
+        await db.rollback()
+        return e.value.detail, await _state(db, "L1")
+
+    detail, (efhc, sold, tickets) = pg_run(scenario)
+    assert detail == "Lottery is full"
+    assert (efhc, sold, tickets) == (Decimal("5.000"), 1, 0)
+
+
+def test_lottery_buy_several_tickets(pg_run):
+    async def scenario(db):
+        await _setup(db, efhc="5")
+        await _add_lottery(db, "L1", target=10)
+        resp = await user_routes.user_lottery_buy(LotteryBuyRequest(code="L1", count=3), db=db)
+        return resp, await _state(db, "L1")
+
+    resp, (efhc, sold, tickets) = pg_run(scenario)
+    assert (resp.tickets_sold, resp.efhc) == (3, "2.000")
+    assert (efhc, sold, tickets) == (Decimal("2.000"), 3, 3)
+
+
+def test_lottery_buy_insufficient_efhc_rolls_back_seats(pg_run):
+    async def scenario(db):
+        await _setup(db, efhc="2")
+        await _add_lottery(db, "L1", target=10)
+        with pytest.raises(HTTPException) as e:
+            await user_routes.user_lottery_buy(LotteryBuyRequest(code="L1", count=3), db=db)
+        await db.rollback()
+        return e.value.detail, await _state(db, "L1")
+
+    detail, (efhc, sold, tickets) = pg_run(scenario)
+    assert detail == "Insufficient EFHC"
+    assert (efhc, sold, tickets) == (Decimal("2.000"), 0, 0)
+
+
+def test_lottery_buy_per_user_limit_counts_earlier_tickets(pg_run):
+    limit = user_routes.settings.LOTTERY_MAX_TICKETS_PER_USER
+
+    async def scenario(db):
+        await _setup(db, efhc=str(limit + 5))
+        await _add_lottery(db, "L1", target=0)
+        await user_routes.user_lottery_buy(LotteryBuyRequest(code="L1", count=limit - 1), db=db)
+        with pytest.raises(HTTPException) as e:
+            await user_routes.user_lottery_buy(LotteryBuyRequest(code="L1", count=2), db=db)
+        await db.rollback()
+        refused = await _state(db, "L1")
+        await user_routes.user_lottery_buy(LotteryBuyRequest(code="L1", count=1), db=db)
+        return e.value.detail, refused, await _state(db, "L1")
+
+    detail, refused, last = pg_run(scenario)
+    assert detail == "Ticket limit per user reached"
+    assert refused == (Decimal("6.000"), limit - 1, limit - 1)
+    assert last == (Decimal("5.000"), limit, limit)
+
+
+async def _balances(db):
+    row = (await db.execute(
+        text(f"SELECT efhc, kwh FROM {SCHEMA_CORE}.balances WHERE telegram_id = :tg"), {"tg": TG}
+    )).one()
+    return Decimal(row[0]), Decimal(row[1])
+
+
+def test_exchange_moves_amount_between_sides(pg_run):
+    async def scenario(db):
+        await _setup(db, efhc="1", kwh="10.5")
+        resp = await user_routes.user_exchange(
+            ExchangeRequest(direction="kwh_to_efhc", amount=Decimal("2.25")), db=db
+        )
+        return resp, await _balances(db)
+
+    resp, balances = pg_run(scenario)
+    assert (resp.efhc, resp.kwh) == ("3.250", "8.250")
+    assert balances == (Decimal("3.250"), Decimal("8.250"))
+
+
+def test_exchange_overdraft_is_refused(pg_run):
+    async def scenario(db):
+        await _setup(db, efhc="1", kwh="10")
+        with pytest.raises(HTTPException) as e:
+            await user_routes.user_exchange(
+                ExchangeRequest(direction="efhc_to_kwh", amount=Decimal("1.001")), db=db
+            )
+        await db.rollback()
+        return e.value.detail, await _balances(db)
+
+    detail, balances = pg_run(scenario)
+    assert detail == "Insufficient EFHC balance"
+    assert balances == (Decimal("1.000"), Decimal("10.000"))
@@ -0,0 +1,18 @@
+# 📂 backend/tests/test_utils.py — нормализация TON-адресов (utils.normalize_ton_address)
+# -----------------------------------------------------------------------------
+# • raw «workchain:hex» → нижний регистр; битый workchain ("--1", "²") не бросает, а даёт strip().lower().
+
+import pytest
+
+from app.utils import normalize_ton_address
+
+
+@pytest.mark.parametrize("address, expected", [
+    ("0:ABcd", "0:abcd"),
+    (" -1:AB ", "-1:ab"),
+    ("--1:AB", "--1:ab"),
+    ("²:AB", "²:ab"),
+    ("", None),
+])
+def test_normalize_ton_address_never_raises(address, expected):
+    assert normalize_ton_address(address) == expected
@@ -0,0 +1,35 @@
+-- 📂 migrations/0002_balance_checks_status_enums.sql — инварианты балансов и ENUM-статусы
+-- -----------------------------------------------------------------------------
+-- • balances: CHECK (efhc, bonus_efhc, kwh >= 0) — отрицательный баланс отсекается самой БД.
+-- • shop_orders.status / withdrawals.status: TEXT → нативные ENUM-типы PostgreSQL
+--   (4 байта на значение, планировщик знает полный набор значений).
+-- Соответствует models.py: Balance.__table_args__, ShopOrder.status, WithdrawRequest.status.
+
+SET search_path TO efhc_core, public;
+
+ALTER TABLE efhc_core.balances
+  ADD CONSTRAINT ck_balances_nonneg CHECK (efhc >= 0 AND bonus_efhc >= 0 AND kwh >= 0);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+                 WHERE t.typname = 'shop_order_status' AND n.nspname = 'efhc_core') THEN
+    CREATE TYPE efhc_core.shop_order_status AS ENUM
+      ('pending', 'paid', 'completed', 'rejected', 'canceled', 'failed');
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+                 WHERE t.typname = 'withdraw_status' AND n.nspname = 'efhc_core') THEN
+    CREATE TYPE efhc_core.withdraw_status AS ENUM
+      ('pending', 'approved', 'rejected', 'sent', 'failed', 'canceled');
+  END IF;
+END $$;
+
+ALTER TABLE efhc_core.shop_orders ALTER COLUMN status DROP DEFAULT;
+ALTER TABLE efhc_core.shop_orders
+  ALTER COLUMN status TYPE efhc_core.shop_order_status USING status::efhc_core.shop_order_status;
+ALTER TABLE efhc_core.shop_orders ALTER COLUMN status SET DEFAULT 'pending';
+
+ALTER TABLE efhc_core.withdrawals ALTER COLUMN status DROP DEFAULT;
+ALTER TABLE efhc_core.withdrawals
+  ALTER COLUMN status TYPE efhc_core.withdraw_status USING status::efhc_core.withdraw_status;
+ALTER TABLE efhc_core.withdrawals ALTER COLUMN status SET DEFAULT 'pending';
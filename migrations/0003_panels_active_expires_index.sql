@@ -0,0 +1,10 @@
+-- 📂 migrations/0003_panels_active_expires_index.sql — индекс под подсчёт активных панелей
+-- -----------------------------------------------------------------------------
+-- Запрос лимита «≤ 1000 активных панелей»:
+--   SELECT count(*) FROM panels WHERE telegram_id = :tg AND active AND expires_at > now()
+-- Частичный индекс (только active = true) покрывает и telegram_id, и фильтр по времени.
+-- Соответствует models.py: Panel.__table_args__ → ix_panels_user_active_expires.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_panels_user_active_expires
+  ON efhc_core.panels (telegram_id, expires_at DESC)
+  WHERE active = true;
@@ -0,0 +1,51 @@
+-- 📂 migrations/0004_identity_primary_keys.sql — BIGSERIAL → GENERATED BY DEFAULT AS IDENTITY
+-- -----------------------------------------------------------------------------
+-- Соответствует models.py: id = Column(BigInteger, Identity(always=False), primary_key=True).
+-- Для каждой таблицы:
+--   • снимаем DEFAULT nextval(...) и удаляем «серийную» последовательность;
+--   • добавляем IDENTITY и выставляем его на max(id) + 1, чтобы не было коллизий.
+-- Идемпотентно: таблицы, где id уже IDENTITY (или таблицы нет), пропускаются.
+
+SET search_path TO efhc_core, public;
+
+DO $$
+DECLARE
+  t   TEXT;
+  seq TEXT;
+  nxt BIGINT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY[
+    'ton_wallets',
+    'panels',
+    'panel_archive',
+    'efhc_transfers_log',
+    'shop_orders',
+    'manual_nft_requests',
+    'withdrawals',
+    'kwh_to_efhc_exchange_log',
+    'referrals',
+    'referral_bonus_log',
+    'admin_bank_history',
+    'admin_rate_change'
+  ] LOOP
+    IF NOT EXISTS (
+      SELECT 1 FROM information_schema.columns
+       WHERE table_schema = 'efhc_core' AND table_name = t
+         AND column_name = 'id' AND is_identity = 'NO'
+    ) THEN
+      CONTINUE;
+    END IF;
+
+    seq := pg_get_serial_sequence(format('efhc_core.%I', t), 'id');
+    EXECUTE format('ALTER TABLE efhc_core.%I ALTER COLUMN id DROP DEFAULT', t);
+    IF seq IS NOT NULL THEN
+      EXECUTE format('DROP SEQUENCE IF EXISTS %s', seq);
+    END IF;
+
+    EXECUTE format('SELECT COALESCE(max(id), 0) + 1 FROM efhc_core.%I', t) INTO nxt;
+    EXECUTE format(
+      'ALTER TABLE efhc_core.%I ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH %s)',
+      t, nxt
+    );
+  END LOOP;
+END $$;
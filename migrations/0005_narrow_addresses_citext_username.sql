@@ -0,0 +1,17 @@
+-- 📂 migrations/0005_narrow_addresses_citext_username.sql — узкие адреса TON и CITEXT для username
+-- -----------------------------------------------------------------------------
+-- • TON-адреса: ≤ 48 символов (base64url) или 66 (raw hex "0:<64 hex>") → VARCHAR(70) вместо TEXT.
+-- • users.username → CITEXT: регистронезависимое сравнение без LOWER(), b-tree индексы остаются рабочими.
+-- Соответствует models.py (TonWallet.address, ShopOrder.ton_address, ManualNFTRequest.wallet_address,
+-- WithdrawRequest.ton_address, User.username).
+
+CREATE EXTENSION IF NOT EXISTS citext;
+
+SET search_path TO efhc_core, public;
+
+ALTER TABLE efhc_core.ton_wallets         ALTER COLUMN address        TYPE VARCHAR(70);
+ALTER TABLE efhc_core.shop_orders         ALTER COLUMN ton_address    TYPE VARCHAR(70);
+ALTER TABLE efhc_core.manual_nft_requests ALTER COLUMN wallet_address TYPE VARCHAR(70);
+ALTER TABLE efhc_core.withdrawals         ALTER COLUMN ton_address    TYPE VARCHAR(70);
+
+ALTER TABLE efhc_core.users ALTER COLUMN username TYPE CITEXT;
@@ -0,0 +1,28 @@
+-- 📂 migrations/0006_efhc_log_typed_context.sql — типизированный контекст в efhc_transfers_log
+-- -----------------------------------------------------------------------------
+-- Известные формы meta ({order_id}, {withdraw_id}, {snapshot_kwh_before, snapshot_kwh_after})
+-- переносим в собственные колонки: чтение без разбора JSONB и без TOAST-фетчей.
+-- meta остаётся для произвольного контекста; перенесённые ключи из него удаляются.
+-- Соответствует models.py: EFHCTransfersLog.order_id / withdraw_id / snapshot_kwh_*.
+
+SET search_path TO efhc_core, public;
+
+ALTER TABLE efhc_core.efhc_transfers_log
+  ADD COLUMN IF NOT EXISTS order_id            BIGINT NULL,
+  ADD COLUMN IF NOT EXISTS withdraw_id         BIGINT NULL,
+  ADD COLUMN IF NOT EXISTS snapshot_kwh_before NUMERIC(30,8) NULL,
+  ADD COLUMN IF NOT EXISTS snapshot_kwh_after  NUMERIC(30,8) NULL;
+
+-- Перенос существующих данных
+UPDATE efhc_core.efhc_transfers_log
+   SET order_id            = COALESCE(order_id,            (meta->>'order_id')::bigint),
+       withdraw_id         = COALESCE(withdraw_id,         (meta->>'withdraw_id')::bigint),
+       snapshot_kwh_before = COALESCE(snapshot_kwh_before, (meta->>'snapshot_kwh_before')::numeric),
+       snapshot_kwh_after  = COALESCE(snapshot_kwh_after,  (meta->>'snapshot_kwh_after')::numeric),
+       meta = NULLIF(meta - 'order_id' - 'withdraw_id' - 'snapshot_kwh_before' - 'snapshot_kwh_after', '{}'::jsonb)
+ WHERE meta ?| ARRAY['order_id', 'withdraw_id', 'snapshot_kwh_before', 'snapshot_kwh_after'];
+
+CREATE INDEX IF NOT EXISTS ix_efhc_log_order_id
+  ON efhc_core.efhc_transfers_log (order_id) WHERE order_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_efhc_log_withdraw_id
+  ON efhc_core.efhc_transfers_log (withdraw_id) WHERE withdraw_id IS NOT NULL;
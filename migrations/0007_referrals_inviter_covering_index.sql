@@ -0,0 +1,15 @@
+-- 📂 migrations/0007_referrals_inviter_covering_index.sql — покрывающий индекс для подсчёта рефералов
+-- -----------------------------------------------------------------------------
+-- SELECT count(*) FROM referrals WHERE inviter_id = :id — выполняется при каждой проверке
+-- пороговых бонусов. INCLUDE (invitee_id) → index-only scan (без heap fetch при свежей visibility map).
+-- Соответствует models.py: Referral.__table_args__ → ix_referrals_inviter_cover.
+-- ВНИМАНИЕ: CREATE/DROP INDEX CONCURRENTLY и VACUUM нельзя запускать внутри транзакции —
+-- выполнять файл без BEGIN/COMMIT (psql -f без --single-transaction).
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_referrals_inviter_cover
+  ON efhc_core.referrals (inviter_id) INCLUDE (invitee_id)
+  WHERE inviter_id IS NOT NULL;
+
+DROP INDEX CONCURRENTLY IF EXISTS efhc_core.ix_referrals_inviter;
+
+VACUUM ANALYZE efhc_core.referrals;
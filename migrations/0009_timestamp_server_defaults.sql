@@ -0,0 +1,29 @@
+-- 📂 migrations/0009_timestamp_server_defaults.sql — DEFAULT now() для всех timestamp-колонок
+-- -----------------------------------------------------------------------------
+-- models.py: default=datetime.utcnow → server_default=func.now().
+-- Время вставки заполняет сама БД (один источник времени, без Python-callback на строку;
+-- bulk insert()/insert().returning() корректно работают без ORM-дефолтов).
+
+SET search_path TO efhc_core, public;
+
+ALTER TABLE efhc_core.users                      ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.users                      ALTER COLUMN updated_at   SET DEFAULT now();
+ALTER TABLE efhc_core.ton_wallets                ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.vip_status                 ALTER COLUMN updated_at   SET DEFAULT now();
+ALTER TABLE efhc_core.balances                   ALTER COLUMN updated_at   SET DEFAULT now();
+ALTER TABLE efhc_core.panels                     ALTER COLUMN activated_at SET DEFAULT now();
+ALTER TABLE efhc_core.panels                     ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.panels                     ALTER COLUMN updated_at   SET DEFAULT now();
+ALTER TABLE efhc_core.panel_archive              ALTER COLUMN archived_at  SET DEFAULT now();
+ALTER TABLE efhc_core.efhc_transfers_log         ALTER COLUMN ts           SET DEFAULT now();
+ALTER TABLE efhc_core.shop_orders                ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.shop_orders                ALTER COLUMN updated_at   SET DEFAULT now();
+ALTER TABLE efhc_core.manual_nft_requests        ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.withdrawals                ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.withdrawals                ALTER COLUMN updated_at   SET DEFAULT now();
+ALTER TABLE efhc_core.kwh_to_efhc_exchange_log   ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.referrals                  ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.referral_bonus_log         ALTER COLUMN created_at   SET DEFAULT now();
+ALTER TABLE efhc_core.admin_bank_config          ALTER COLUMN updated_at   SET DEFAULT now();
+ALTER TABLE efhc_core.admin_bank_history         ALTER COLUMN changed_at   SET DEFAULT now();
+ALTER TABLE efhc_core.admin_rate_change          ALTER COLUMN created_at   SET DEFAULT now();
@@ -0,0 +1,24 @@
+-- 📂 migrations/0010_scaled_bigint_amounts.sql — NUMERIC → BIGINT (×10^8) для бонусов и ставок
+-- -----------------------------------------------------------------------------
+-- Соответствует models.py (ScaledDecimal(8)):
+--   • referral_bonus_log.amount_bonus_efhc   → amount_bonus_efhc_scaled BIGINT
+--   • admin_rate_change.base_rate_kwh_per_day → base_rate_scaled BIGINT
+--   • admin_rate_change.vip_rate_kwh_per_day  → vip_rate_scaled BIGINT
+-- Значение в БД = round(Decimal × 10^8) (банковское округление, как в to_scaled()).
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.referral_bonus_log
+  ALTER COLUMN amount_bonus_efhc TYPE BIGINT USING round(amount_bonus_efhc * 100000000)::bigint;
+ALTER TABLE efhc_core.referral_bonus_log
+  RENAME COLUMN amount_bonus_efhc TO amount_bonus_efhc_scaled;
+
+ALTER TABLE efhc_core.admin_rate_change
+  ALTER COLUMN base_rate_kwh_per_day TYPE BIGINT USING round(base_rate_kwh_per_day * 100000000)::bigint,
+  ALTER COLUMN vip_rate_kwh_per_day  TYPE BIGINT USING round(vip_rate_kwh_per_day  * 100000000)::bigint;
+ALTER TABLE efhc_core.admin_rate_change RENAME COLUMN base_rate_kwh_per_day TO base_rate_scaled;
+ALTER TABLE efhc_core.admin_rate_change RENAME COLUMN vip_rate_kwh_per_day  TO vip_rate_scaled;
+
+COMMIT;
@@ -0,0 +1,10 @@
+-- 📂 migrations/0011_rate_effective_from_brin.sql — BRIN вместо btree на admin_rate_change.effective_from
+-- -----------------------------------------------------------------------------
+-- Таблица только дописывается, effective_from монотонно растёт → BRIN-индекс занимает
+-- несколько страниц и почти не стоит ничего на INSERT.
+-- Соответствует models.py: AdminRateChange.__table_args__ → ix_rate_effective_from_brin.
+
+CREATE INDEX IF NOT EXISTS ix_rate_effective_from_brin
+  ON efhc_core.admin_rate_change USING brin (effective_from) WITH (pages_per_range = 32);
+
+DROP INDEX IF EXISTS efhc_core.ix_rate_effective_from;
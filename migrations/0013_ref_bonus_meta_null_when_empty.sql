@@ -0,0 +1,11 @@
+-- 📂 migrations/0013_ref_bonus_meta_null_when_empty.sql — пустой meta хранится как NULL
+-- -----------------------------------------------------------------------------
+-- referral_bonus_log.meta: '{}' → NULL (строки уже, меньше varlena/TOAST на сканах лога).
+-- Соответствует models.py: ReferralBonusLog.meta (CompactJSONB) + ck_ref_bonus_meta_not_empty.
+
+SET search_path TO efhc_core, public;
+
+UPDATE efhc_core.referral_bonus_log SET meta = NULL WHERE meta = '{}'::jsonb;
+
+ALTER TABLE efhc_core.referral_bonus_log
+  ADD CONSTRAINT ck_ref_bonus_meta_not_empty CHECK (meta IS NULL OR meta <> '{}'::jsonb);
@@ -0,0 +1,106 @@
+-- 📂 migrations/0014_partition_referral_bonus_log.sql — помесячное секционирование referral_bonus_log
+-- -----------------------------------------------------------------------------
+-- • referral_bonus_log → PARTITION BY RANGE (created_at), секции по месяцам + DEFAULT.
+-- • PK (id, created_at): ключ секционирования обязан входить в уникальные индексы.
+-- • Глобальная уникальность idempotency_key — отдельная таблица referral_bonus_idem (PK).
+-- • Функция ensure_referral_bonus_log_partitions(ahead) — создаёт секции на текущий и
+--   ahead следующих месяцев; вызывается планировщиком (scheduler.create_ref_bonus_partitions).
+-- Соответствует models.py: ReferralBonusLog, ReferralBonusIdem, ensure_ref_bonus_partitions().
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+-- 1) Функция создания помесячных секций
+CREATE OR REPLACE FUNCTION efhc_core.ensure_referral_bonus_log_partitions(ahead integer DEFAULT 2)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  m_from date;
+  m_to   date;
+  i      integer;
+BEGIN
+  FOR i IN 0..ahead LOOP
+    m_from := (date_trunc('month', now()) + make_interval(months => i))::date;
+    m_to   := (m_from + interval '1 month')::date;
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS efhc_core.%I PARTITION OF efhc_core.referral_bonus_log
+         FOR VALUES FROM (%L) TO (%L)',
+      'referral_bonus_log_y' || to_char(m_from, 'YYYY') || 'm' || to_char(m_from, 'MM'),
+      m_from, m_to
+    );
+  END LOOP;
+END $$;
+
+-- 2) Новая секционированная таблица
+ALTER TABLE efhc_core.referral_bonus_log RENAME TO referral_bonus_log_old;
+
+CREATE TABLE efhc_core.referral_bonus_log (
+  id                       BIGINT GENERATED BY DEFAULT AS IDENTITY,
+  telegram_id              BIGINT NOT NULL REFERENCES efhc_core.users(telegram_id) ON DELETE CASCADE,
+  bonus_type               VARCHAR(32) NOT NULL,
+  count_at_moment          INTEGER NULL,
+  amount_bonus_efhc_scaled BIGINT NOT NULL,
+  meta                     JSONB NULL,
+  idempotency_key          VARCHAR(128) NULL,
+  created_at               TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at),
+  CONSTRAINT ck_ref_bonus_meta_not_empty_p CHECK (meta IS NULL OR meta <> '{}'::jsonb)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE efhc_core.referral_bonus_log_default PARTITION OF efhc_core.referral_bonus_log DEFAULT;
+
+-- Секции под уже накопленные данные (от самого раннего месяца) и на 2 месяца вперёд
+DO $$
+DECLARE
+  m_from date;
+BEGIN
+  SELECT date_trunc('month', COALESCE(min(created_at), now()))::date INTO m_from
+    FROM efhc_core.referral_bonus_log_old;
+  WHILE m_from < date_trunc('month', now())::date LOOP
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS efhc_core.%I PARTITION OF efhc_core.referral_bonus_log
+         FOR VALUES FROM (%L) TO (%L)',
+      'referral_bonus_log_y' || to_char(m_from, 'YYYY') || 'm' || to_char(m_from, 'MM'),
+      m_from, (m_from + interval '1 month')::date
+    );
+    m_from := (m_from + interval '1 month')::date;
+  END LOOP;
+END $$;
+SELECT efhc_core.ensure_referral_bonus_log_partitions(2);
+
+-- 3) Перенос данных
+INSERT INTO efhc_core.referral_bonus_log
+  (id, telegram_id, bonus_type, count_at_moment, amount_bonus_efhc_scaled, meta, idempotency_key, created_at)
+SELECT id, telegram_id, bonus_type, count_at_moment, amount_bonus_efhc_scaled, meta, idempotency_key, created_at
+  FROM efhc_core.referral_bonus_log_old;
+
+SELECT setval(
+  pg_get_serial_sequence('efhc_core.referral_bonus_log', 'id'),
+  COALESCE((SELECT max(id) FROM efhc_core.referral_bonus_log), 0) + 1,
+  false
+);
+
+-- 4) Реестр ключей идемпотентности
+CREATE TABLE IF NOT EXISTS efhc_core.referral_bonus_idem (
+  idempotency_key VARCHAR(128) PRIMARY KEY,
+  created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO efhc_core.referral_bonus_idem (idempotency_key, created_at)
+SELECT idempotency_key, min(created_at)
+  FROM efhc_core.referral_bonus_log_old
+ WHERE idempotency_key IS NOT NULL
+ GROUP BY idempotency_key
+ON CONFLICT DO NOTHING;
+
+-- 5) Индексы (создаются на родителе → наследуются всеми секциями)
+CREATE INDEX ix_ref_bonus_user_p ON efhc_core.referral_bonus_log (telegram_id);
+
+DROP TABLE efhc_core.referral_bonus_log_old;
+
+ALTER INDEX efhc_core.ix_ref_bonus_user_p RENAME TO ix_ref_bonus_user;
+ALTER TABLE efhc_core.referral_bonus_log
+  RENAME CONSTRAINT ck_ref_bonus_meta_not_empty_p TO ck_ref_bonus_meta_not_empty;
+
+COMMIT;
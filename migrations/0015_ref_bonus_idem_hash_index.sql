@@ -0,0 +1,9 @@
+-- 📂 migrations/0015_ref_bonus_idem_hash_index.sql — hash-индекс на referral_bonus_log.idempotency_key
+-- -----------------------------------------------------------------------------
+-- Проверки существования по ключу идемпотентности — чистое равенство (WHERE idempotency_key = :k).
+-- Hash-индекс (WAL-safe с PG10) компактнее btree для длинных строковых ключей.
+-- Глобальная уникальность ключа по-прежнему гарантируется PK referral_bonus_idem (миграция 0014).
+-- Соответствует models.py: ReferralBonusLog.__table_args__ → ix_ref_bonus_idem_hash.
+
+CREATE INDEX IF NOT EXISTS ix_ref_bonus_idem_hash
+  ON efhc_core.referral_bonus_log USING hash (idempotency_key);
@@ -0,0 +1,22 @@
+-- 📂 migrations/0016_admin_bank_config_singleton.sql — admin_bank_config как строгий singleton
+-- -----------------------------------------------------------------------------
+-- • Оставляем только самую свежую запись, фиксируем id = 1.
+-- • Убираем последовательность (SERIAL/IDENTITY) и добавляем CHECK (id = 1).
+-- Соответствует models.py: AdminBankConfig (admin_bank_config_singleton).
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+DELETE FROM efhc_core.admin_bank_config
+ WHERE id <> (SELECT id FROM efhc_core.admin_bank_config ORDER BY updated_at DESC LIMIT 1);
+UPDATE efhc_core.admin_bank_config SET id = 1;
+
+ALTER TABLE efhc_core.admin_bank_config ALTER COLUMN id DROP IDENTITY IF EXISTS;
+ALTER TABLE efhc_core.admin_bank_config ALTER COLUMN id DROP DEFAULT;
+DROP SEQUENCE IF EXISTS efhc_core.admin_bank_config_id_seq;
+ALTER TABLE efhc_core.admin_bank_config ALTER COLUMN id SET DEFAULT 1;
+ALTER TABLE efhc_core.admin_bank_config
+  ADD CONSTRAINT admin_bank_config_singleton CHECK (id = 1);
+
+COMMIT;
@@ -0,0 +1,52 @@
+-- 📂 migrations/0017_users_active_referral_count.sql — денормализованный счётчик рефералов
+-- -----------------------------------------------------------------------------
+-- users.active_referral_count поддерживается триггером на referrals (INSERT/DELETE/смена inviter_id).
+-- Проверка порогов бонусов — чтение колонки (частичный индекс), без count(*) по referrals.
+-- Соответствует models.py: User.active_referral_count, ix_users_active_referral_count.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.users
+  ADD COLUMN IF NOT EXISTS active_referral_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION efhc_core.bump_active_ref_count()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.inviter_id IS NOT NULL THEN
+    UPDATE efhc_core.users
+       SET active_referral_count = active_referral_count - 1
+     WHERE telegram_id = OLD.inviter_id;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.inviter_id IS NOT NULL THEN
+    UPDATE efhc_core.users
+       SET active_referral_count = active_referral_count + 1
+     WHERE telegram_id = NEW.inviter_id;
+  END IF;
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS ref_count ON efhc_core.referrals;
+CREATE TRIGGER ref_count
+  AFTER INSERT OR DELETE OR UPDATE OF inviter_id ON efhc_core.referrals
+  FOR EACH ROW EXECUTE FUNCTION efhc_core.bump_active_ref_count();
+
+-- Начальное заполнение
+UPDATE efhc_core.users u
+   SET active_referral_count = c.cnt
+  FROM (
+    SELECT inviter_id, count(*)::int AS cnt
+      FROM efhc_core.referrals
+     WHERE inviter_id IS NOT NULL
+     GROUP BY inviter_id
+  ) c
+ WHERE u.telegram_id = c.inviter_id;
+
+CREATE INDEX IF NOT EXISTS ix_users_active_referral_count
+  ON efhc_core.users (active_referral_count)
+  WHERE active_referral_count >= 10;
+
+COMMIT;
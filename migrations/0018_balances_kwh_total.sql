@@ -0,0 +1,14 @@
+-- 📂 migrations/0018_balances_kwh_total.sql — колонка balances.kwh_total
+-- -----------------------------------------------------------------------------
+-- • kwh_total — неубывающая сумма начисленных kWh (рейтинг); пишется пакетным
+--   начислением планировщика (scheduler.run_daily_kwh_accrual, SQL_KWH_ACCRUAL_DAY) вместе с kwh.
+-- Соответствует models.py: Balance.kwh_total.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.balances
+  ADD COLUMN IF NOT EXISTS kwh_total NUMERIC(30, 8) NOT NULL DEFAULT 0;
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- 📂 migrations/0019_panels_covering_and_sweep_indexes.sql — покрывающий индекс панелей и индекс архивации
+-- -----------------------------------------------------------------------------
+-- • ix_panels_user_active_exp (telegram_id, active, expires_at) INCLUDE (id) заменяет
+--   ix_panels_user_active: выборки панелей пользователя идут index-only, без чтения heap.
+-- • ix_panels_expiry_sweep (expires_at) WHERE active — ночное архивирование
+--   (WHERE active AND expires_at <= now()) становится range scan вместо seq scan + filter.
+-- Соответствует models.py: Panel.__table_args__.
+-- CONCURRENTLY — вне транзакции.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_panels_user_active_exp
+  ON efhc_core.panels (telegram_id, active, expires_at)
+  INCLUDE (id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_panels_expiry_sweep
+  ON efhc_core.panels (expires_at)
+  WHERE active = true;
+
+DROP INDEX CONCURRENTLY IF EXISTS efhc_core.ix_panels_user_active;
@@ -0,0 +1,32 @@
+-- 📂 migrations/0020_partial_unique_idempotency_keys.sql — частичные UNIQUE по idempotency_key
+-- -----------------------------------------------------------------------------
+-- • UNIQUE(idempotency_key) → уникальный индекс WHERE idempotency_key IS NOT NULL
+--   для efhc_transfers_log, shop_orders, withdrawals, kwh_to_efhc_exchange_log.
+-- • Строки без ключа больше не занимают место в индексе и не трогают его при вставке.
+-- • Имена сохраняются (uq_*): новый индекс строится под временным именем, затем
+--   старое ограничение удаляется, индекс переименовывается.
+-- • referral_bonus_log не затрагивается: уникальность ключа — в referral_bonus_idem (0014).
+-- Соответствует models.py: EFHCTransfersLog, ShopOrder, WithdrawRequest, KwhToEfhcExchangeLog.
+-- CONCURRENTLY — вне транзакции.
+
+SET search_path TO efhc_core, public;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_efhc_log_idem_p
+  ON efhc_core.efhc_transfers_log (idempotency_key) WHERE idempotency_key IS NOT NULL;
+ALTER TABLE efhc_core.efhc_transfers_log DROP CONSTRAINT IF EXISTS uq_efhc_log_idem;
+ALTER INDEX efhc_core.uq_efhc_log_idem_p RENAME TO uq_efhc_log_idem;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_shop_orders_idem_p
+  ON efhc_core.shop_orders (idempotency_key) WHERE idempotency_key IS NOT NULL;
+ALTER TABLE efhc_core.shop_orders DROP CONSTRAINT IF EXISTS uq_shop_orders_idem;
+ALTER INDEX efhc_core.uq_shop_orders_idem_p RENAME TO uq_shop_orders_idem;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_withdrawals_idem_p
+  ON efhc_core.withdrawals (idempotency_key) WHERE idempotency_key IS NOT NULL;
+ALTER TABLE efhc_core.withdrawals DROP CONSTRAINT IF EXISTS uq_withdrawals_idem;
+ALTER INDEX efhc_core.uq_withdrawals_idem_p RENAME TO uq_withdrawals_idem;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_kwh_to_efhc_idem_p
+  ON efhc_core.kwh_to_efhc_exchange_log (idempotency_key) WHERE idempotency_key IS NOT NULL;
+ALTER TABLE efhc_core.kwh_to_efhc_exchange_log DROP CONSTRAINT IF EXISTS uq_kwh_to_efhc_idem;
+ALTER INDEX efhc_core.uq_kwh_to_efhc_idem_p RENAME TO uq_kwh_to_efhc_idem;
@@ -0,0 +1,12 @@
+-- 📂 migrations/0021_efhc_log_meta_gin.sql — GIN-индекс по efhc_transfers_log.meta
+-- -----------------------------------------------------------------------------
+-- • meta уже JSONB (0006); добавляем GIN (jsonb_path_ops) под запросы содержания
+--   вида meta @> '{"context": "panel"}' из админ-просмотра логов.
+-- • jsonb_path_ops компактнее стандартного jsonb_ops и покрывает именно @>.
+-- • Частичный (meta IS NOT NULL): строки без произвольного контекста в индекс не попадают.
+-- Соответствует models.py: EFHCTransfersLog.__table_args__ → ix_efhc_log_meta_gin.
+-- CONCURRENTLY — вне транзакции.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_efhc_log_meta_gin
+  ON efhc_core.efhc_transfers_log USING gin (meta jsonb_path_ops)
+  WHERE meta IS NOT NULL;
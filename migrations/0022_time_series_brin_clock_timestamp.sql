@@ -0,0 +1,28 @@
+-- 📂 migrations/0022_time_series_brin_clock_timestamp.sql — BRIN по времени в журналах + clock_timestamp()
+-- -----------------------------------------------------------------------------
+-- • efhc_transfers_log.ts, referral_bonus_log.created_at — DEFAULT clock_timestamp():
+--   время вставки строки, а не начала транзакции → значения монотонны в физическом порядке.
+-- • BRIN (pages_per_range = 32) под диапазонные выборки истории/аналитики:
+--     - efhc_transfers_log (ts)
+--     - referral_bonus_log (created_at) — на родителе, наследуется секциями
+--     - kwh_generation_log (accrual_date) — таблица планировщика (scheduler.ensure_scheduler_tables)
+-- • Избыточных btree по этим колонкам нет (составные индексы по telegram_id остаются).
+-- Соответствует models.py: EFHCTransfersLog, ReferralBonusLog; scheduler.DDL_KWH_GENERATION_LOG_BRIN.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.efhc_transfers_log ALTER COLUMN ts SET DEFAULT clock_timestamp();
+ALTER TABLE efhc_core.referral_bonus_log ALTER COLUMN created_at SET DEFAULT clock_timestamp();
+
+CREATE INDEX IF NOT EXISTS ix_efhc_log_ts_brin
+  ON efhc_core.efhc_transfers_log USING brin (ts) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS ix_ref_bonus_created_brin
+  ON efhc_core.referral_bonus_log USING brin (created_at) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS ix_kwh_gen_log_date_brin
+  ON efhc_core.kwh_generation_log USING brin (accrual_date) WITH (pages_per_range = 32);
+
+COMMIT;
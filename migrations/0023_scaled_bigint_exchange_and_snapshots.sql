@@ -0,0 +1,29 @@
+-- 📂 migrations/0023_scaled_bigint_exchange_and_snapshots.sql — NUMERIC → BIGINT (×10^8) для обмена и снимков kWh
+-- -----------------------------------------------------------------------------
+-- Продолжение 0010 для колонок, которые пишутся только через ORM (ScaledDecimal(8)):
+--   • kwh_to_efhc_exchange_log.amount_kwh   → amount_kwh_scaled BIGINT
+--   • kwh_to_efhc_exchange_log.amount_efhc  → amount_efhc_scaled BIGINT
+--   • efhc_transfers_log.snapshot_kwh_before → snapshot_kwh_before_scaled BIGINT
+--   • efhc_transfers_log.snapshot_kwh_after  → snapshot_kwh_after_scaled BIGINT
+-- balances.* / efhc_transfers_log.amount / withdrawals / shop_orders остаются NUMERIC(30,8):
+-- их пишут raw SQL-запросы в роутерах, и смена типа без переписывания этих запросов
+-- исказила бы суммы.
+-- Соответствует models.py: KwhToEfhcExchangeLog, EFHCTransfersLog.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.kwh_to_efhc_exchange_log
+  ALTER COLUMN amount_kwh  TYPE BIGINT USING round(amount_kwh  * 100000000)::bigint,
+  ALTER COLUMN amount_efhc TYPE BIGINT USING round(amount_efhc * 100000000)::bigint;
+ALTER TABLE efhc_core.kwh_to_efhc_exchange_log RENAME COLUMN amount_kwh  TO amount_kwh_scaled;
+ALTER TABLE efhc_core.kwh_to_efhc_exchange_log RENAME COLUMN amount_efhc TO amount_efhc_scaled;
+
+ALTER TABLE efhc_core.efhc_transfers_log
+  ALTER COLUMN snapshot_kwh_before TYPE BIGINT USING round(snapshot_kwh_before * 100000000)::bigint,
+  ALTER COLUMN snapshot_kwh_after  TYPE BIGINT USING round(snapshot_kwh_after  * 100000000)::bigint;
+ALTER TABLE efhc_core.efhc_transfers_log RENAME COLUMN snapshot_kwh_before TO snapshot_kwh_before_scaled;
+ALTER TABLE efhc_core.efhc_transfers_log RENAME COLUMN snapshot_kwh_after  TO snapshot_kwh_after_scaled;
+
+COMMIT;
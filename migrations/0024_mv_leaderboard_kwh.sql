@@ -0,0 +1,18 @@
+-- 📂 migrations/0024_mv_leaderboard_kwh.sql — материализованный рейтинг по kwh_total
+-- -----------------------------------------------------------------------------
+-- Раздел «Рейтинг» читает топ-K по уникальному индексу (rank) вместо
+-- ORDER BY kwh_total DESC по всей balances на каждый запрос.
+-- Уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY.
+-- Обновление: scheduler.refresh_leaderboard (каждые LEADERBOARD_REFRESH_MINUTES).
+-- Соответствует models.py: LeaderboardKwhMV.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS efhc_core.mv_leaderboard_kwh AS
+  SELECT row_number() OVER (ORDER BY kwh_total DESC, telegram_id) AS rank,
+         telegram_id,
+         kwh_total
+    FROM efhc_core.balances
+   WHERE kwh_total > 0
+WITH DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_leaderboard_kwh_rank
+  ON efhc_core.mv_leaderboard_kwh (rank);
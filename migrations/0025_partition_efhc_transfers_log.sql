@@ -0,0 +1,124 @@
+-- 📂 migrations/0025_partition_efhc_transfers_log.sql — помесячное секционирование efhc_transfers_log
+-- -----------------------------------------------------------------------------
+-- • efhc_transfers_log → PARTITION BY RANGE (ts), секции по месяцам + DEFAULT.
+-- • PK (id, ts): ключ секционирования обязан входить в уникальные индексы.
+-- • Глобальная уникальность idempotency_key — отдельная таблица efhc_transfers_idem (PK),
+--   ключ занимается в том же запросе, что пишет строку лога (transactions.log_transfer).
+-- • Функция ensure_efhc_transfers_log_partitions(ahead) — секции на текущий и ahead
+--   следующих месяцев; вызывается планировщиком (scheduler.create_ref_bonus_partitions).
+-- Соответствует models.py: EFHCTransfersLog, EFHCTransfersIdem, ensure_efhc_log_partitions().
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+-- 1) Функция создания помесячных секций
+CREATE OR REPLACE FUNCTION efhc_core.ensure_efhc_transfers_log_partitions(ahead integer DEFAULT 2)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  m_from date;
+  m_to   date;
+  i      integer;
+BEGIN
+  FOR i IN 0..ahead LOOP
+    m_from := (date_trunc('month', now()) + make_interval(months => i))::date;
+    m_to   := (m_from + interval '1 month')::date;
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS efhc_core.%I PARTITION OF efhc_core.efhc_transfers_log
+         FOR VALUES FROM (%L) TO (%L)',
+      'efhc_transfers_log_y' || to_char(m_from, 'YYYY') || 'm' || to_char(m_from, 'MM'),
+      m_from, m_to
+    );
+  END LOOP;
+END $$;
+
+-- 2) Новая секционированная таблица
+ALTER TABLE efhc_core.efhc_transfers_log RENAME TO efhc_transfers_log_old;
+
+CREATE TABLE efhc_core.efhc_transfers_log (
+  id                         BIGINT GENERATED BY DEFAULT AS IDENTITY,
+  from_id                    BIGINT NOT NULL,
+  to_id                      BIGINT NOT NULL,
+  amount                     NUMERIC(30, 8) NOT NULL,
+  reason                     VARCHAR(64) NOT NULL,
+  idempotency_key            VARCHAR(128) NULL,
+  order_id                   BIGINT NULL,
+  withdraw_id                BIGINT NULL,
+  snapshot_kwh_before_scaled BIGINT NULL,
+  snapshot_kwh_after_scaled  BIGINT NULL,
+  meta                       JSONB NULL,
+  ts                         TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
+
+CREATE TABLE efhc_core.efhc_transfers_log_default PARTITION OF efhc_core.efhc_transfers_log DEFAULT;
+
+-- Секции под уже накопленные данные (от самого раннего месяца) и на 2 месяца вперёд
+DO $$
+DECLARE
+  m_from date;
+BEGIN
+  SELECT date_trunc('month', COALESCE(min(ts), now()))::date INTO m_from
+    FROM efhc_core.efhc_transfers_log_old;
+  WHILE m_from < date_trunc('month', now())::date LOOP
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS efhc_core.%I PARTITION OF efhc_core.efhc_transfers_log
+         FOR VALUES FROM (%L) TO (%L)',
+      'efhc_transfers_log_y' || to_char(m_from, 'YYYY') || 'm' || to_char(m_from, 'MM'),
+      m_from, (m_from + interval '1 month')::date
+    );
+    m_from := (m_from + interval '1 month')::date;
+  END LOOP;
+END $$;
+SELECT efhc_core.ensure_efhc_transfers_log_partitions(2);
+
+-- 3) Перенос данных
+INSERT INTO efhc_core.efhc_transfers_log
+  (id, from_id, to_id, amount, reason, idempotency_key, order_id, withdraw_id,
+   snapshot_kwh_before_scaled, snapshot_kwh_after_scaled, meta, ts)
+SELECT id, from_id, to_id, amount, reason, idempotency_key, order_id, withdraw_id,
+       snapshot_kwh_before_scaled, snapshot_kwh_after_scaled, meta, ts
+  FROM efhc_core.efhc_transfers_log_old;
+
+SELECT setval(
+  pg_get_serial_sequence('efhc_core.efhc_transfers_log', 'id'),
+  COALESCE((SELECT max(id) FROM efhc_core.efhc_transfers_log), 0) + 1,
+  false
+);
+
+-- 4) Реестр ключей идемпотентности
+CREATE TABLE IF NOT EXISTS efhc_core.efhc_transfers_idem (
+  idempotency_key VARCHAR(128) PRIMARY KEY,
+  created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO efhc_core.efhc_transfers_idem (idempotency_key, created_at)
+SELECT idempotency_key, min(ts)
+  FROM efhc_core.efhc_transfers_log_old
+ WHERE idempotency_key IS NOT NULL
+ GROUP BY idempotency_key
+ON CONFLICT DO NOTHING;
+
+-- 5) Индексы (создаются на родителе → наследуются всеми секциями)
+CREATE INDEX ix_efhc_log_from_id_p ON efhc_core.efhc_transfers_log (from_id);
+CREATE INDEX ix_efhc_log_to_id_p ON efhc_core.efhc_transfers_log (to_id);
+CREATE INDEX ix_efhc_log_order_id_p ON efhc_core.efhc_transfers_log (order_id)
+  WHERE order_id IS NOT NULL;
+CREATE INDEX ix_efhc_log_withdraw_id_p ON efhc_core.efhc_transfers_log (withdraw_id)
+  WHERE withdraw_id IS NOT NULL;
+CREATE INDEX ix_efhc_log_ts_brin_p ON efhc_core.efhc_transfers_log
+  USING brin (ts) WITH (pages_per_range = 32);
+CREATE INDEX ix_efhc_log_meta_gin_p ON efhc_core.efhc_transfers_log
+  USING gin (meta jsonb_path_ops) WHERE meta IS NOT NULL;
+
+DROP TABLE efhc_core.efhc_transfers_log_old;
+
+ALTER INDEX efhc_core.ix_efhc_log_from_id_p RENAME TO ix_efhc_log_from_id;
+ALTER INDEX efhc_core.ix_efhc_log_to_id_p RENAME TO ix_efhc_log_to_id;
+ALTER INDEX efhc_core.ix_efhc_log_order_id_p RENAME TO ix_efhc_log_order_id;
+ALTER INDEX efhc_core.ix_efhc_log_withdraw_id_p RENAME TO ix_efhc_log_withdraw_id;
+ALTER INDEX efhc_core.ix_efhc_log_ts_brin_p RENAME TO ix_efhc_log_ts_brin;
+ALTER INDEX efhc_core.ix_efhc_log_meta_gin_p RENAME TO ix_efhc_log_meta_gin;
+
+COMMIT;
@@ -0,0 +1,11 @@
+-- 📂 migrations/0026_balances_kwh_total_desc_index.sql — индекс рейтинга по kwh_total
+-- -----------------------------------------------------------------------------
+-- ORDER BY kwh_total DESC, telegram_id LIMIT K (живой рейтинг и пересчёт mv_leaderboard_kwh)
+-- → прямой проход по индексу без сортировки. Частичный (kwh_total > 0): новые пользователи
+-- с нулевой генерацией в индекс не попадают.
+-- Соответствует models.py: Balance.__table_args__ → ix_balances_kwh_total_desc.
+-- CONCURRENTLY — вне транзакции.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_balances_kwh_total_desc
+  ON efhc_core.balances (kwh_total DESC, telegram_id)
+  WHERE kwh_total > 0;
@@ -0,0 +1,68 @@
+-- 📂 migrations/0027_hash_partition_balances.sql — HASH-секционирование balances по telegram_id
+-- -----------------------------------------------------------------------------
+-- • balances → PARTITION BY HASH (telegram_id), 16 секций (MODULUS 16).
+--   Обновления разных пользователей расходятся по разным heap/индексам; VACUUM и WAL
+--   распределяются по секциям, рабочий набор каждой секции меньше.
+-- • autovacuum_vacuum_scale_factor = 0.02 на секцию — частые UPDATE балансов
+--   вычищаются раньше, секции не раздуваются.
+-- • PK (telegram_id) совпадает с ключом секционирования → ON CONFLICT (telegram_id) работает как раньше.
+-- • mv_leaderboard_kwh ссылается на старую таблицу → пересоздаётся (определение как в 0024).
+-- Соответствует models.py: Balance.__table_args__ (postgresql_partition_by), LeaderboardKwhMV.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+DROP MATERIALIZED VIEW IF EXISTS efhc_core.mv_leaderboard_kwh;
+
+ALTER TABLE efhc_core.balances RENAME TO balances_old;
+
+CREATE TABLE efhc_core.balances (
+  telegram_id       BIGINT NOT NULL REFERENCES efhc_core.users(telegram_id) ON DELETE CASCADE,
+  efhc              NUMERIC(30, 8) NOT NULL DEFAULT 0,
+  bonus_efhc        NUMERIC(30, 8) NOT NULL DEFAULT 0,
+  kwh               NUMERIC(30, 8) NOT NULL DEFAULT 0,
+  kwh_total         NUMERIC(30, 8) NOT NULL DEFAULT 0,
+  last_generated_at TIMESTAMPTZ NULL,
+  updated_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (telegram_id),
+  CONSTRAINT ck_balances_nonneg_p CHECK (efhc >= 0 AND bonus_efhc >= 0 AND kwh >= 0)
+) PARTITION BY HASH (telegram_id);
+
+DO $$
+BEGIN
+  FOR i IN 0..15 LOOP
+    EXECUTE format(
+      'CREATE TABLE efhc_core.%I PARTITION OF efhc_core.balances
+         FOR VALUES WITH (MODULUS 16, REMAINDER %s)
+         WITH (autovacuum_vacuum_scale_factor = 0.02)',
+      'balances_p' || i, i
+    );
+  END LOOP;
+END $$;
+
+INSERT INTO efhc_core.balances
+  (telegram_id, efhc, bonus_efhc, kwh, kwh_total, last_generated_at, updated_at)
+SELECT telegram_id, efhc, bonus_efhc, kwh, kwh_total, last_generated_at, updated_at
+  FROM efhc_core.balances_old;
+
+DROP TABLE efhc_core.balances_old;
+
+ALTER TABLE efhc_core.balances RENAME CONSTRAINT ck_balances_nonneg_p TO ck_balances_nonneg;
+
+CREATE INDEX ix_balances_kwh_total_desc
+  ON efhc_core.balances (kwh_total DESC, telegram_id)
+  WHERE kwh_total > 0;
+
+CREATE MATERIALIZED VIEW efhc_core.mv_leaderboard_kwh AS
+  SELECT row_number() OVER (ORDER BY kwh_total DESC, telegram_id) AS rank,
+         telegram_id,
+         kwh_total
+    FROM efhc_core.balances
+   WHERE kwh_total > 0
+WITH DATA;
+
+CREATE UNIQUE INDEX ux_mv_leaderboard_kwh_rank
+  ON efhc_core.mv_leaderboard_kwh (rank);
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- 📂 migrations/0028_hot_path_composite_indexes.sql — составные/частичные индексы горячих выборок
+-- -----------------------------------------------------------------------------
+-- • shop_orders (telegram_id, status) — «мои заказы в статусе X»; заменяет ix_shop_orders_user.
+-- • withdrawals (created_at) WHERE status = 'pending' — очередь заявок на вывод (FIFO).
+-- • manual_nft_requests (created_at) WHERE status = 'open' — очередь manual-заявок NFT.
+-- Соответствует models.py: ShopOrder, WithdrawRequest, ManualNFTRequest.
+-- CONCURRENTLY — вне транзакции.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_shop_orders_user_status
+  ON efhc_core.shop_orders (telegram_id, status);
+DROP INDEX CONCURRENTLY IF EXISTS efhc_core.ix_shop_orders_user;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_withdrawals_pending_created
+  ON efhc_core.withdrawals (created_at)
+  WHERE status = 'pending';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_manual_nft_requests_open
+  ON efhc_core.manual_nft_requests (created_at)
+  WHERE status = 'open';
@@ -0,0 +1,21 @@
+-- 📂 migrations/0029_user_tasks_unique_completion.sql — одно выполнение задания на пользователя
+-- -----------------------------------------------------------------------------
+-- • UNIQUE (telegram_id, task_id) на efhc_tasks.user_tasks: /user/tasks/complete пишет
+--   INSERT ... ON CONFLICT DO NOTHING RETURNING id вместо SELECT-перед-INSERT.
+-- • Перед созданием индекса удаляем возможные дубли (оставляем самое раннее выполнение).
+-- • Индекс создаётся только здесь: в ensure-DDL user_routes он падал бы на существующих дублях
+--   до прогона этой миграции.
+-- Соответствует user_routes.py: _TASK_COMPLETE_SQL (ON CONFLICT (telegram_id, task_id)).
+
+BEGIN;
+
+DELETE FROM efhc_tasks.user_tasks t
+ USING efhc_tasks.user_tasks d
+ WHERE t.telegram_id = d.telegram_id
+   AND t.task_id = d.task_id
+   AND t.id > d.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_tasks_user_task
+  ON efhc_tasks.user_tasks (telegram_id, task_id);
+
+COMMIT;
@@ -0,0 +1,37 @@
+-- 📂 migrations/0031_admin_nft_permissions_bitmask.sql — права admin-NFT битовой маской в whitelist
+-- -----------------------------------------------------------------------------
+-- • admin_nft_whitelist.permissions SMALLINT — 7 флагов admin_nft_permissions одним полем:
+--   SHOP=1, TASKS=2, LOTTERIES=4, USERS=8, WITHDRAWALS=16, PANELS=32, ALL=64.
+-- • Бэкфилл: OR по всем строкам прав данного NFT; затем admin_nft_permissions удаляется
+--   (проверка прав — одно чтение строки whitelist, без JOIN).
+-- Соответствует models.py: AdminPerm.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.admin_nft_whitelist
+  ADD COLUMN IF NOT EXISTS permissions SMALLINT NOT NULL DEFAULT 0;
+
+UPDATE efhc_core.admin_nft_whitelist w
+   SET permissions = p.mask
+  FROM (
+        SELECT admin_nft_id,
+               bit_or(
+                   (CASE WHEN can_shop        THEN 1  ELSE 0 END)
+                 | (CASE WHEN can_tasks       THEN 2  ELSE 0 END)
+                 | (CASE WHEN can_lotteries   THEN 4  ELSE 0 END)
+                 | (CASE WHEN can_users       THEN 8  ELSE 0 END)
+                 | (CASE WHEN can_withdrawals THEN 16 ELSE 0 END)
+                 | (CASE WHEN can_panels      THEN 32 ELSE 0 END)
+                 | (CASE WHEN can_all         THEN 64 ELSE 0 END)
+               )::smallint AS mask
+          FROM efhc_core.admin_nft_permissions
+         WHERE admin_nft_id IS NOT NULL
+         GROUP BY admin_nft_id
+       ) p
+ WHERE w.id = p.admin_nft_id;
+
+DROP TABLE IF EXISTS efhc_core.admin_nft_permissions;
+
+COMMIT;
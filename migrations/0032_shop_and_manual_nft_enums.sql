@@ -0,0 +1,42 @@
+-- 📂 migrations/0032_shop_and_manual_nft_enums.sql — ENUM для типов заказа, валюты оплаты и статуса manual-заявок
+-- -----------------------------------------------------------------------------
+-- • shop_orders.order_type: TEXT + CHECK → efhc_core.shop_order_type ('efhc','vip','nft').
+-- • shop_orders.pay_asset: TEXT → efhc_core.pay_asset ('TON','USDT','EFHC').
+-- • manual_nft_requests.status: TEXT → efhc_core.manual_nft_status ('open','processed','canceled').
+-- • Индексы/предикаты (ix_manual_nft_requests_open, ix_shop_orders_user_status) перестраиваются
+--   автоматически; литералы в raw SQL (status = 'open') приводятся к ENUM сервером.
+-- Соответствует models.py: ShopOrder.order_type/pay_asset, ManualNFTRequest.status.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+                 WHERE t.typname = 'shop_order_type' AND n.nspname = 'efhc_core') THEN
+    CREATE TYPE efhc_core.shop_order_type AS ENUM ('efhc', 'vip', 'nft');
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+                 WHERE t.typname = 'pay_asset' AND n.nspname = 'efhc_core') THEN
+    CREATE TYPE efhc_core.pay_asset AS ENUM ('TON', 'USDT', 'EFHC');
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+                 WHERE t.typname = 'manual_nft_status' AND n.nspname = 'efhc_core') THEN
+    CREATE TYPE efhc_core.manual_nft_status AS ENUM ('open', 'processed', 'canceled');
+  END IF;
+END $$;
+
+-- CHECK (order_type IN (...)) из DDL shop_routes избыточен при ENUM
+ALTER TABLE efhc_core.shop_orders DROP CONSTRAINT IF EXISTS shop_orders_order_type_check;
+ALTER TABLE efhc_core.shop_orders
+  ALTER COLUMN order_type TYPE efhc_core.shop_order_type USING order_type::efhc_core.shop_order_type;
+ALTER TABLE efhc_core.shop_orders
+  ALTER COLUMN pay_asset TYPE efhc_core.pay_asset USING upper(NULLIF(pay_asset, ''))::efhc_core.pay_asset;
+
+ALTER TABLE efhc_core.manual_nft_requests ALTER COLUMN status DROP DEFAULT;
+ALTER TABLE efhc_core.manual_nft_requests
+  ALTER COLUMN status TYPE efhc_core.manual_nft_status USING status::efhc_core.manual_nft_status;
+ALTER TABLE efhc_core.manual_nft_requests ALTER COLUMN status SET DEFAULT 'open';
+
+COMMIT;
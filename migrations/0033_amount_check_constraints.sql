@@ -0,0 +1,26 @@
+-- 📂 migrations/0033_amount_check_constraints.sql — инварианты сумм на стороне БД
+-- -----------------------------------------------------------------------------
+-- • balances: kwh_total >= 0 (efhc/bonus_efhc/kwh уже под ck_balances_nonneg, миграция 0002).
+-- • withdrawals: amount_efhc > 0.
+-- • shop_orders: efhc_amount > 0 и pay_amount >= 0 (если заданы).
+-- Списания делаются условным UPDATE ... WHERE efhc >= :x RETURNING — без предварительного SELECT;
+-- CHECK — последний рубеж, если в коде ошибка.
+-- Соответствует models.py: Balance, WithdrawRequest, ShopOrder (__table_args__).
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.balances
+  ADD CONSTRAINT ck_balances_kwh_total_nonneg CHECK (kwh_total >= 0);
+
+ALTER TABLE efhc_core.withdrawals
+  ADD CONSTRAINT ck_withdrawals_amount_pos CHECK (amount_efhc > 0) NOT VALID;
+ALTER TABLE efhc_core.withdrawals VALIDATE CONSTRAINT ck_withdrawals_amount_pos;
+
+ALTER TABLE efhc_core.shop_orders
+  ADD CONSTRAINT ck_shop_orders_amounts
+  CHECK ((efhc_amount IS NULL OR efhc_amount > 0) AND (pay_amount IS NULL OR pay_amount >= 0)) NOT VALID;
+ALTER TABLE efhc_core.shop_orders VALIDATE CONSTRAINT ck_shop_orders_amounts;
+
+COMMIT;
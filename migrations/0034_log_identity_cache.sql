@@ -0,0 +1,25 @@
+-- 📂 migrations/0034_log_identity_cache.sql — CACHE 200 для identity-последовательностей журналов
+-- -----------------------------------------------------------------------------
+-- • efhc_transfers_log, referral_bonus_log, kwh_to_efhc_exchange_log, panel_archive:
+--   каждая сессия резервирует 200 значений id за один nextval (меньше обращений к последовательности
+--   при конкурентной записи). id остаются возрастающими в пределах сессии, возможны «дыры».
+-- Соответствует models.py: IDENTITY_CACHE, Identity(..., cache=IDENTITY_CACHE).
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+DO $$
+DECLARE
+  t   text;
+  seq text;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['efhc_transfers_log', 'referral_bonus_log', 'kwh_to_efhc_exchange_log', 'panel_archive'] LOOP
+    seq := pg_get_serial_sequence('efhc_core.' || t, 'id');
+    IF seq IS NOT NULL THEN
+      EXECUTE format('ALTER SEQUENCE %s CACHE 200', seq);
+    END IF;
+  END LOOP;
+END $$;
+
+COMMIT;
@@ -0,0 +1,36 @@
+-- 📂 migrations/0035_referrals_activated_at.sql — отметка активации реферала + частичный индекс
+-- -----------------------------------------------------------------------------
+-- • referrals.activated_at — момент первой покупки панели приглашённым (NULL — не активен).
+--   Ставится при начислении бонуса 'first_panel' (referral.mark_user_active_and_reward_referrer,
+--   ReferralBonusLog.award_first_panel_bonuses).
+-- • Бэкфилл — по самой ранней панели (активной или из архива) приглашённого.
+-- • Частичный ix_referrals_inviter_activated (inviter_id) INCLUDE (invitee_id) WHERE activated_at IS NOT NULL:
+--   подсчёт активных рефералов — index-only scan, без EXISTS по panels (и без потери рефералов,
+--   чьи панели ушли в архив).
+-- ADD COLUMN (NULL, без DEFAULT) — только каталог, без перезаписи таблицы.
+-- Соответствует models.py: Referral.activated_at, Referral.__table_args__ → ix_referrals_inviter_activated.
+-- CONCURRENTLY — вне транзакции.
+
+SET search_path TO efhc_core, public;
+
+ALTER TABLE efhc_core.referrals ADD COLUMN IF NOT EXISTS activated_at TIMESTAMPTZ NULL;
+
+UPDATE efhc_core.referrals r
+   SET activated_at = p.first_at
+  FROM (
+        SELECT telegram_id, min(activated_at) AS first_at
+          FROM (
+                SELECT telegram_id, activated_at FROM efhc_core.panels
+                UNION ALL
+                SELECT telegram_id, activated_at FROM efhc_core.panel_archive WHERE telegram_id IS NOT NULL
+               ) x
+         GROUP BY telegram_id
+       ) p
+ WHERE r.invitee_id = p.telegram_id
+   AND r.activated_at IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_referrals_inviter_activated
+  ON efhc_core.referrals (inviter_id) INCLUDE (invitee_id)
+  WHERE activated_at IS NOT NULL;
+
+VACUUM ANALYZE efhc_core.referrals;
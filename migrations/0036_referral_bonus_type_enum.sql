@@ -0,0 +1,25 @@
+-- 📂 migrations/0036_referral_bonus_type_enum.sql — ENUM для типа реферального бонуса
+-- -----------------------------------------------------------------------------
+-- • referral_bonus_log.bonus_type: VARCHAR(32) → efhc_core.referral_bonus_type ('first_panel','threshold').
+-- • Тип хранится в каждой строке лога (история «мои бонусы по типу», аналитика): 4 байта вместо
+--   строки переменной длины, сравнение по OID значения вместо collation.
+-- • ALTER на секционированной таблице проходит по всем секциям; индексы перестраиваются автоматически.
+--   Литералы в raw SQL ('first_panel') приводятся к ENUM сервером.
+-- Соответствует models.py: ReferralBonusLog.bonus_type, REFERRAL_BONUS_TYPES.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+                 WHERE t.typname = 'referral_bonus_type' AND n.nspname = 'efhc_core') THEN
+    CREATE TYPE efhc_core.referral_bonus_type AS ENUM ('first_panel', 'threshold');
+  END IF;
+END $$;
+
+ALTER TABLE efhc_core.referral_bonus_log
+  ALTER COLUMN bonus_type TYPE efhc_core.referral_bonus_type USING bonus_type::efhc_core.referral_bonus_type;
+
+COMMIT;
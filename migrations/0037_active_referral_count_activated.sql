@@ -0,0 +1,47 @@
+-- 📂 migrations/0037_active_referral_count_activated.sql — users.active_referral_count считает только активных
+-- -----------------------------------------------------------------------------
+-- • «Активный» реферал — referrals.activated_at IS NOT NULL (первая панель, миграция 0035).
+-- • Активацию (activated_at NULL → now()) счётчик получает +1 в том же запросе, что ставит activated_at
+--   (UPDATE users ... RETURNING active_referral_count): порог проверяется сравнением нового значения,
+--   без count(*) по referrals на каждую покупку.
+-- • Триггер ref_count теперь учитывает только уже активных: INSERT/DELETE/смена inviter_id.
+--   UPDATE OF inviter_id не срабатывает на UPDATE ... SET activated_at — двойного учёта нет.
+-- • Пересчёт существующих значений по activated_at.
+-- Соответствует models.py: User.active_referral_count, ReferralBonusLog.award_first_panel_bonuses;
+-- referral.py: mark_user_active_and_reward_referrer.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION efhc_core.bump_active_ref_count()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.inviter_id IS NOT NULL AND OLD.activated_at IS NOT NULL THEN
+    UPDATE efhc_core.users
+       SET active_referral_count = active_referral_count - 1
+     WHERE telegram_id = OLD.inviter_id;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.inviter_id IS NOT NULL AND NEW.activated_at IS NOT NULL THEN
+    UPDATE efhc_core.users
+       SET active_referral_count = active_referral_count + 1
+     WHERE telegram_id = NEW.inviter_id;
+  END IF;
+  RETURN NULL;
+END $$;
+
+-- Пересчёт: index-only по ix_referrals_inviter_activated на каждого пользователя
+UPDATE efhc_core.users u
+   SET active_referral_count = c.cnt
+  FROM (
+    SELECT u2.telegram_id,
+           (SELECT count(*)::int FROM efhc_core.referrals r
+             WHERE r.inviter_id = u2.telegram_id AND r.activated_at IS NOT NULL) AS cnt
+      FROM efhc_core.users u2
+  ) c
+ WHERE u.telegram_id = c.telegram_id
+   AND u.active_referral_count <> c.cnt;
+
+COMMIT;
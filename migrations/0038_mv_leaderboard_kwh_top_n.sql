@@ -0,0 +1,33 @@
+-- 📂 migrations/0038_mv_leaderboard_kwh_top_n.sql — рейтинг kWh: в представлении только топ-1000
+-- -----------------------------------------------------------------------------
+-- • mv_leaderboard_kwh хранил всех пользователей с kwh_total > 0: каждый REFRESH CONCURRENTLY
+--   нумеровал и сравнивал со старым снимком всю balances, хотя /user/rating читает ≤ LEADERBOARD_TOP_LIMIT мест.
+-- • Теперь — первые 1000 мест: ORDER BY kwh_total DESC, telegram_id LIMIT 1000 идёт по
+--   ix_balances_kwh_total_desc (Merge Append по секциям) и останавливается на 1000-й строке;
+--   REFRESH и диф снимка — фиксированного размера.
+-- • Определение и уникальный индекс ux_mv_leaderboard_kwh_rank — как в 0024/0027, плюс LIMIT.
+-- Соответствует models.py: LeaderboardKwhMV; config.py: LEADERBOARD_TOP_LIMIT (≤ 1000).
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+DROP MATERIALIZED VIEW IF EXISTS efhc_core.mv_leaderboard_kwh;
+
+CREATE MATERIALIZED VIEW efhc_core.mv_leaderboard_kwh AS
+  SELECT row_number() OVER (ORDER BY kwh_total DESC, telegram_id) AS rank,
+         telegram_id,
+         kwh_total
+    FROM (
+          SELECT telegram_id, kwh_total
+            FROM efhc_core.balances
+           WHERE kwh_total > 0
+           ORDER BY kwh_total DESC, telegram_id
+           LIMIT 1000
+         ) top
+WITH DATA;
+
+CREATE UNIQUE INDEX ux_mv_leaderboard_kwh_rank
+  ON efhc_core.mv_leaderboard_kwh (rank);
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- 📂 migrations/0039_tasks_lottery_tickets_indexes.sql — индексы заданий и билетов лотерей
+-- -----------------------------------------------------------------------------
+-- • efhc_tasks.tasks (id) INCLUDE (title, url, reward_bonus_efhc) WHERE active — список активных
+--   заданий (/user/tasks) index-only по частичному индексу.
+-- • efhc_lottery.lottery_tickets (lottery_code, telegram_id) — билеты розыгрыша по пользователям
+--   (подсчёт/выбор победителя).
+-- Раньше оба индекса создавались в user_routes.ensure_user_routes_tables — на каждом запросе
+-- (CREATE INDEX берёт SHARE-блокировку и блокирует запись). Таблицы по-прежнему создаёт ensure-DDL.
+-- Соответствует user_routes.py: CREATE_TASKS_TABLES_SQL, CREATE_LOTTERY_TABLES_SQL.
+-- CONCURRENTLY — вне транзакции.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_active
+  ON efhc_tasks.tasks (id) INCLUDE (title, url, reward_bonus_efhc)
+  WHERE active;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lottery_tickets_code_user
+  ON efhc_lottery.lottery_tickets (lottery_code, telegram_id);
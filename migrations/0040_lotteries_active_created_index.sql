@@ -0,0 +1,12 @@
+-- 📂 migrations/0040_lotteries_active_created_index.sql — частичный индекс активных розыгрышей
+-- -----------------------------------------------------------------------------
+-- • efhc_lottery.lotteries (created_at) WHERE active — список активных розыгрышей
+--   (/user/lotteries: WHERE active ORDER BY created_at); счётчик — lotteries.tickets_sold, без COUNT(*).
+-- • Раньше создавался в user_routes.ensure_user_routes_tables на каждом запросе; индекс билетов
+--   ix_lottery_tickets_code_user перенесён туда же ранее — migrations/0039.
+-- Соответствует user_routes.py: CREATE_LOTTERY_TABLES_SQL.
+-- CONCURRENTLY — вне транзакции.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lotteries_active_created
+  ON efhc_lottery.lotteries (created_at)
+  WHERE active;
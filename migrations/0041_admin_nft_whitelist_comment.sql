@@ -0,0 +1,13 @@
+-- 📂 migrations/0041_admin_nft_whitelist_comment.sql — комментарий к строке whitelist admin-NFT
+-- -----------------------------------------------------------------------------
+-- • admin_nft_whitelist.comment TEXT — подпись NFT в админ-панели (POST /admin/nft/whitelist).
+-- Соответствует models.py: AdminNFTWhitelist.comment.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+ALTER TABLE efhc_core.admin_nft_whitelist
+  ADD COLUMN IF NOT EXISTS comment TEXT;
+
+COMMIT;
@@ -0,0 +1,52 @@
+-- 📂 migrations/0042_ref_bonus_partitions_drain_default.sql — секции referral_bonus_log при строках в DEFAULT
+-- -----------------------------------------------------------------------------
+-- • ensure_referral_bonus_log_partitions(ahead) (миграция 0014) создавала секцию через
+--   CREATE TABLE ... PARTITION OF. Если строки месяца уже попали в referral_bonus_log_default
+--   (планировщик не успел создать секцию заранее), PostgreSQL отказывает: DEFAULT содержит
+--   строки из диапазона новой секции — и секция этого месяца не создаётся никогда.
+-- • Теперь для отсутствующей секции: отдельная таблица (LIKE родителя) → перенос строк месяца
+--   из DEFAULT (DELETE ... RETURNING → INSERT) → ATTACH PARTITION. Всё в транзакции вызова.
+--   Существующие секции пропускаются.
+-- Соответствует models.py: ensure_ref_bonus_partitions(); scheduler.create_ref_bonus_partitions.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION efhc_core.ensure_referral_bonus_log_partitions(ahead integer DEFAULT 2)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  m_from date;
+  m_to   date;
+  part   text;
+  i      integer;
+BEGIN
+  FOR i IN 0..ahead LOOP
+    m_from := (date_trunc('month', now()) + make_interval(months => i))::date;
+    m_to   := (m_from + interval '1 month')::date;
+    part   := 'referral_bonus_log_y' || to_char(m_from, 'YYYY') || 'm' || to_char(m_from, 'MM');
+    CONTINUE WHEN to_regclass('efhc_core.' || part) IS NOT NULL;
+
+    EXECUTE format(
+      'CREATE TABLE efhc_core.%I (LIKE efhc_core.referral_bonus_log INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+      part
+    );
+    EXECUTE format(
+      'WITH moved AS (
+         DELETE FROM efhc_core.referral_bonus_log_default
+          WHERE created_at >= %L AND created_at < %L
+         RETURNING *
+       )
+       INSERT INTO efhc_core.%I SELECT * FROM moved',
+      m_from, m_to, part
+    );
+    EXECUTE format(
+      'ALTER TABLE efhc_core.referral_bonus_log ATTACH PARTITION efhc_core.%I FOR VALUES FROM (%L) TO (%L)',
+      part, m_from, m_to
+    );
+  END LOOP;
+END $$;
+
+COMMIT;
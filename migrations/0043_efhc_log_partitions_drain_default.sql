@@ -0,0 +1,49 @@
+-- 📂 migrations/0043_efhc_log_partitions_drain_default.sql — секции efhc_transfers_log при строках в DEFAULT
+-- -----------------------------------------------------------------------------
+-- • Та же правка, что 0042 для referral_bonus_log: ensure_efhc_transfers_log_partitions (0025)
+--   падала на CREATE TABLE ... PARTITION OF, если переводы месяца уже легли в
+--   efhc_transfers_log_default. Недостающая секция теперь создаётся отдельно, строки месяца
+--   (по ts) переносятся из DEFAULT, затем ATTACH PARTITION.
+-- Соответствует models.py: ensure_efhc_log_partitions(); scheduler.create_ref_bonus_partitions.
+
+SET search_path TO efhc_core, public;
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION efhc_core.ensure_efhc_transfers_log_partitions(ahead integer DEFAULT 2)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  m_from date;
+  m_to   date;
+  part   text;
+  i      integer;
+BEGIN
+  FOR i IN 0..ahead LOOP
+    m_from := (date_trunc('month', now()) + make_interval(months => i))::date;
+    m_to   := (m_from + interval '1 month')::date;
+    part   := 'efhc_transfers_log_y' || to_char(m_from, 'YYYY') || 'm' || to_char(m_from, 'MM');
+    CONTINUE WHEN to_regclass('efhc_core.' || part) IS NOT NULL;
+
+    EXECUTE format(
+      'CREATE TABLE efhc_core.%I (LIKE efhc_core.efhc_transfers_log INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+      part
+    );
+    EXECUTE format(
+      'WITH moved AS (
+         DELETE FROM efhc_core.efhc_transfers_log_default
+          WHERE ts >= %L AND ts < %L
+         RETURNING *
+       )
+       INSERT INTO efhc_core.%I SELECT * FROM moved',
+      m_from, m_to, part
+    );
+    EXECUTE format(
+      'ALTER TABLE efhc_core.efhc_transfers_log ATTACH PARTITION efhc_core.%I FOR VALUES FROM (%L) TO (%L)',
+      part, m_from, m_to
+    );
+  END LOOP;
+END $$;
+
+COMMIT;